@@ -22,11 +22,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Primero, para que la latencia medida incluya el resto de middlewares.
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.CarritoMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'core.middleware.BlockedUserRestrictionMiddleware',
@@ -56,7 +59,41 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        # En archivo y no en memoria: con la caché compartida de SQLite en memoria
+        # los bloqueos fallan al momento sin esperar busy_timeout, y las pruebas
+        # con varios hilos no reproducirían el comportamiento real.
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        # BEGIN IMMEDIATE: cada transacción toma el bloqueo de escritura al
+        # empezar y espera busy_timeout si está ocupado, en lugar de fallar con
+        # "database is locked" al pasar de leer a escribir a mitad de camino.
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+    },
+    # Lecturas de las vistas de consulta (ver core.db_router). En SQLite, el
+    # mismo archivo en solo lectura; en otro motor, una réplica.
+    'lectura': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f'file:{BASE_DIR / "db.sqlite3"}?mode=ro',
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+DATABASE_ROUTERS = ['core.db_router.LecturaEscrituraRouter']
+BASE_DATOS_LECTURA = 'lectura'
+
+# PRAGMA aplicados a cada conexión SQLite nueva, por alias. journal_mode=WAL
+# queda guardado en el archivo y deja leer mientras otro escribe; solo se
+# puede fijar desde una conexión con escritura.
+SQLITE_PRAGMAS = {
+    'default': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'mmap_size': 64 * 1024 * 1024,
+    },
+    'lectura': {
+        'busy_timeout': 5000,
+        'mmap_size': 64 * 1024 * 1024,
+        'query_only': 'ON',
+    },
 }
 
 
@@ -96,6 +133,10 @@ import os
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Anchos (px) de las miniaturas de producto y procesos dedicados a generarlas (ver core.images)
+PRODUCTO_MINIATURAS_ANCHOS = (100, 200, 400)
+IMAGENES_WORKERS = 2
+
 
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
 SESSION_COOKIE_AGE = 1800  # 1800 segundos = 30 minutos | 1200segundos = 20 minutos | 900 segundos = 15 minutos
@@ -106,3 +147,55 @@ AUTH_USER_MODEL = 'core.Cliente'
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/catalogo/'
 LOGOUT_REDIRECT_URL = '/catalogo/'
+
+
+# Productos por página en el catálogo público (paginación por cursor)
+CATALOGO_PAGE_SIZE = 50
+
+# Pedidos por página en el panel de administración y en "Mis pedidos"
+PEDIDOS_PAGE_SIZE = 50
+MIS_PEDIDOS_PAGE_SIZE = 20
+
+# Clientes por página en el panel y entradas por página de su historial
+CLIENTES_PAGE_SIZE = 50
+HISTORIAL_PAGE_SIZE = 20
+
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'caicai',
+    }
+}
+
+# Segundos que vive un fragmento del catálogo; la invalidación es por versión,
+# este valor solo limita cuánto tiempo ocupan memoria las entradas antiguas.
+CATALOGO_CACHE_TIMEOUT = 600
+
+# Segundos que se guardan los conteos por categoría del catálogo (ver core.facets)
+CATALOGO_FACETAS_TIMEOUT = 60
+
+# Historial de clientes con escritura diferida (ver core.audit) y su retención
+AUDITORIA_BUFFER_SIZE = 100
+AUDITORIA_FLUSH_SECONDS = 5
+AUDITORIA_RETENCION_DIAS = 365
+
+# Segundos que el stock queda apartado para un carrito (ver core.reservations)
+RESERVA_STOCK_TTL = 900
+# Unidades de un producto que puede apartar una sola reserva
+RESERVA_STOCK_MAX_UNIDADES = 20
+
+# Almacenamiento del carrito (ver core.cart_storage): CookieCarrito, CacheCarrito o SesionCarrito
+CARRITO_BACKEND = 'core.cart_storage.CookieCarrito'
+CARRITO_COOKIE_NAME = 'carrito'
+CARRITO_COOKIE_AGE = 7 * 24 * 3600
+CARRITO_CACHE = 'default'
+
+# Límite de intentos de login (ver core.login_throttle): fallos por IP y por
+# usuario dentro de la ventana; el bloqueo se duplica en cada reincidencia.
+LOGIN_CACHE = 'default'
+LOGIN_INTENTOS_VENTANA = 300
+LOGIN_INTENTOS_POR_IP = 20
+LOGIN_INTENTOS_POR_USUARIO = 5
+LOGIN_BLOQUEO_SEGUNDOS = 60
+LOGIN_BLOQUEO_MAX_SEGUNDOS = 3600
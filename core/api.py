@@ -0,0 +1,187 @@
+"""
+API JSON de solo lectura del catálogo.
+
+* ``GET /api/productos/``: mismos filtros y orden que el catálogo (``q``,
+  ``categoria``, ``precio_min``, ``precio_max``, ``en_stock``, ``orden``; ver
+  ``core.facets``), salvo que un valor no válido responde ``400``; paginación
+  por ``cursor`` y selección de campos con ``?campos=id,nombre,precio``.
+* ``GET /api/productos/<id>/`` y ``GET /api/categorias/``.
+
+Cada respuesta lleva un ``ETag`` fuerte y ``Last-Modified`` calculados con una
+sola consulta de agregación sobre el conjunto filtrado (número de filas y
+``actualizado`` más reciente del producto y de su categoría). Si el cliente
+manda ``If-None-Match``/``If-Modified-Since`` y nada cambió, se responde
+``304`` sin leer ni serializar los productos.
+
+El ETag cambia también con los borrados (cambia el número de filas), pero
+``Last-Modified`` no puede reflejarlos: los clientes deben preferir el ETag.
+Las escrituras que no pasan por ``save()`` deben fijar ``actualizado`` a mano.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.http import Http404, JsonResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_GET
+
+from . import facets
+from .models import Categoria, Producto
+from .pagination import paginar_keyset
+
+# campo público -> (columnas que necesita, cómo se obtiene de un Producto)
+CAMPOS_PRODUCTO = {
+    'id': (['id'], lambda p: p.id),
+    'nombre': (['nombre'], lambda p: p.nombre),
+    'descripcion': (['descripcion'], lambda p: p.descripcion),
+    'precio': (['precio'], lambda p: str(p.precio)),
+    'stock': (['stock'], lambda p: p.stock),
+    'categoria': (['categoria_id'], lambda p: p.categoria_id),
+    'categoria_nombre': (['categoria__nombre'], lambda p: p.categoria.nombre),
+    'imagen': (['imagen'], lambda p: p.imagen.url if p.imagen else None),
+    'miniaturas': (['imagen', 'miniaturas'], lambda p: {
+        ancho: {formato: p.imagen.storage.url(nombre) for formato, nombre in variantes.items()}
+        for ancho, variantes in p.miniaturas.items()
+    }),
+    'actualizado': (['actualizado'], lambda p: p.actualizado.isoformat()),
+}
+CAMPOS_POR_DEFECTO = ['id', 'nombre', 'precio', 'stock', 'categoria', 'actualizado']
+LIMITE_MAXIMO = 200
+
+
+class _ParametroInvalido(ValueError):
+    pass
+
+
+def _campos(request):
+    valor = request.GET.get('campos')
+    if not valor:
+        return CAMPOS_POR_DEFECTO
+    campos = [c.strip() for c in valor.split(',') if c.strip()]
+    desconocidos = [c for c in campos if c not in CAMPOS_PRODUCTO]
+    if desconocidos:
+        raise _ParametroInvalido(f'Campos desconocidos: {", ".join(desconocidos)}.')
+    return campos
+
+
+def _limite(request):
+    try:
+        limite = int(request.GET.get('limite') or settings.CATALOGO_PAGE_SIZE)
+    except ValueError:
+        raise _ParametroInvalido('limite debe ser un entero.')
+    return max(1, min(limite, LIMITE_MAXIMO))
+
+
+def _productos_filtrados(request):
+    # Los mismos filtros y orden que el catálogo, pero un valor no válido es un 400.
+    try:
+        filtros = facets.Filtros(request.GET, estricto=True)
+    except ValueError as e:
+        raise _ParametroInvalido(str(e))
+    return filtros.aplicar(Producto.objects.all())
+
+
+def _validadores(request, queryset, categorias):
+    """
+    ``(etag, last_modified)`` del conjunto, calculados una vez por petición:
+    ``condition`` llama por separado a la función del ETag y a la de la fecha.
+    """
+    if not hasattr(request, '_api_validadores'):
+        agregado = queryset.order_by().aggregate(
+            n=Count('id'), max_id=Max('id'), ultimo=Max('actualizado'),
+            **({'ultimo_categoria': Max('categoria__actualizado')} if categorias else {}),
+        )
+        fechas = [f for f in (agregado['ultimo'], agregado.get('ultimo_categoria')) if f]
+        ultimo = max(fechas) if fechas else None
+        firma = json.dumps([request.get_full_path(), agregado['n'], agregado['max_id'],
+                            [f.isoformat() for f in fechas]])
+        request._api_validadores = (hashlib.sha256(firma.encode()).hexdigest()[:32], ultimo)
+    return request._api_validadores
+
+
+def _conjunto_productos(request):
+    try:
+        productos, _ = _productos_filtrados(request)
+    except _ParametroInvalido:
+        return None
+    return productos
+
+
+def _etag_productos(request):
+    productos = _conjunto_productos(request)
+    return _validadores(request, productos, categorias=True)[0] if productos is not None else None
+
+
+def _fecha_productos(request):
+    productos = _conjunto_productos(request)
+    return _validadores(request, productos, categorias=True)[1] if productos is not None else None
+
+
+def _respuesta(datos, status=200):
+    response = JsonResponse(datos, status=status, json_dumps_params={'ensure_ascii': False})
+    # Se puede guardar, pero hay que revalidar cada vez (barato gracias al 304).
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+@require_GET
+@condition(etag_func=_etag_productos, last_modified_func=_fecha_productos)
+def productos(request):
+    try:
+        campos = _campos(request)
+        limite = _limite(request)
+        productos, orden = _productos_filtrados(request)
+    except _ParametroInvalido as e:
+        return _respuesta({'error': str(e)}, status=400)
+
+    columnas = {'id'} | {c for campo in campos for c in CAMPOS_PRODUCTO[campo][0]}
+    if 'categoria__nombre' in columnas:
+        productos = productos.select_related('categoria')
+    productos = productos.only(*columnas)
+
+    pagina = paginar_keyset(productos, orden, request.GET.get('cursor'), limite)
+    return _respuesta({
+        'resultados': [{campo: CAMPOS_PRODUCTO[campo][1](p) for campo in campos} for p in pagina],
+        'siguiente': pagina.siguiente,
+    })
+
+
+def _etag_producto(request, id):
+    return _validadores(request, Producto.objects.filter(id=id), categorias=True)[0]
+
+
+def _fecha_producto(request, id):
+    return _validadores(request, Producto.objects.filter(id=id), categorias=True)[1]
+
+
+@require_GET
+@condition(etag_func=_etag_producto, last_modified_func=_fecha_producto)
+def producto(request, id):
+    try:
+        campos = _campos(request)
+    except _ParametroInvalido as e:
+        return _respuesta({'error': str(e)}, status=400)
+    p = Producto.objects.select_related('categoria').filter(id=id).first()
+    if p is None:
+        raise Http404('Producto no encontrado.')
+    return _respuesta({campo: CAMPOS_PRODUCTO[campo][1](p) for campo in campos})
+
+
+def _etag_categorias(request):
+    return _validadores(request, Categoria.objects.all(), categorias=False)[0]
+
+
+def _fecha_categorias(request):
+    return _validadores(request, Categoria.objects.all(), categorias=False)[1]
+
+
+@require_GET
+@condition(etag_func=_etag_categorias, last_modified_func=_fecha_categorias)
+def categorias(request):
+    return _respuesta({
+        'resultados': [
+            {'id': c.id, 'nombre': c.nombre, 'actualizado': c.actualizado.isoformat()}
+            for c in Categoria.objects.order_by('nombre')
+        ],
+    })
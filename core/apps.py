@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def _asegurar_indice_busqueda(sender, using, **kwargs):
+    # Los triggers del índice FTS se pierden si una migración reconstruye core_producto.
+    from . import search
+    search.asegurar_indice(using)
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from . import db_router, signals  # noqa: F401
+        post_migrate.connect(_asegurar_indice_busqueda, sender=self)
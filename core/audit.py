@@ -0,0 +1,89 @@
+"""
+Registro de auditoría de clientes con escritura diferida (write-behind).
+
+``registrar`` no inserta en ``HistorialCliente`` en el momento: acumula el
+evento en un buffer del proceso y lo escribe junto con otros en un único
+``bulk_create`` cuando:
+
+* el buffer llega a ``settings.AUDITORIA_BUFFER_SIZE`` eventos,
+* pasan ``settings.AUDITORIA_FLUSH_SECONDS`` segundos (hilo en segundo plano),
+* se pide ``inmediato=True`` (p. ej. acciones del admin que se muestran al instante),
+* o el proceso termina (``atexit``).
+
+Si se llama dentro de una transacción, la escritura se aplaza hasta el commit
+para que un rollback de la petición no se lleve eventos de otras. Un proceso
+que muere de forma abrupta (``kill -9``) pierde como mucho el buffer pendiente.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+
+from .models import HistorialCliente
+
+logger = logging.getLogger(__name__)
+
+_buffer = []
+_lock = threading.Lock()
+_hilo = None
+
+
+def _bucle():
+    while True:
+        time.sleep(settings.AUDITORIA_FLUSH_SECONDS)
+        try:
+            flush()
+        finally:
+            # El hilo tiene su propia conexión; no la dejamos abierta entre vueltas.
+            connection.close()
+
+
+def _asegurar_hilo():
+    global _hilo
+    if _hilo is None or not _hilo.is_alive():
+        with _lock:
+            if _hilo is None or not _hilo.is_alive():
+                _hilo = threading.Thread(target=_bucle, name='auditoria-flush', daemon=True)
+                _hilo.start()
+
+
+def registrar(nombre, correo, accion, inmediato=False):
+    evento = HistorialCliente(nombre=nombre, correo=correo or '', accion=accion, fecha=timezone.now())
+    with _lock:
+        _buffer.append(evento)
+        lleno = len(_buffer) >= settings.AUDITORIA_BUFFER_SIZE
+    _asegurar_hilo()
+    if inmediato or lleno:
+        if connection.in_atomic_block:
+            transaction.on_commit(flush)
+        else:
+            flush()
+
+
+def flush():
+    """Escribe todos los eventos pendientes; devuelve cuántos escribió."""
+    with _lock:
+        pendientes = _buffer[:]
+        _buffer.clear()
+    if not pendientes:
+        return 0
+    try:
+        HistorialCliente.objects.bulk_create(pendientes)
+    except DatabaseError:
+        logger.exception('No se pudo escribir el historial de auditoría; se reintentará.')
+        with _lock:
+            _buffer[:0] = pendientes
+        return 0
+    return len(pendientes)
+
+
+def pendientes():
+    with _lock:
+        return len(_buffer)
+
+
+atexit.register(flush)
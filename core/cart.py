@@ -0,0 +1,92 @@
+"""
+Cálculo de precios del carrito.
+
+El carrito es un ``dict`` ``{id_producto (str): cantidad}``. ``cotizar``
+resuelve todas las líneas con una sola consulta y calcula subtotales y total
+en una pasada; las líneas cuyo producto ya no existe (borrado por el admin
+mientras seguía en el carrito) se devuelven aparte en lugar de romper la vista.
+"""
+from decimal import Decimal
+
+from .models import Producto
+
+
+class CarritoCotizado:
+    def __init__(self, lineas, total, obsoletas):
+        self.lineas = lineas
+        self.total = total
+        self.obsoletas = obsoletas
+
+    @property
+    def cantidad_total(self):
+        return sum(linea['cantidad'] for linea in self.lineas)
+
+    def __bool__(self):
+        return bool(self.lineas)
+
+
+def cantidades(carrito):
+    """Normaliza el carrito a ``{id: cantidad}`` descartando claves o cantidades inválidas."""
+    resultado = {}
+    for key, cantidad in (carrito or {}).items():
+        try:
+            pid, cantidad = int(key), int(cantidad)
+        except (TypeError, ValueError):
+            continue
+        if cantidad > 0:
+            resultado[pid] = cantidad
+    return resultado
+
+
+def contar(carrito):
+    """Número de unidades del carrito, sin consultar la base de datos."""
+    return sum(cantidades(carrito).values())
+
+
+def cotizar(carrito, productos=None):
+    """
+    Devuelve un ``CarritoCotizado``. ``productos`` permite pasar un queryset
+    base, p. ej. ``Producto.objects.select_for_update()`` durante el checkout.
+    """
+    items = cantidades(carrito)
+    if productos is None:
+        productos = Producto.objects.all()
+    encontrados = productos.in_bulk(list(items)) if items else {}
+    return _cotizar(items, encontrados)
+
+
+async def acotizar(carrito):
+    """Versión async de ``cotizar``."""
+    items = cantidades(carrito)
+    encontrados = await Producto.objects.ain_bulk(list(items)) if items else {}
+    return _cotizar(items, encontrados)
+
+
+def _cotizar(items, encontrados):
+    lineas = []
+    obsoletas = []
+    total = Decimal('0')
+    for pid, cantidad in items.items():
+        producto = encontrados.get(pid)
+        if producto is None:
+            obsoletas.append(pid)
+            continue
+        subtotal = producto.precio * cantidad
+        total += subtotal
+        lineas.append({
+            'id': producto.id,
+            'nombre': producto.nombre,
+            'precio': producto.precio,
+            'cantidad': cantidad,
+            'subtotal': subtotal,
+            'producto': producto,
+        })
+    return CarritoCotizado(lineas, total, obsoletas)
+
+
+def limpiar_obsoletas(carrito, obsoletas):
+    """Quita de ``carrito`` (``request.carrito``) las líneas que ``cotizar`` marcó como obsoletas."""
+    if not obsoletas:
+        return False
+    carrito.quitar(*obsoletas)
+    return True
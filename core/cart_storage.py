@@ -0,0 +1,247 @@
+"""
+Dónde se guarda el carrito.
+
+``CarritoMiddleware`` pone en ``request.carrito`` una instancia del backend de
+``settings.CARRITO_BACKEND`` y, al final de la petición, le pide que persista
+los cambios. Las vistas solo usan esta interfaz (``lineas``, ``cantidad``,
+``fijar``, ``quitar``, ``vaciar``, ``titular``), así que cambiar de backend no
+las toca.
+
+Además de las líneas ``{id_producto (str): cantidad}``, cada carrito guarda el
+token ``titular`` de sus reservas de stock (``core.reservations``).
+
+Backends:
+
+* ``CookieCarrito`` (por defecto): cookie firmada. Añadir al carrito no
+  escribe nada en la base de datos; el carrito vive en el navegador.
+* ``CacheCarrito``: en la caché (``CARRITO_CACHE``). Los anónimos se
+  identifican con una cookie con un token aleatorio; los clientes con su id,
+  así que su carrito es el mismo en todos sus dispositivos. Al iniciar sesión
+  el carrito anónimo se fusiona con el de la cuenta.
+* ``SesionCarrito``: el comportamiento anterior, en ``request.session``
+  (reescribe la fila de ``django_session`` en cada cambio).
+
+Las vistas async llaman antes a ``await request.carrito.acargar()``; los
+backends que hacen E/S (``bloqueante = True``) cargan y guardan en un hilo.
+"""
+import secrets
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+
+def _nuevo_titular():
+    return secrets.token_hex(16)
+
+
+def _normalizar(lineas):
+    resultado = {}
+    for key, cantidad in (lineas or {}).items():
+        try:
+            key, cantidad = str(int(key)), int(cantidad)
+        except (TypeError, ValueError):
+            continue
+        if cantidad > 0:
+            resultado[key] = cantidad
+    return resultado
+
+
+class BaseCarrito:
+    bloqueante = True
+
+    def __init__(self, request):
+        self.request = request
+        self._datos = None
+        self.modificado = False
+
+    # ----- persistencia (la implementa cada backend) -----
+
+    def cargar(self):
+        """Devuelve ``{'titular': str, 'lineas': dict}`` o ``None`` si no hay carrito."""
+        raise NotImplementedError
+
+    def guardar(self, response):
+        raise NotImplementedError
+
+    # ----- interfaz común -----
+
+    @property
+    def datos(self):
+        if self._datos is None:
+            datos = self.cargar() or {}
+            self._datos = {
+                'titular': datos.get('titular') or _nuevo_titular(),
+                'lineas': _normalizar(datos.get('lineas')),
+            }
+        return self._datos
+
+    @property
+    def titular(self):
+        return self.datos['titular']
+
+    @property
+    def lineas(self):
+        return dict(self.datos['lineas'])
+
+    def cantidad(self, producto_id):
+        return self.datos['lineas'].get(str(producto_id), 0)
+
+    def fijar(self, producto_id, cantidad):
+        if cantidad > 0:
+            self.datos['lineas'][str(producto_id)] = cantidad
+        else:
+            self.datos['lineas'].pop(str(producto_id), None)
+        self.modificado = True
+
+    def quitar(self, *producto_ids):
+        for producto_id in producto_ids:
+            self.datos['lineas'].pop(str(producto_id), None)
+        self.modificado = True
+
+    def vaciar(self):
+        self.datos['lineas'] = {}
+        self.modificado = True
+
+    def fusionar(self, user):
+        """
+        Se llama al iniciar sesión. Devuelve el titular anterior si las
+        reservas deben pasar a otro titular, o ``None``.
+        """
+        return None
+
+    def cerrar_sesion(self):
+        # Como antes con la sesión: el carrito no sobrevive al logout.
+        self._datos = {'titular': _nuevo_titular(), 'lineas': {}}
+        self.modificado = True
+
+    def guardar_si_modificado(self, response):
+        if self.modificado:
+            self.guardar(response)
+            self.modificado = False
+
+    async def acargar(self):
+        if self._datos is None:
+            if self.bloqueante:
+                await sync_to_async(lambda: self.datos)()
+            else:
+                self.datos
+
+    async def aguardar_si_modificado(self, response):
+        if self.modificado:
+            if self.bloqueante:
+                await sync_to_async(self.guardar_si_modificado)(response)
+            else:
+                self.guardar_si_modificado(response)
+
+
+class SesionCarrito(BaseCarrito):
+    CLAVE_LINEAS = 'carrito'
+    CLAVE_TITULAR = 'reserva_titular'
+
+    def cargar(self):
+        session = self.request.session
+        return {'titular': session.get(self.CLAVE_TITULAR), 'lineas': session.get(self.CLAVE_LINEAS)}
+
+    def guardar(self, response):
+        # SessionMiddleware se encarga de escribir la sesión.
+        self.request.session[self.CLAVE_TITULAR] = self.datos['titular']
+        self.request.session[self.CLAVE_LINEAS] = self.datos['lineas']
+
+
+def _poner_cookie(response, valor):
+    response.set_cookie(
+        settings.CARRITO_COOKIE_NAME, valor, max_age=settings.CARRITO_COOKIE_AGE,
+        secure=settings.SESSION_COOKIE_SECURE, httponly=True, samesite='Lax',
+    )
+
+
+class CookieCarrito(BaseCarrito):
+    bloqueante = False
+    SALT = 'core.cart_storage.CookieCarrito'
+
+    @classmethod
+    def codificar(cls, datos):
+        return signing.dumps({'t': datos['titular'], 'l': datos['lineas']}, salt=cls.SALT, compress=True)
+
+    @classmethod
+    def decodificar(cls, valor):
+        try:
+            datos = signing.loads(valor, salt=cls.SALT, max_age=settings.CARRITO_COOKIE_AGE)
+        except signing.BadSignature:
+            return None
+        if not isinstance(datos, dict):
+            return None
+        return {'titular': datos.get('t'), 'lineas': datos.get('l') if isinstance(datos.get('l'), dict) else {}}
+
+    def cargar(self):
+        valor = self.request.COOKIES.get(settings.CARRITO_COOKIE_NAME)
+        return self.decodificar(valor) if valor else None
+
+    def guardar(self, response):
+        _poner_cookie(response, self.codificar(self.datos))
+
+
+class CacheCarrito(BaseCarrito):
+    def __init__(self, request):
+        super().__init__(request)
+        self.cache = caches[settings.CARRITO_CACHE]
+        self._clave = None
+        self._token_nuevo = None
+
+    def _token_anonimo(self):
+        token = self.request.COOKIES.get(settings.CARRITO_COOKIE_NAME)
+        if not token or len(token) != 32:
+            if self._token_nuevo is None:
+                self._token_nuevo = _nuevo_titular()
+            token = self._token_nuevo
+        return token
+
+    def _clave_actual(self):
+        user = getattr(self.request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return f'carrito:u:{user.pk}'
+        return f'carrito:a:{self._token_anonimo()}'
+
+    def cargar(self):
+        self._clave = self._clave_actual()
+        return self.cache.get(self._clave)
+
+    def guardar(self, response):
+        self.cache.set(self._clave, self.datos, settings.CARRITO_COOKIE_AGE)
+        if self._token_nuevo and self._clave.startswith('carrito:a:'):
+            _poner_cookie(response, self._token_nuevo)
+            self._token_nuevo = None
+
+    def fusionar(self, user):
+        # login() ya ha cambiado request.user: el carrito anónimo se busca por la cookie.
+        if self._clave and self._clave.startswith('carrito:a:'):
+            clave_anonima, anonimo = self._clave, self.datos
+        else:
+            token = self.request.COOKIES.get(settings.CARRITO_COOKIE_NAME)
+            clave_anonima = f'carrito:a:{token}' if token else None
+            anonimo = (self.cache.get(clave_anonima) if clave_anonima else None) or {}
+
+        clave_cuenta = f'carrito:u:{user.pk}'
+        cuenta = self.cache.get(clave_cuenta) or {}
+        lineas = _normalizar(cuenta.get('lineas'))
+        for key, cantidad in _normalizar(anonimo.get('lineas')).items():
+            lineas[key] = lineas.get(key, 0) + cantidad
+        self._datos = {'titular': cuenta.get('titular') or _nuevo_titular(), 'lineas': lineas}
+        self._clave = clave_cuenta
+        self.modificado = True
+        if clave_anonima:
+            self.cache.delete(clave_anonima)
+        return anonimo.get('titular') if anonimo.get('lineas') else None
+
+    def cerrar_sesion(self):
+        # El carrito del cliente se queda en su cuenta; se pasa al anónimo.
+        self._datos = None
+        self._clave = None
+        self.modificado = False
+
+
+def backend():
+    return import_string(settings.CARRITO_BACKEND)
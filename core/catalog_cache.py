@@ -0,0 +1,104 @@
+"""
+Caché de fragmentos del catálogo público con invalidación por versiones.
+
+Cada fragmento (tabla de productos, conteos por categoría) se guarda bajo
+una clave que incluye los parámetros de filtrado y el número de versión de
+los datos de los que depende:
+
+* ``catalogo:v:categorias``: la lista de categorías.
+* ``catalogo:v:productos``: cualquier producto (listados sin filtro de categoría).
+* ``catalogo:v:cat:<id>``: los productos de una categoría concreta.
+* ``catalogo:v:stock``: el stock de cualquier producto; solo dependen de ella
+  los resultados filtrados por ``en_stock`` (ver ``core.facets``).
+
+Las señales de ``core.signals`` incrementan la versión afectada al guardar o
+borrar un ``Producto``/``Categoria``; las entradas antiguas simplemente dejan de
+leerse y caducan solas, sin vaciar el resto de la caché.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+VERSION_CATEGORIAS = 'catalogo:v:categorias'
+VERSION_PRODUCTOS = 'catalogo:v:productos'
+VERSION_STOCK = 'catalogo:v:stock'
+
+# Valor que se renderiza en lugar del token CSRF dentro de un fragmento
+# compartido; la vista lo sustituye por el token de cada petición.
+CSRF_SENTINEL = '__CSRF_TOKEN__'
+
+
+def version_categoria(categoria_id):
+    return f'catalogo:v:cat:{categoria_id}'
+
+
+def versiones_productos(categoria_id=None):
+    """Claves de versión de las que depende un listado de productos."""
+    if categoria_id and str(categoria_id).isdigit():
+        return [version_categoria(int(categoria_id))]
+    return [VERSION_PRODUCTOS]
+
+
+def _version_inicial():
+    # Si la clave de versión se expulsa de la caché, el nuevo valor nunca
+    # coincide con uno anterior y no puede resucitar fragmentos obsoletos.
+    return time.time_ns() // 1000
+
+
+def _leer_versiones(claves):
+    versiones = cache.get_many(claves)
+    faltan = {clave: _version_inicial() for clave in claves if clave not in versiones}
+    if faltan:
+        cache.set_many(faltan, None)
+        versiones.update(faltan)
+    return [versiones[clave] for clave in claves]
+
+
+def incrementar(*claves):
+    for clave in claves:
+        try:
+            cache.incr(clave)
+        except ValueError:
+            cache.set(clave, _version_inicial(), None)
+
+
+async def _aleer_versiones(claves):
+    versiones = await cache.aget_many(claves)
+    faltan = {clave: _version_inicial() for clave in claves if clave not in versiones}
+    if faltan:
+        await cache.aset_many(faltan, None)
+        versiones.update(faltan)
+    return [versiones[clave] for clave in claves]
+
+
+def _clave_fragmento(nombre, params, versiones):
+    firma = json.dumps([params, versiones], sort_keys=True, default=str)
+    return f'catalogo:frag:{nombre}:' + hashlib.md5(firma.encode()).hexdigest()
+
+
+def obtener_fragmento(nombre, params, versiones, construir, timeout=None):
+    """
+    Devuelve el HTML del fragmento ``nombre`` para ``params``; si no está en
+    caché (o cambió alguna de las ``versiones``) lo genera con ``construir()``.
+    Sirve igual para cualquier otro valor serializable (p. ej. los conteos de
+    ``core.facets``). ``timeout`` por defecto es ``CATALOGO_CACHE_TIMEOUT``.
+    """
+    clave = _clave_fragmento(nombre, params, _leer_versiones(versiones))
+    html = cache.get(clave)
+    if html is None:
+        html = construir()
+        cache.set(clave, html, timeout or settings.CATALOGO_CACHE_TIMEOUT)
+    return html
+
+
+async def aobtener_fragmento(nombre, params, versiones, construir, timeout=None):
+    """Versión async de ``obtener_fragmento``; ``construir`` es una corrutina."""
+    clave = _clave_fragmento(nombre, params, await _aleer_versiones(versiones))
+    html = await cache.aget(clave)
+    if html is None:
+        html = await construir()
+        await cache.aset(clave, html, timeout or settings.CATALOGO_CACHE_TIMEOUT)
+    return html
@@ -0,0 +1,345 @@
+"""
+Importación y exportación masiva del catálogo en CSV o JSON Lines.
+
+Ambas van en streaming con memoria constante: la importación lee el archivo
+fila a fila y escribe por lotes de ``lote`` filas (un ``bulk_create`` y un
+``bulk_update`` por lote, en una transacción); la exportación recorre los
+productos con ``.iterator()``. ``aexportar`` es la versión async para ASGI,
+donde un iterador síncrono se leería entero en memoria antes de enviarlo.
+
+Formato (mismas columnas en ambos sentidos; ``exportar`` produce un archivo
+que ``importar`` acepta tal cual):
+
+* ``sku``: clave estable. Si existe se actualiza el producto; si no, se crea.
+  Los productos sin ``sku`` (creados desde el panel) se actualizan por ``id``.
+* ``nombre``, ``descripcion``, ``precio``, ``stock``, ``categoria`` (nombre;
+  se crea si no existe) e ``imagen`` (ruta relativa al directorio de imágenes).
+
+Solo se modifican las columnas presentes y con valor, así que un archivo con
+``sku,precio,stock`` actualiza precios y stock sin tocar lo demás. Para crear
+un producto hacen falta ``nombre``, ``precio`` y ``categoria``.
+
+Una fila inválida no aborta la importación: se anota en
+``ResultadoImportacion.errores`` con su número de línea y se sigue. Si la base
+de datos rechaza un lote (p. ej. un ``sku`` repetido), se reintenta fila a fila
+para que solo fallen las culpables, y se liberan las imágenes que subieron.
+"""
+import csv
+import json
+import os
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+from . import catalog_cache, images
+from .models import Categoria, Producto
+from .storage import liberar_si_huerfana
+
+FORMATOS = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson; charset=utf-8'}
+COLUMNAS = ['id', 'sku', 'nombre', 'descripcion', 'precio', 'stock', 'categoria', 'imagen']
+# Columnas que se validan con las reglas del propio campo del modelo.
+CAMPOS_MODELO = ['sku', 'nombre', 'descripcion', 'precio', 'stock']
+# Errores que se guardan con detalle; del resto solo se lleva la cuenta.
+MAX_ERRORES = 1000
+
+
+def formato_de(nombre_archivo, formato=None):
+    if formato in FORMATOS:
+        return formato
+    ext = os.path.splitext(nombre_archivo or '')[1].lower().lstrip('.')
+    return 'jsonl' if ext in ('jsonl', 'ndjson', 'json') else 'csv'
+
+
+class _FilaInvalida(ValueError):
+    pass
+
+
+class ResultadoImportacion:
+    def __init__(self):
+        self.creados = 0
+        self.actualizados = 0
+        self.fallidos = 0
+        self.errores = []  # [(linea, mensaje)]
+
+    def error(self, linea, mensaje):
+        self.fallidos += 1
+        if len(self.errores) < MAX_ERRORES:
+            self.errores.append((linea, str(mensaje)))
+
+    def __str__(self):
+        return f'{self.creados} creados, {self.actualizados} actualizados, {self.fallidos} filas con errores'
+
+
+# ----- lectura -----
+
+def leer(archivo, formato):
+    """
+    Itera ``(linea, fila)`` de un archivo de texto abierto. ``fila`` es un
+    dict, o un ``_FilaInvalida`` si la línea no se pudo leer.
+    """
+    linea = 0
+    try:
+        if formato == 'csv':
+            lector = csv.DictReader(archivo)
+            for fila in lector:
+                linea = lector.line_num
+                yield linea, fila
+        else:
+            for linea, texto in enumerate(archivo, 1):
+                if not texto.strip():
+                    continue
+                try:
+                    yield linea, json.loads(texto, parse_float=Decimal)
+                except ValueError:
+                    yield linea, _FilaInvalida('JSON inválido.')
+    except (csv.Error, UnicodeDecodeError) as e:
+        # El resto del archivo ya no se puede leer con fiabilidad.
+        yield linea + 1, _FilaInvalida(f'Archivo ilegible a partir de aquí: {e}')
+
+
+def _parsear(fila, categorias):
+    """Devuelve ``(clave, cambios)`` de una fila, o lanza ``_FilaInvalida``."""
+    if isinstance(fila, Exception):
+        raise fila
+    if not isinstance(fila, dict):
+        raise _FilaInvalida('Se esperaba un objeto con columnas.')
+    valores = {
+        str(k).strip().lower(): str(v).strip()
+        for k, v in fila.items() if k is not None and v is not None and str(v).strip()
+    }
+
+    if valores.get('sku'):
+        clave = ('sku', valores['sku'])
+    elif valores.get('id', '').isdigit():
+        clave = ('id', int(valores['id']))
+    else:
+        raise _FilaInvalida('Falta el sku (o el id de un producto existente).')
+
+    cambios = {}
+    for campo in CAMPOS_MODELO:
+        if campo in valores:
+            try:
+                cambios[campo] = Producto._meta.get_field(campo).clean(valores[campo], None)
+            except ValidationError as e:
+                raise _FilaInvalida(f'{campo}: {" ".join(e.messages)}')
+    if 'categoria' in valores:
+        nombre = valores['categoria']
+        if len(nombre) > Categoria._meta.get_field('nombre').max_length:
+            raise _FilaInvalida('categoria: nombre demasiado largo.')
+        if nombre not in categorias:
+            categorias[nombre] = Categoria.objects.get_or_create(nombre=nombre)[0].id
+        cambios['categoria_id'] = categorias[nombre]
+    if 'imagen' in valores:
+        cambios['imagen'] = valores['imagen']
+    return clave, cambios
+
+
+# ----- importación -----
+
+def importar(filas, lote=1000, imagenes=None):
+    """
+    Crea o actualiza productos a partir de ``filas`` (ver ``leer``). Si se da
+    ``imagenes`` (un directorio), la columna ``imagen`` se resuelve dentro de
+    él; si no, se ignora.
+    """
+    resultado = ResultadoImportacion()
+    categorias = dict(Categoria.objects.values_list('nombre', 'id'))
+    pendientes = {}
+    for linea, fila in filas:
+        try:
+            clave, cambios = _parsear(fila, categorias)
+        except _FilaInvalida as e:
+            resultado.error(linea, e)
+            continue
+        # Si una clave se repite dentro del lote, gana la última fila.
+        pendientes[clave] = (linea, cambios)
+        if len(pendientes) >= lote:
+            _aplicar(pendientes, imagenes, resultado)
+            pendientes = {}
+    if pendientes:
+        _aplicar(pendientes, imagenes, resultado)
+    return resultado
+
+
+def _ruta_imagen(imagenes, nombre):
+    base = os.path.realpath(imagenes)
+    ruta = os.path.realpath(os.path.join(base, nombre))
+    if os.path.commonpath([base, ruta]) != base:
+        raise _FilaInvalida(f'{nombre} está fuera del directorio de imágenes.')
+    return ruta
+
+
+def _guardar_imagen(producto, imagenes, nombre, storage):
+    """Sube la imagen (deduplicada por contenido) y devuelve el nombre anterior si cambió."""
+    with open(_ruta_imagen(imagenes, nombre), 'rb') as f:
+        nuevo = storage.save(f'productos/{os.path.basename(nombre)}', File(f))
+    anterior = producto.imagen.name if producto.imagen else None
+    if nuevo == anterior:
+        return None
+    producto.imagen = nuevo
+    producto.miniaturas = {}
+    return anterior or ''
+
+
+def _aplicar(pendientes, imagenes, resultado):
+    skus = [valor for tipo, valor in pendientes if tipo == 'sku']
+    ids = [valor for tipo, valor in pendientes if tipo == 'id']
+    existentes = {('sku', p.sku): p for p in Producto.objects.filter(sku__in=skus)}
+    existentes.update({('id', p.id): p for p in Producto.objects.filter(id__in=ids)})
+
+    storage = Producto._meta.get_field('imagen').storage
+    ahora = timezone.now()
+    nuevos, cambiados, campos = [], [], {'actualizado'}
+    categorias = set()
+    con_imagen, anteriores = [], {}
+    filas = []  # [(linea, producto, es_nuevo)]
+
+    for clave, (linea, cambios) in pendientes.items():
+        imagen = cambios.pop('imagen', None)
+        producto = existentes.get(clave)
+        if producto is None:
+            if clave[0] == 'id':
+                resultado.error(linea, f'No existe el producto con id {clave[1]}; usa un sku para crearlo.')
+                continue
+            faltan = [c for c in ('nombre', 'precio', 'categoria_id') if c not in cambios]
+            if faltan:
+                resultado.error(linea, f'Faltan columnas para crear el producto: '
+                                       f'{", ".join(c.removesuffix("_id") for c in faltan)}.')
+                continue
+            producto = Producto(**cambios)
+            nuevos.append(producto)
+        else:
+            categorias.add(producto.categoria_id)
+            for campo, valor in cambios.items():
+                setattr(producto, campo, valor)
+            campos.update(c.removesuffix('_id') for c in cambios)
+            producto.actualizado = ahora
+            cambiados.append(producto)
+        categorias.add(producto.categoria_id)
+        filas.append((linea, producto, producto.pk is None))
+
+        if imagen and imagenes:
+            try:
+                anterior = _guardar_imagen(producto, imagenes, imagen, storage)
+            except (OSError, _FilaInvalida) as e:
+                # El resto de la fila se importa igualmente.
+                resultado.error(linea, f'imagen: {e}')
+                anterior = None
+            if anterior is not None:
+                con_imagen.append((linea, producto))
+                anteriores[linea] = anterior
+                if producto.pk:
+                    campos.update(('imagen', 'miniaturas'))
+
+    if con_imagen:
+        miniaturas, errores = images.generar_lote({p.imagen.name for _, p in con_imagen}, storage)
+        for linea, producto in con_imagen:
+            producto.miniaturas = miniaturas.get(producto.imagen.name, {})
+            if producto.imagen.name in errores:
+                resultado.error(linea, f'miniaturas: {errores[producto.imagen.name]}')
+
+    try:
+        with transaction.atomic():
+            Producto.objects.bulk_create(nuevos)
+            Producto.objects.bulk_update(cambiados, sorted(campos))
+        fallidas = set()
+    except DatabaseError:
+        fallidas = _guardar_fila_a_fila(filas, sorted(campos), resultado)
+    resultado.creados += sum(1 for linea, _, es_nuevo in filas if es_nuevo and linea not in fallidas)
+    resultado.actualizados += sum(1 for linea, _, es_nuevo in filas if not es_nuevo and linea not in fallidas)
+
+    # bulk_create/bulk_update no disparan señales: se hace aquí lo que harían.
+    catalog_cache.incrementar(catalog_cache.VERSION_PRODUCTOS,
+                              *[catalog_cache.version_categoria(c) for c in categorias])
+    for linea, producto in con_imagen:
+        # La imagen que sobra: la anterior si la fila se guardó, la recién subida si no.
+        liberar_si_huerfana(producto.imagen.name if linea in fallidas else anteriores[linea])
+
+
+def _guardar_fila_a_fila(filas, campos, resultado):
+    """
+    Reintenta un lote que falló producto a producto, cada uno en su savepoint,
+    para anotar solo las filas que la base de datos rechaza (p. ej. un sku
+    repetido). Devuelve las líneas que no se guardaron.
+    """
+    fallidas = set()
+    with transaction.atomic():
+        for linea, producto, es_nuevo in filas:
+            try:
+                with transaction.atomic():
+                    if es_nuevo:
+                        # bulk_create pudo asignarle un id antes de deshacerse el lote.
+                        producto.pk = None
+                        Producto.objects.bulk_create([producto])
+                    else:
+                        Producto.objects.bulk_update([producto], campos)
+            except DatabaseError as e:
+                resultado.error(linea, f'No guardado: {e}')
+                fallidas.add(linea)
+    return fallidas
+
+
+# ----- exportación -----
+
+class _Eco:
+    """Pseudo-archivo para ``csv.writer``: devuelve la línea en vez de guardarla."""
+
+    def write(self, valor):
+        return valor
+
+
+GRUPO = 500
+
+
+def _agrupar(lineas, n=GRUPO):
+    # Menos trozos que enviar al servidor que uno por producto.
+    grupo = []
+    for linea in lineas:
+        grupo.append(linea)
+        if len(grupo) >= n:
+            yield ''.join(grupo)
+            grupo = []
+    if grupo:
+        yield ''.join(grupo)
+
+
+def _productos_exportacion():
+    return (Producto.objects.order_by('id')
+            .values_list('id', 'sku', 'nombre', 'descripcion', 'precio', 'stock', 'categoria__nombre', 'imagen'))
+
+
+def _formato(formato):
+    """``(cabecera o None, función fila -> línea)`` de ``formato``."""
+    if formato == 'csv':
+        escritor = csv.writer(_Eco())
+        return escritor.writerow(COLUMNAS), lambda fila: escritor.writerow(['' if v is None else v for v in fila])
+    return None, lambda fila: json.dumps(dict(zip(COLUMNAS, fila)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def exportar(formato='csv', chunk_size=2000):
+    """Genera el catálogo completo como trozos de texto CSV o JSON Lines."""
+    cabecera, linea = _formato(formato)
+    if cabecera:
+        yield cabecera
+    yield from _agrupar(linea(fila) for fila in _productos_exportacion().iterator(chunk_size=chunk_size))
+
+
+async def aexportar(formato='csv', chunk_size=2000):
+    """Versión async de ``exportar`` para ``StreamingHttpResponse`` bajo ASGI."""
+    cabecera, linea = _formato(formato)
+    if cabecera:
+        yield cabecera
+    # Por lotes de id y no con aiterator(): en Django 5.2 aiterator() de un
+    # values_list() ejecuta la consulta en el bucle de eventos.
+    ultimo = 0
+    while True:
+        filas = [f async for f in _productos_exportacion().filter(id__gt=ultimo)[:chunk_size]]
+        if not filas:
+            return
+        for trozo in _agrupar(linea(fila) for fila in filas):
+            yield trozo
+        ultimo = filas[-1][0]
@@ -0,0 +1,109 @@
+"""
+Confirmación de pedidos en lote.
+
+El stock del carrito ya está apartado por reservas temporales (ver
+``core.reservations``), así que el checkout no vuelve a validar todo bajo
+bloqueo: lee los precios sin bloquear, reserva solo las líneas cuya reserva
+caducó o no cubre la cantidad, y después hace una escritura corta con un
+número fijo de sentencias:
+
+1. un ``INSERT`` del ``Pedido`` ya con su total final;
+2. un ``bulk_create`` de los ``DetallePedido``;
+3. un único ``UPDATE`` condicional que descuenta el stock con ``F()`` solo en
+   las filas que aún tienen unidades suficientes (si alguna no se actualiza,
+   p. ej. porque el admin bajó el stock, se revierte todo);
+4. un ``DELETE`` de las reservas convertidas en pedido;
+5. la actualización incremental de las métricas de ventas (``core.sales``).
+
+Como el ``UPDATE`` no dispara señales, al confirmar se incrementa
+``catalog_cache.VERSION_STOCK`` para el filtro "solo con stock" del catálogo.
+"""
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Q, When
+from django.utils import timezone
+
+from . import cart, catalog_cache, reservations, sales
+from .models import DetallePedido, Pedido, Producto
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class CarritoVacio(CheckoutError):
+    pass
+
+
+class ProductosObsoletos(CheckoutError):
+    def __init__(self, ids):
+        super().__init__(ids)
+        self.ids = ids
+
+
+class StockInsuficiente(CheckoutError):
+    def __init__(self, faltantes):
+        super().__init__(faltantes)
+        # Lista de (nombre, disponible, solicitado)
+        self.faltantes = faltantes
+
+
+def _faltantes(lineas):
+    return [(l['nombre'], l['producto'].stock, l['cantidad'])
+            for l in lineas if l['producto'].stock < l['cantidad']]
+
+
+def _descontar_stock(lineas):
+    condicion = Q()
+    nuevo_stock = []
+    for linea in lineas:
+        condicion |= Q(id=linea['id'], stock__gte=linea['cantidad'])
+        nuevo_stock.append(When(id=linea['id'], then=F('stock') - linea['cantidad']))
+    return Producto.objects.filter(condicion).update(
+        stock=Case(*nuevo_stock, default=F('stock'), output_field=PositiveIntegerField()),
+        actualizado=timezone.now(),
+    )
+
+
+def procesar_pedido(cliente, carrito, titular):
+    """
+    Crea el ``Pedido`` de ``cliente`` a partir de las líneas del ``carrito``,
+    convirtiendo las reservas de ``titular`` en líneas de pedido. Lanza una
+    subclase de ``CheckoutError`` si no se puede.
+    """
+    cotizado = cart.cotizar(carrito)
+    if cotizado.obsoletas:
+        raise ProductosObsoletos(cotizado.obsoletas)
+    if not cotizado:
+        raise CarritoVacio()
+
+    apartadas = reservations.reservadas(titular)
+    sin_reserva = {l['id']: l['cantidad'] for l in cotizado.lineas
+                   if apartadas.get(l['id'], 0) < l['cantidad']}
+    faltantes = reservations.reservar(titular, sin_reserva)
+    if faltantes:
+        raise StockInsuficiente([(p.nombre, disponible, pedida) for p, disponible, pedida in faltantes])
+
+    with transaction.atomic():
+        pedido = Pedido.objects.create(
+            cliente=cliente,
+            nombre_cliente=cliente.username,
+            correo=cliente.email,
+            direccion=cliente.direccion or 'Sin dirección',
+            total=cotizado.total,
+        )
+        detalles = DetallePedido.objects.bulk_create([
+            DetallePedido(pedido=pedido, producto=l['producto'], cantidad=l['cantidad'], subtotal=l['subtotal'])
+            for l in cotizado.lineas
+        ])
+
+        if _descontar_stock(cotizado.lineas) != len(cotizado.lineas):
+            actuales = Producto.objects.in_bulk([l['id'] for l in cotizado.lineas])
+            for linea in cotizado.lineas:
+                linea['producto'] = actuales.get(linea['id'], linea['producto'])
+            raise StockInsuficiente(_faltantes(cotizado.lineas))
+
+        reservations.liberar(titular, [l['id'] for l in cotizado.lineas])
+        sales.registrar_pedido(pedido, detalles)
+        transaction.on_commit(lambda: catalog_cache.incrementar(catalog_cache.VERSION_STOCK))
+
+    return pedido
@@ -0,0 +1,93 @@
+"""
+Reparto de lecturas y escrituras entre dos conexiones.
+
+Las vistas de solo consulta (catálogo, carrito, mis pedidos, listados del
+panel) se marcan con ``@solo_lectura``; mientras se ejecutan, las lecturas de
+modelos de ``core`` van al alias ``settings.BASE_DATOS_LECTURA``. Todo lo
+demás usa ``default``:
+
+* las escrituras, siempre;
+* las lecturas dentro de un ``transaction.atomic()`` abierto en ``default``
+  (``confirmar_pedido``, ``select_for_update``...), para leer lo que la propia
+  transacción acaba de escribir;
+* las tablas de otras apps (sesiones, auth), que se leen en los middlewares.
+
+En SQLite el alias de lectura es el mismo archivo abierto con ``mode=ro``: con
+``journal_mode=WAL`` los lectores no bloquean a quien escribe ni al revés. En
+otro motor basta con apuntar el alias a una réplica; si no está definido, el
+router lo manda todo a ``default``.
+
+``SQLITE_PRAGMAS`` define, por alias, los ``PRAGMA`` que se aplican a cada
+conexión nueva (ver ``_aplicar_pragmas``).
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+
+# ContextVar y no threading.local: bajo ASGI sync_to_async copia el contexto
+# al hilo donde se hacen las consultas.
+_solo_lectura = ContextVar('solo_lectura', default=False)
+
+
+def alias_lectura():
+    alias = getattr(settings, 'BASE_DATOS_LECTURA', None)
+    return alias if alias in settings.DATABASES else DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def lectura():
+    token = _solo_lectura.set(True)
+    try:
+        yield
+    finally:
+        _solo_lectura.reset(token)
+
+
+def solo_lectura(vista):
+    """Decorador de vistas (síncronas o async) que pueden leer de la réplica."""
+    if iscoroutinefunction(vista):
+        @wraps(vista)
+        async def envoltura(*args, **kwargs):
+            with lectura():
+                return await vista(*args, **kwargs)
+    else:
+        @wraps(vista)
+        def envoltura(*args, **kwargs):
+            with lectura():
+                return vista(*args, **kwargs)
+    return envoltura
+
+
+class LecturaEscrituraRouter:
+    def db_for_read(self, model, **hints):
+        if not _solo_lectura.get() or model._meta.app_label != 'core':
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias_lectura()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Ambos alias ven los mismos datos.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+def _aplicar_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    # Directamente sobre la conexión sqlite3: no cuentan como consultas de la petición.
+    for nombre, valor in getattr(settings, 'SQLITE_PRAGMAS', {}).get(connection.alias, {}).items():
+        connection.connection.execute(f'PRAGMA {nombre} = {valor}')
+
+
+connection_created.connect(_aplicar_pragmas, dispatch_uid='core.db_router.pragmas')
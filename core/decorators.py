@@ -3,6 +3,6 @@ from django.shortcuts import redirect
 def admin_required(view_func):
     def wrapper(request, *args, **kwargs):
         if 'admin_id' not in request.session:
-            return redirect('admin_login')
+            return redirect('login_unificado')
         return view_func(request, *args, **kwargs)
     return wrapper
@@ -0,0 +1,150 @@
+"""
+Filtros y facetas del catálogo público.
+
+Además del texto (``q``) y la categoría, el catálogo se puede filtrar por
+rango de precio (``precio_min``/``precio_max``) y por productos con stock
+(``en_stock``), y ordenar por precio (``orden=precio`` o ``orden=-precio``).
+El desplegable de categorías muestra cuántos productos de cada una cumplen
+los demás filtros.
+
+Los conteos salen de un ``GROUP BY categoria_id`` sobre los productos
+filtrados y se guardan en la caché del catálogo (``core.catalog_cache``) con
+las mismas versiones que los listados: cualquier alta, edición o borrado de
+productos o categorías los invalida. El checkout descuenta stock con
+``update()``, sin señales, e incrementa ``VERSION_STOCK``, de la que dependen
+solo los resultados filtrados por ``en_stock``. Las entradas caducan a los
+``CATALOGO_FACETAS_TIMEOUT`` segundos: con búsquedas de texto hay muchas
+combinaciones que apenas se repiten.
+
+Los índices ``(categoria, precio)`` y ``(stock)`` de ``Producto`` cubren los
+conteos, los rangos de precio y el orden por precio dentro de una categoría.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Count
+from django.http import QueryDict
+
+from . import catalog_cache
+from .models import Categoria, Producto
+from .search import buscar_productos
+
+ORDENES = {
+    'precio': ('precio', 'id'),
+    '-precio': ('-precio', '-id'),
+}
+_VERDADERO = {'1', 'on', 'true'}
+_FALSO = {'', '0', 'off', 'false'}
+
+
+def precio(valor):
+    """``Decimal`` no negativo a partir de ``valor``; ``ValueError`` si no lo es."""
+    try:
+        resultado = Decimal(valor.strip().replace(',', '.'))
+    except (InvalidOperation, AttributeError):
+        raise ValueError(f'Precio no válido: {valor!r}.')
+    if not resultado.is_finite() or resultado < 0:
+        raise ValueError(f'Precio no válido: {valor!r}.')
+    return resultado
+
+
+def filtrar(productos, precio_min=None, precio_max=None, en_stock=False):
+    if precio_min is not None:
+        productos = productos.filter(precio__gte=precio_min)
+    if precio_max is not None:
+        productos = productos.filter(precio__lte=precio_max)
+    if en_stock:
+        productos = productos.filter(stock__gt=0)
+    return productos
+
+
+class Filtros:
+    """
+    Filtros del catálogo de una petición. Los valores no válidos se ignoran,
+    salvo con ``estricto=True`` (la API), que lanza ``ValueError``.
+    """
+
+    def __init__(self, datos, estricto=False):
+        self.estricto = estricto
+        self.query = (datos.get('q') or '').strip()
+        categoria_id = datos.get('categoria') or ''
+        if not categoria_id.isdigit():
+            categoria_id = self._invalido(categoria_id, 'categoria debe ser un id.')
+        self.categoria_id = categoria_id
+        self.precio_min = self._precio(datos.get('precio_min'))
+        self.precio_max = self._precio(datos.get('precio_max'))
+        en_stock = (datos.get('en_stock') or '').lower()
+        if en_stock not in _VERDADERO | _FALSO:
+            self._invalido(en_stock, 'en_stock debe ser 1/0, true/false u on/off.')
+        self.en_stock = en_stock in _VERDADERO
+        orden = datos.get('orden') or ''
+        if orden not in ORDENES:
+            orden = self._invalido(orden, f'orden debe ser uno de: {", ".join(ORDENES)}.')
+        self.orden = orden
+
+    def _invalido(self, valor, mensaje):
+        """Valor vacío en lugar de ``valor``; en modo estricto, ``ValueError`` si no estaba vacío."""
+        if valor and self.estricto:
+            raise ValueError(mensaje)
+        return ''
+
+    def _precio(self, valor):
+        try:
+            return precio(valor) if valor else None
+        except ValueError:
+            if self.estricto:
+                raise
+            return None
+
+    def params_facetas(self):
+        # Todo menos la categoría y el orden: lo que determina los conteos.
+        return [self.query, self.precio_min, self.precio_max, self.en_stock]
+
+    def params(self):
+        return [*self.params_facetas(), self.categoria_id, self.orden]
+
+    def versiones(self):
+        """Versiones de caché de las que depende la tabla de productos."""
+        versiones = catalog_cache.versiones_productos(self.categoria_id)
+        return versiones + [catalog_cache.VERSION_STOCK] if self.en_stock else versiones
+
+    def versiones_facetas(self):
+        versiones = [catalog_cache.VERSION_CATEGORIAS, catalog_cache.VERSION_PRODUCTOS]
+        return versiones + [catalog_cache.VERSION_STOCK] if self.en_stock else versiones
+
+    def querydict(self):
+        """Solo los filtros reconocidos, para los enlaces de paginación."""
+        filtros = QueryDict(mutable=True)
+        for clave, valor in [('q', self.query), ('categoria', self.categoria_id), ('precio_min', self.precio_min),
+                             ('precio_max', self.precio_max), ('en_stock', '1' if self.en_stock else ''),
+                             ('orden', self.orden)]:
+            if valor not in ('', None):
+                filtros[clave] = str(valor)
+        return filtros
+
+    def aplicar(self, productos, categoria=True):
+        """
+        Filtra ``productos`` y devuelve ``(queryset, orden)``. Con ``q`` usa
+        ``buscar_productos``: quien llame desde una vista async debe haber
+        esperado antes a ``search.aindice_disponible``.
+        """
+        orden = ('id',)
+        if categoria and self.categoria_id:
+            productos = productos.filter(categoria_id=self.categoria_id)
+        productos = filtrar(productos, self.precio_min, self.precio_max, self.en_stock)
+        if self.query:
+            productos = buscar_productos(productos, self.query)
+            orden = ('relevancia', 'id')
+        return productos, ORDENES.get(self.orden, orden)
+
+
+async def aconteos(filtros):
+    """
+    ``[(id, nombre, productos)]`` de todas las categorías, contando los
+    productos que cumplen ``filtros`` salvo el de categoría.
+    """
+    productos, _ = filtros.aplicar(Producto.objects.all(), categoria=False)
+    por_categoria = {
+        categoria_id: n
+        async for categoria_id, n in productos.order_by().values_list('categoria_id').annotate(n=Count('id'))
+    }
+    return [(c.id, c.nombre, por_categoria.get(c.id, 0)) async for c in Categoria.objects.all()]
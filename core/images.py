@@ -0,0 +1,115 @@
+"""
+Miniaturas y variantes WebP de las imágenes de producto.
+
+Por cada ancho de ``settings.PRODUCTO_MINIATURAS_ANCHOS`` se genera, junto al
+original, una copia reducida en el formato original (JPEG o PNG) y otra en
+WebP::
+
+    productos/foto.jpg -> productos/foto.100w.jpg, productos/foto.100w.webp, ...
+
+El trabajo de Pillow se hace en un pool de procesos (``IMAGENES_WORKERS``) para
+no ocupar el intérprete del servidor con el redimensionado. Los nombres
+generados se guardan en ``Producto.miniaturas`` y las plantillas los usan para
+``srcset`` mediante ``Producto.srcset_webp``/``srcset_src``.
+
+Requiere un almacenamiento en disco local (con ``path()``), como el de MEDIA_ROOT.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+CALIDAD = 82
+
+_pool = None
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # 'spawn' evita heredar hilos y conexiones a la base de datos del servidor.
+        _pool = ProcessPoolExecutor(max_workers=settings.IMAGENES_WORKERS,
+                                    mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def _generar_variante(origen, destino_src, destino_webp, ancho, calidad):
+    # Se ejecuta en el proceso hijo: solo Pillow y rutas absolutas, nada de Django.
+    from PIL import Image, ImageOps
+
+    with Image.open(origen) as img:
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((ancho, ancho * 10), Image.LANCZOS)
+        if destino_src.endswith('.png'):
+            img.save(destino_src, 'PNG', optimize=True)
+        else:
+            img.convert('RGB').save(destino_src, 'JPEG', quality=calidad, optimize=True, progressive=True)
+        img.save(destino_webp, 'WEBP', quality=calidad, method=4)
+
+
+def nombres_variantes(nombre, ancho):
+    base, ext = os.path.splitext(nombre)
+    ext = '.png' if ext.lower() == '.png' else '.jpg'
+    return f'{base}.{ancho}w{ext}', f'{base}.{ancho}w.webp'
+
+
+def _tareas(nombre, storage, forzar=False):
+    origen = storage.path(nombre)
+    for ancho in settings.PRODUCTO_MINIATURAS_ANCHOS:
+        src, webp = nombres_variantes(nombre, ancho)
+        # Con nombres por contenido, una variante existente ya es la correcta.
+        pendiente = forzar or not (storage.exists(src) and storage.exists(webp))
+        args = (origen, storage.path(src), storage.path(webp), ancho, CALIDAD) if pendiente else None
+        yield ancho, src, webp, args
+
+
+def generar_miniaturas(nombre, storage=default_storage, forzar=False):
+    """
+    Genera todas las variantes de la imagen ``nombre`` (ruta relativa a
+    MEDIA_ROOT) y devuelve el diccionario para ``Producto.miniaturas``.
+    """
+    futuros = [(ancho, src, webp, _get_pool().submit(_generar_variante, *args) if args else None)
+               for ancho, src, webp, args in _tareas(nombre, storage, forzar)]
+    miniaturas = {}
+    for ancho, src, webp, futuro in futuros:
+        if futuro:
+            futuro.result()
+        miniaturas[str(ancho)] = {'src': src, 'webp': webp}
+    return miniaturas
+
+
+def generar_lote(nombres, storage=default_storage, forzar=False):
+    """
+    Como ``generar_miniaturas`` pero para muchas imágenes a la vez, repartiendo
+    todas las variantes entre los procesos del pool. Devuelve
+    ``{nombre: miniaturas}`` y ``{nombre: error}``.
+    """
+    futuros = []
+    for nombre in nombres:
+        for ancho, src, webp, args in _tareas(nombre, storage, forzar):
+            futuro = _get_pool().submit(_generar_variante, *args) if args else None
+            futuros.append((nombre, ancho, src, webp, futuro))
+
+    resultados, errores = {}, {}
+    for nombre, ancho, src, webp, futuro in futuros:
+        try:
+            if futuro:
+                futuro.result()
+        except Exception as e:
+            errores[nombre] = e
+            continue
+        resultados.setdefault(nombre, {})[str(ancho)] = {'src': src, 'webp': webp}
+    for nombre in errores:
+        resultados.pop(nombre, None)
+    return resultados, errores
+
+
+def actualizar_miniaturas(producto):
+    """Regenera las variantes de ``producto.imagen`` y las guarda en el modelo."""
+    if producto.imagen:
+        producto.miniaturas = generar_miniaturas(producto.imagen.name, producto.imagen.storage)
+    else:
+        producto.miniaturas = {}
+    producto.save(update_fields=['miniaturas', 'actualizado'])
@@ -0,0 +1,102 @@
+"""
+Límite de intentos de inicio de sesión.
+
+Cada intento fallido de ``login_unificado`` cuesta al menos una derivación
+PBKDF2; una ráfaga de credenciales robadas puede ocupar los workers solo en
+eso. Aquí se cuentan los fallos por IP y por nombre de usuario con una
+ventana deslizante en la caché ``LOGIN_CACHE`` y, al pasar del límite, se
+bloquea esa IP o ese usuario durante ``LOGIN_BLOQUEO_SEGUNDOS``. Cada bloqueo
+sucesivo dura el doble, hasta ``LOGIN_BLOQUEO_MAX_SEGUNDOS``.
+
+La vista llama a ``espera`` antes de ``authenticate()``: un intento bloqueado
+se rechaza con una lectura de caché, sin calcular ningún hash.
+
+La ventana deslizante se aproxima con dos contadores de ventana fija (la
+actual y la anterior, esta ponderada por la parte que aún cae dentro de la
+ventana), así que cada comprobación son unas pocas claves y no una lista de
+marcas de tiempo.
+
+Con ``LocMemCache`` cada proceso cuenta por su cuenta; con varios workers
+conviene una caché compartida (Redis, Memcached o la de base de datos).
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+# Los niveles de bloqueo se olvidan tras un día sin fallos.
+DURACION_NIVEL = 24 * 3600
+
+
+def _cache():
+    return caches[settings.LOGIN_CACHE]
+
+
+def _ip(request):
+    # Sin proxy de confianza configurado, X-Forwarded-For lo elige el atacante.
+    return request.META.get('REMOTE_ADDR') or 'desconocida'
+
+
+def _clave_usuario(username):
+    return 'login:usuario:' + hashlib.sha256(username.strip().lower().encode()).hexdigest()[:32]
+
+
+def _claves(request, username):
+    """``[(prefijo, límite)]`` de los contadores que afectan a este intento."""
+    return [
+        (f'login:ip:{_ip(request)}', settings.LOGIN_INTENTOS_POR_IP),
+        (_clave_usuario(username), settings.LOGIN_INTENTOS_POR_USUARIO),
+    ]
+
+
+def espera(request, username):
+    """Segundos que faltan para poder volver a intentarlo (0 si no hay bloqueo)."""
+    ahora = time.time()
+    hasta = _cache().get_many([f'{prefijo}:bloqueo' for prefijo, _ in _claves(request, username)])
+    return max([0, *(h - ahora for h in hasta.values())])
+
+
+def _contar(cache, prefijo, ahora):
+    ventana = settings.LOGIN_INTENTOS_VENTANA
+    actual = int(ahora // ventana)
+    clave = f'{prefijo}:{actual}'
+    # add + incr es atómico en las cachés compartidas; get + set no.
+    cache.add(clave, 0, 2 * ventana)
+    try:
+        intentos = cache.incr(clave)
+    except ValueError:
+        # La clave caducó entre add e incr.
+        cache.set(clave, 1, 2 * ventana)
+        intentos = 1
+    anterior = cache.get(f'{prefijo}:{actual - 1}', 0)
+    transcurrido = (ahora % ventana) / ventana
+    return intentos + anterior * (1 - transcurrido)
+
+
+def registrar_fallo(request, username):
+    """Cuenta un intento fallido y bloquea la IP o el usuario que pase del límite."""
+    cache = _cache()
+    ahora = time.time()
+    for prefijo, limite in _claves(request, username):
+        if _contar(cache, prefijo, ahora) < limite:
+            continue
+        cache.add(f'{prefijo}:nivel', 0, DURACION_NIVEL)
+        try:
+            nivel = cache.incr(f'{prefijo}:nivel')
+        except ValueError:
+            nivel = 1
+        cache.touch(f'{prefijo}:nivel', DURACION_NIVEL)
+        duracion = min(settings.LOGIN_BLOQUEO_SEGUNDOS * 2 ** (nivel - 1), settings.LOGIN_BLOQUEO_MAX_SEGUNDOS)
+        cache.set(f'{prefijo}:bloqueo', ahora + duracion, duracion)
+
+
+def registrar_exito(request, username):
+    """
+    Tras un login correcto se olvidan los fallos del usuario. Los de la IP se
+    mantienen: una cuenta válida no debe servir para seguir probando otras.
+    """
+    ventana = settings.LOGIN_INTENTOS_VENTANA
+    actual = int(time.time() // ventana)
+    prefijo = _clave_usuario(username)
+    _cache().delete_many([f'{prefijo}:{actual}', f'{prefijo}:{actual - 1}', f'{prefijo}:nivel'])
@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import Cliente, Pedido
+
+
+class Command(BaseCommand):
+    help = ('Rellena Pedido.cliente a partir de nombre_cliente en lotes pequeños; si el correo '
+            'es de otro cliente, el pedido se deja sin asignar. '
+            'La migración 0018 ya lo hace una vez; sirve para repetirlo con pausas. '
+            'Se puede interrumpir y volver a lanzar: solo procesa pedidos sin cliente.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help='Pedidos actualizados por transacción.')
+        parser.add_argument('--desde-id', type=int, default=0, help='Empieza después de este id de pedido.')
+        parser.add_argument('--pausa', type=float, default=0.0,
+                            help='Segundos de espera entre lotes para dejar paso a otras escrituras.')
+
+    def handle(self, *args, **options):
+        ultimo_id = options['desde_id']
+        asignados = sin_cliente = 0
+        while True:
+            pedidos = list(Pedido.objects.filter(cliente__isnull=True, id__gt=ultimo_id)
+                           .order_by('id').only('id', 'nombre_cliente', 'correo')[:options['lote']])
+            if not pedidos:
+                break
+
+            usernames = {p.nombre_cliente for p in pedidos}
+            correos = {p.correo for p in pedidos}
+            por_usuario = dict(Cliente.objects.filter(username__in=usernames).values_list('username', 'id'))
+            por_correo = dict(Cliente.objects.filter(email__in=correos - {''}).values_list('email', 'id'))
+
+            actualizar = []
+            for p in pedidos:
+                # Se asigna por username; el correo solo confirma. Si es el de otro
+                # cliente, el pedido es ambiguo y se queda sin asignar.
+                p.cliente_id = por_usuario.get(p.nombre_cliente)
+                if por_correo.get(p.correo, p.cliente_id) != p.cliente_id:
+                    p.cliente_id = None
+                if p.cliente_id:
+                    actualizar.append(p)
+            with transaction.atomic():
+                Pedido.objects.bulk_update(actualizar, ['cliente'])
+
+            asignados += len(actualizar)
+            sin_cliente += len(pedidos) - len(actualizar)
+            ultimo_id = pedidos[-1].id
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  ... hasta id {ultimo_id}')
+            if options['pausa']:
+                time.sleep(options['pausa'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{asignados} pedidos asignados, {sin_cliente} sin cliente coincidente (último id: {ultimo_id}).'
+        ))
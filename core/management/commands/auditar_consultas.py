@@ -0,0 +1,193 @@
+import hashlib
+import io
+import json
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_databases, teardown_databases
+from django.urls import URLPattern, reverse
+
+from core import urls
+from core.models import AdminUser, Categoria, Cliente, Pedido, Producto
+
+BASELINE = Path(__file__).resolve().parents[2] / 'auditoria_consultas.json'
+
+# Rutas que no se piden con GET: cerrarían la sesión del cliente de la auditoría.
+EXCLUIDAS = {'logout_unificado'}
+
+# (ruta, qué id necesita, datos del POST). Las escrituras se hacen después de
+# los GET y en este orden: primero se llena el carrito y luego se confirma.
+ESCENARIOS_POST = [
+    ('agregar_al_carrito', 'producto', {}),
+    ('eliminar_del_carrito', 'producto', {}),
+    ('agregar_al_carrito', 'producto', {}),
+    ('confirmar_pedido', None, {}),
+    ('editar_perfil', None, {'correo': 'auditoria@example.com', 'direccion': 'Calle 1', 'telefono': '600000000'}),
+    ('pedido_detalle', 'pedido', {'estado': 'en_proceso'}),
+]
+# Se hacen con un cliente HTTP anónimo aparte para no tocar la sesión principal.
+ESCENARIOS_ANONIMOS = [
+    ('login_unificado', {'username': 'auditoria', 'password': 'incorrecta'}),
+    ('registro_cliente', {'username': 'auditoria_nuevo', 'password': 'Auditoria123!', 'correo': 'nuevo@example.com',
+                          'direccion': '', 'telefono': ''}),
+]
+
+_ESCANEO = re.compile(r'^SCAN (?P<tabla>\w+)(?: AS \w+)?$')
+_TABLA = re.compile(r'\bFROM "?(\w+)"?', re.IGNORECASE)
+_EXPLICABLE = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+_TEXTO = re.compile(r"'(?:[^']|'')*'")
+_NUMERO = re.compile(r'(?<![\w."])-?\d+(?:\.\d+)?\b')
+_LISTA = re.compile(r'\(\?(?:, \?)*\)')
+_ESPACIOS = re.compile(r'\s+')
+
+
+def huella(sql):
+    """
+    Resumen corto de ``sql`` sin literales: la misma consulta con otros valores
+    (ids, fechas, listas ``IN`` de cualquier longitud) da la misma huella.
+    """
+    normalizada = _NUMERO.sub('?', _TEXTO.sub('?', sql))
+    normalizada = _ESPACIOS.sub(' ', _LISTA.sub('(?)', normalizada)).strip()
+    return hashlib.sha1(normalizada.encode()).hexdigest()[:12]
+
+
+def _hallazgos(sql):
+    """
+    Líneas del plan de ``sql`` que son un recorrido completo o un ordenado en
+    temporal, con la tabla y la huella de la consulta: una consulta nueva que
+    recorre la misma tabla no queda tapada por otra ya aceptada.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        detalles = [fila[-1] for fila in cursor.fetchall()]
+    tabla = _TABLA.search(sql)
+    tabla = tabla.group(1) if tabla else '?'
+    return [f'{detalle} [{tabla}] {huella(sql)}'
+            for detalle in detalles if _ESCANEO.match(detalle) or 'TEMP B-TREE' in detalle]
+
+
+class Command(BaseCommand):
+    help = ('Pide todas las rutas de core.urls con el cliente de pruebas sobre una base de datos temporal con datos '
+            'sintéticos, ejecuta EXPLAIN QUERY PLAN sobre cada consulta y avisa de los recorridos completos de '
+            'tabla y de los ordenados en B-tree temporal que no estén en la línea base. Sale con error si hay '
+            'hallazgos nuevos.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--actualizar', action='store_true',
+                            help='Acepta los hallazgos actuales y reescribe la línea base.')
+        parser.add_argument('--productos', type=int, default=2000)
+        parser.add_argument('--clientes', type=int, default=300)
+        parser.add_argument('--pedidos', type=int, default=3000)
+        parser.add_argument('--historial', type=int, default=6000)
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        if connection.vendor != 'sqlite':
+            raise CommandError('La auditoría interpreta planes de SQLite (EXPLAIN QUERY PLAN).')
+
+        config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        try:
+            # Todo por default (la réplica de test es un espejo) y sin hilo de auditoría diferida.
+            with override_settings(BASE_DATOS_LECTURA=None, AUDITORIA_FLUSH_SECONDS=3600,
+                                   ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                self._sembrar(options)
+                por_vista = self._recorrer()
+        finally:
+            teardown_databases(config, verbosity=0)
+
+        actuales = {vista: sorted(set(h)) for vista, h in sorted(por_vista.items()) if h}
+        if options['actualizar']:
+            BASELINE.write_text(json.dumps(actuales, indent=2, ensure_ascii=False) + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Línea base actualizada: {BASELINE.name}'))
+            return
+
+        aceptados = json.loads(BASELINE.read_text()) if BASELINE.exists() else {}
+        nuevos = 0
+        for vista, hallazgos in por_vista.items():
+            conocidos = set(aceptados.get(vista, []))
+            pendientes = {h: sql for h, sql in hallazgos.items() if h not in conocidos}
+            if not pendientes:
+                continue
+            self.stdout.write(self.style.WARNING(vista))
+            for hallazgo, sql in pendientes.items():
+                self.stdout.write(f'  {hallazgo}')
+                self.stdout.write(f'    {sql[:300]}')
+            nuevos += len(pendientes)
+
+        if nuevos:
+            raise CommandError(f'{nuevos} consultas nuevas con recorridos completos u ordenados temporales. '
+                               'Añade el índice que falta o acéptalas con --actualizar.')
+        self.stdout.write(self.style.SUCCESS('Sin recorridos completos nuevos.'))
+
+    # ----- preparación -----
+
+    def _sembrar(self, options):
+        call_command('generar_datos', categorias=20, productos=options['productos'], clientes=options['clientes'],
+                     pedidos=options['pedidos'], historial=options['historial'], prefijo='aud', semilla=1,
+                     stdout=self.stderr if self.verbosity > 1 else io.StringIO())
+        cache.clear()
+        admin = AdminUser(username='auditoria_admin')
+        admin.set_password('auditoria')
+        admin.save()
+
+        self.cliente = Cliente.objects.filter(bloqueado=False).order_by('id').first()
+        self.ids = {
+            'categoria': Categoria.objects.order_by('id').values_list('id', flat=True).first(),
+            'producto': Producto.objects.filter(stock__gt=5).order_by('id').values_list('id', flat=True).first(),
+            'pedido': Pedido.objects.order_by('id').values_list('id', flat=True).first(),
+            'cliente': self.cliente.id,
+        }
+        # Un mismo navegador con sesión de cliente y de administrador: así se ven todas las rutas.
+        self.http = Client()
+        self.http.force_login(self.cliente)
+        session = self.http.session
+        session['admin_id'] = admin.id
+        session.save()
+
+    def _id_para(self, nombre):
+        for clave in ('categoria', 'pedido', 'cliente', 'producto'):
+            if clave in nombre:
+                return self.ids[clave]
+        return self.ids['producto']  # carrito/agregar/<id>, carrito/eliminar/<id>
+
+    def _url(self, nombre, patron):
+        kwargs = {arg: self._id_para(nombre) for arg in patron.pattern.converters}
+        return reverse(nombre, kwargs=kwargs)
+
+    # ----- recorrido -----
+
+    def _medir(self, por_vista, vista, peticion):
+        with CaptureQueriesContext(connection) as capturadas:
+            response = peticion()
+            if response.streaming:
+                b''.join(response.streaming_content)
+        consultas = [q['sql'] for q in capturadas.captured_queries]
+        hallazgos = por_vista.setdefault(vista, {})
+        for sql in consultas:
+            if sql.lstrip().upper().startswith(_EXPLICABLE):
+                for hallazgo in _hallazgos(sql):
+                    hallazgos.setdefault(hallazgo, sql)
+        if self.verbosity > 1:
+            self.stdout.write(f'{vista}: {response.status_code}, {len(consultas)} consultas')
+
+    def _recorrer(self):
+        por_vista = {}
+        patrones = {p.name: p for p in urls.urlpatterns if isinstance(p, URLPattern) and p.name}
+
+        for nombre, patron in patrones.items():
+            if nombre not in EXCLUIDAS:
+                self._medir(por_vista, nombre, lambda: self.http.get(self._url(nombre, patron)))
+
+        for nombre, necesita, datos in ESCENARIOS_POST:
+            url = reverse(nombre, kwargs={'id': self.ids[necesita]} if necesita else None)
+            self._medir(por_vista, f'{nombre} (POST)', lambda: self.http.post(url, datos))
+
+        for nombre, datos in ESCENARIOS_ANONIMOS:
+            self._medir(por_vista, f'{nombre} (POST)', lambda: Client().post(reverse(nombre), datos))
+        return por_vista
@@ -0,0 +1,149 @@
+import asyncio
+import io
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, round(p / 100 * (len(ordenados) - 1)))]
+
+
+def _environ(ruta):
+    partes = urlsplit(ruta)
+    return {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': partes.path, 'QUERY_STRING': partes.query, 'SCRIPT_NAME': '',
+        'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost', 'REMOTE_ADDR': '127.0.0.1',
+        'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(b''), 'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+    }
+
+
+def _scope(ruta):
+    partes = urlsplit(ruta)
+    return {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': partes.path, 'raw_path': partes.path.encode(), 'query_string': partes.query.encode(),
+        'root_path': '', 'headers': [(b'host', b'localhost')],
+        'server': ('localhost', 80), 'client': ('127.0.0.1', 50000),
+    }
+
+
+class Command(BaseCommand):
+    help = ('Compara el rendimiento de caicai.wsgi (pool de hilos, como un worker gthread) y caicai.asgi '
+            '(un solo bucle de eventos) atendiendo las mismas rutas con la misma concurrencia, en proceso.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ruta', action='append', dest='rutas',
+                            help='Ruta a pedir (repetible). Por defecto el catálogo y el carrito.')
+        parser.add_argument('--peticiones', type=int, default=500)
+        parser.add_argument('--concurrencia', type=int, default=50, help='Peticiones en vuelo a la vez.')
+        parser.add_argument('--hilos', type=int, default=4, help='Hilos del worker WSGI.')
+        parser.add_argument('--cliente-lento-ms', type=float, default=0,
+                            help='Tiempo que tarda cada cliente en recibir la respuesta (red lenta).')
+        parser.add_argument('--modo', choices=['ambos', 'wsgi', 'asgi'], default='ambos')
+
+    def handle(self, *args, **options):
+        rutas = options['rutas'] or ['/catalogo/', '/carrito/']
+        n, concurrencia = options['peticiones'], options['concurrencia']
+        lento = options['cliente_lento_ms'] / 1000
+        self.stdout.write(f'{n} peticiones, concurrencia {concurrencia}, cliente lento {lento * 1000:g} ms, '
+                          f'rutas: {", ".join(rutas)}')
+
+        if options['modo'] in ('ambos', 'wsgi'):
+            self._informe(f'WSGI ({options["hilos"]} hilos)',
+                          *self._wsgi(rutas, n, concurrencia, options['hilos'], lento))
+        if options['modo'] in ('ambos', 'asgi'):
+            self._informe('ASGI (1 bucle)', *asyncio.run(self._asgi(rutas, n, concurrencia, lento)))
+
+    def _informe(self, nombre, segundos, latencias, errores):
+        ms = [x * 1000 for x in latencias]
+        self.stdout.write(
+            f'{nombre:<18} {len(latencias) / segundos:8.1f} pet/s   '
+            f'p50 {statistics.median(ms):7.1f} ms   p95 {_percentil(ms, 95):7.1f} ms   '
+            f'p99 {_percentil(ms, 99):7.1f} ms   errores {errores}'
+        )
+
+    def _wsgi(self, rutas, n, concurrencia, hilos, lento):
+        from caicai.wsgi import application
+
+        def peticion(ruta, enviada):
+            estado = []
+            cuerpo = application(_environ(ruta), lambda status, headers, exc_info=None: estado.append(status))
+            try:
+                for _ in cuerpo:
+                    pass
+                # Un servidor WSGI escribe al socket desde el hilo de la petición:
+                # un cliente lento lo tiene ocupado hasta que termina de leer.
+                time.sleep(lento)
+            finally:
+                if hasattr(cuerpo, 'close'):
+                    cuerpo.close()
+            return time.perf_counter() - enviada, int(estado[0].split()[0]) >= 500
+
+        # El cliente mantiene ``concurrencia`` peticiones en vuelo; las que no
+        # tienen hilo libre esperan en la cola del worker, como en gunicorn.
+        en_vuelo = threading.Semaphore(concurrencia)
+        latencias, errores = [], 0
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=hilos) as pool:
+            futuros = []
+            for i in range(n):
+                en_vuelo.acquire()
+                futuro = pool.submit(peticion, rutas[i % len(rutas)], time.perf_counter())
+                futuro.add_done_callback(lambda _: en_vuelo.release())
+                futuros.append(futuro)
+            for futuro in futuros:
+                latencia, error = futuro.result()
+                latencias.append(latencia)
+                errores += error
+        return time.perf_counter() - inicio, latencias, errores
+
+    async def _asgi(self, rutas, n, concurrencia, lento):
+        from caicai.asgi import application
+
+        async def peticion(ruta):
+            terminado = asyncio.Event()
+            recibido = False
+            estado = []
+
+            async def receive():
+                nonlocal recibido
+                if not recibido:
+                    recibido = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await terminado.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(mensaje):
+                if mensaje['type'] == 'http.response.start':
+                    estado.append(mensaje['status'])
+                elif not mensaje.get('more_body'):
+                    # Bajo ASGI la espera al cliente no bloquea ningún hilo.
+                    await asyncio.sleep(lento)
+                    terminado.set()
+
+            enviada = time.perf_counter()
+            await application(_scope(ruta), receive, send)
+            return time.perf_counter() - enviada, estado[0] >= 500
+
+        pendientes = iter(range(n))
+        latencias, errores = [], 0
+
+        async def cliente():
+            nonlocal errores
+            for i in pendientes:
+                latencia, error = await peticion(rutas[i % len(rutas)])
+                latencias.append(latencia)
+                errores += error
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(cliente() for _ in range(concurrencia)))
+        return time.perf_counter() - inicio, latencias, errores
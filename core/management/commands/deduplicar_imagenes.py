@@ -0,0 +1,43 @@
+import os
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import Producto
+from core.storage import es_nombre_por_contenido, liberar_si_huerfana
+
+
+def _uso_disco(ruta):
+    return sum(os.path.getsize(os.path.join(raiz, f)) for raiz, _, archivos in os.walk(ruta) for f in archivos)
+
+
+class Command(BaseCommand):
+    help = ('Mueve las imágenes de producto subidas antes del almacenamiento por contenido '
+            'a su blob deduplicado y borra las copias que quedan sin uso.')
+
+    def handle(self, *args, **options):
+        storage = Producto._meta.get_field('imagen').storage
+        nombres = (Producto.objects.exclude(imagen='').exclude(imagen__isnull=True)
+                   .values_list('imagen', flat=True).distinct().order_by('imagen'))
+        antes = _uso_disco(storage.location)
+
+        movidas = 0
+        for nombre in nombres.iterator():
+            if es_nombre_por_contenido(nombre):
+                continue
+            if not storage.exists(nombre):
+                self.stderr.write(f'{nombre}: no existe en disco, se omite.')
+                continue
+            with storage.open(nombre) as f:
+                nuevo = storage.save(nombre, File(f))
+            # update() no dispara señales: las miniaturas se regeneran con generar_miniaturas.
+            Producto.objects.filter(imagen=nombre).update(imagen=nuevo, miniaturas={}, actualizado=timezone.now())
+            liberar_si_huerfana(nombre)
+            movidas += 1
+
+        liberado = antes - _uso_disco(storage.location)
+        self.stdout.write(self.style.SUCCESS(
+            f'{movidas} imágenes movidas, {liberado / 1024:.0f} KiB liberados. '
+            'Ejecuta generar_miniaturas para regenerar las variantes.'
+        ))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from core import catalog_io
+
+
+class Command(BaseCommand):
+    help = 'Exporta el catálogo completo en CSV o JSON Lines, en streaming (lo que importar_productos acepta).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--formato', choices=sorted(catalog_io.FORMATOS), default='csv')
+        parser.add_argument('--salida', metavar='RUTA', help='Archivo de salida. Por defecto, la salida estándar.')
+
+    def handle(self, *args, **options):
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8', newline='') as salida:
+                salida.writelines(catalog_io.exportar(options['formato']))
+        else:
+            for trozo in catalog_io.exportar(options['formato']):
+                self.stdout.write(trozo, ending='')
@@ -0,0 +1,223 @@
+import argparse
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from core import catalog_cache, sales
+from core.models import Categoria, Cliente, DetallePedido, HistorialCliente, Pedido, Producto
+
+ADJETIVOS = ['Clásico', 'Premium', 'Eco', 'Mini', 'Pro', 'Deluxe', 'Básico', 'Artesanal', 'Urbano', 'Infantil']
+SUSTANTIVOS = ['Taza', 'Camiseta', 'Mochila', 'Lámpara', 'Cuaderno', 'Reloj', 'Bolso', 'Gorra', 'Vela', 'Cojín',
+               'Botella', 'Auriculares', 'Funda', 'Libreta', 'Maceta', 'Bufanda', 'Cartera', 'Peluche']
+COLORES = ['rojo', 'azul', 'verde', 'negro', 'blanco', 'gris', 'amarillo', 'rosa', 'morado', 'naranja']
+CIUDADES = ['Madrid', 'Sevilla', 'Valencia', 'Bilbao', 'Zaragoza', 'Málaga', 'Lima', 'Quito', 'Bogotá', 'Santiago']
+
+# Reparto de estados: la mayoría de pedidos antiguos ya están cerrados.
+ESTADOS = [('finalizado', 70), ('en_proceso', 20), ('pendiente', 10)]
+ACCIONES = [('login', 80), ('perfil_editado', 5), ('pedido_confirmado', 15)]
+
+
+def _pesos_zipf(n, s):
+    """Pesos acumulados de una Zipf(s) sobre ``n`` elementos para ``random.choices``."""
+    return list(accumulate(1 / (rango ** s) for rango in range(1, n + 1)))
+
+
+@contextmanager
+def _sin_auto_now_add(modelo, campo):
+    # Pedido.fecha es auto_now_add; para repartir pedidos en el tiempo hay que
+    # dejar pasar el valor generado.
+    field = modelo._meta.get_field(campo)
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def _hasta(valor):
+    try:
+        fecha = parse_date(valor)
+    except ValueError:
+        fecha = None
+    if fecha is None:
+        raise argparse.ArgumentTypeError(f'Fecha no válida: {valor!r} (usa AAAA-MM-DD).')
+    # Fin del día indicado, incluido.
+    return timezone.make_aware(datetime.combine(fecha + timedelta(days=1), datetime.min.time()))
+
+
+class Command(BaseCommand):
+    help = ('Genera datos sintéticos (categorías, productos, clientes, pedidos e historial) en lotes, '
+            'con distribución sesgada y reproducible a partir de una semilla.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categorias', type=int, default=50)
+        parser.add_argument('--productos', type=int, default=10_000)
+        parser.add_argument('--clientes', type=int, default=5_000)
+        parser.add_argument('--pedidos', type=int, default=50_000)
+        parser.add_argument('--lineas-max', type=int, default=5, help='Líneas máximas por pedido.')
+        parser.add_argument('--historial', type=int, default=100_000, help='Entradas de HistorialCliente.')
+        parser.add_argument('--dias', type=int, default=365, help='Días hacia atrás que cubren pedidos e historial.')
+        parser.add_argument('--hasta', type=_hasta,
+                            help='Último día (AAAA-MM-DD) de la ventana de --dias. Por defecto, hoy: fíjalo '
+                                 'para que la misma semilla genere las mismas fechas en cada ejecución.')
+        parser.add_argument('--semilla', type=int, default=1, help='Misma semilla, mismos datos.')
+        parser.add_argument('--lote', type=int, default=5000, help='Filas por bulk_create/transacción.')
+        parser.add_argument('--prefijo', default='sint',
+                            help='Prefijo de nombres de usuario y categorías, para no chocar con datos existentes.')
+        parser.add_argument('--password', default='cliente123', help='Contraseña de todos los clientes generados.')
+        parser.add_argument('--sin-metricas', action='store_true',
+                            help='No recalcular las métricas de ventas al terminar.')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['semilla'])
+        self.verbosity = options['verbosity']
+        self.lote = options['lote']
+        self.prefijo = options['prefijo']
+        self.fin = options['hasta'] or timezone.now()
+        self.inicio = self.fin - timedelta(days=options['dias'])
+
+        if Cliente.objects.filter(username__startswith=self.prefijo).exists():
+            raise CommandError(f'Ya hay clientes con el prefijo "{self.prefijo}"; usa otro --prefijo.')
+
+        total_inicio = time.perf_counter()
+        categorias = self._medir('Categoria', self._categorias, options['categorias'])
+        productos = self._medir('Producto', self._productos, options['productos'], categorias)
+        clientes = self._medir('Cliente', self._clientes, options['clientes'], options['password'])
+        self._medir('Pedido/DetallePedido', self._pedidos, options['pedidos'], productos, clientes,
+                    options['lineas_max'])
+        self._medir('HistorialCliente', self._historial, options['historial'], clientes)
+
+        catalog_cache.incrementar(catalog_cache.VERSION_CATEGORIAS, catalog_cache.VERSION_PRODUCTOS)
+        if not options['sin_metricas']:
+            inicio = time.perf_counter()
+            sales.recalcular()
+            self.stdout.write(f'Métricas de ventas recalculadas en {time.perf_counter() - inicio:.1f} s')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Datos generados en {time.perf_counter() - total_inicio:.1f} s (semilla {options["semilla"]}).'
+        ))
+
+    # ----- utilidades -----
+
+    def _medir(self, nombre, funcion, *args):
+        inicio = time.perf_counter()
+        resultado = funcion(*args)
+        segundos = time.perf_counter() - inicio
+        filas = resultado[1] if isinstance(resultado, tuple) else len(resultado)
+        self.stdout.write(f'{nombre}: {filas} filas en {segundos:.1f} s ({filas / max(segundos, 1e-9):,.0f} filas/s)')
+        return resultado[0] if isinstance(resultado, tuple) else resultado
+
+    def _insertar(self, modelo, filas):
+        """``bulk_create`` en transacciones de ``lote`` filas; devuelve los objetos con id."""
+        creados = []
+        for i in range(0, len(filas), self.lote):
+            with transaction.atomic():
+                creados += modelo.objects.bulk_create(filas[i:i + self.lote])
+        return creados
+
+    def _fecha(self, fraccion):
+        """Fecha creciente con ``fraccion`` (0..1) y algo de ruido, dentro de la ventana."""
+        segundos = (self.fin - self.inicio).total_seconds()
+        ruido = self.rng.uniform(-0.001, 0.001)
+        return self.inicio + timedelta(seconds=segundos * min(1.0, max(0.0, fraccion + ruido)))
+
+    # ----- generadores -----
+
+    def _categorias(self, n):
+        return self._insertar(Categoria, [Categoria(nombre=f'{self.prefijo} categoría {i + 1}') for i in range(n)])
+
+    def _productos(self, n, categorias):
+        # Unas pocas categorías concentran la mayor parte del catálogo.
+        pesos = _pesos_zipf(len(categorias), 0.8)
+        rng = self.rng
+        filas = []
+        for i in range(n):
+            stock = 0 if rng.random() < 0.05 else int(rng.paretovariate(1.2) * 10)
+            filas.append(Producto(
+                nombre=f'{rng.choice(SUSTANTIVOS)} {rng.choice(ADJETIVOS)} {rng.choice(COLORES)} {i + 1}',
+                descripcion=f'{rng.choice(SUSTANTIVOS)} de estilo {rng.choice(ADJETIVOS).lower()}, '
+                            f'color {rng.choice(COLORES)}.',
+                precio=Decimal(f'{int(rng.lognormvariate(3, 0.8))}.99'),
+                stock=min(stock, 100_000),
+                categoria=rng.choices(categorias, cum_weights=pesos)[0],
+            ))
+        return self._insertar(Producto, filas)
+
+    def _clientes(self, n, password):
+        hash_ = make_password(password)  # una sola derivación para todos
+        rng = self.rng
+        return self._insertar(Cliente, [
+            Cliente(username=f'{self.prefijo}{i + 1:07d}', email=f'{self.prefijo}{i + 1}@example.com',
+                    password=hash_, direccion=f'Calle {rng.randint(1, 300)}, {rng.choice(CIUDADES)}',
+                    telefono=f'6{rng.randint(0, 99_999_999):08d}', bloqueado=rng.random() < 0.01,
+                    date_joined=self._fecha(i / max(n, 1) * 0.5))
+            for i in range(n)
+        ])
+
+    def _pedidos(self, n, productos, clientes, lineas_max):
+        rng = self.rng
+        pesos_productos = _pesos_zipf(len(productos), 1.1)  # unos pocos productos muy vendidos
+        pesos_clientes = _pesos_zipf(len(clientes), 0.9)  # clientes habituales con muchos pedidos
+        # Se barajan para que los populares no sean siempre los de id más bajo.
+        productos = rng.sample(productos, len(productos))
+        clientes = rng.sample(clientes, len(clientes))
+        estados, pesos_estados = zip(*ESTADOS)
+
+        filas = 0
+        with _sin_auto_now_add(Pedido, 'fecha'):
+            for inicio in range(0, n, self.lote):
+                pedidos, lineas = [], []
+                for i in range(inicio, min(n, inicio + self.lote)):
+                    cliente = rng.choices(clientes, cum_weights=pesos_clientes)[0]
+                    elegidos = {p.id: p for p in rng.choices(productos, cum_weights=pesos_productos,
+                                                             k=rng.randint(1, lineas_max))}
+                    detalle = []
+                    for producto in elegidos.values():
+                        cantidad = 1 if rng.random() < 0.7 else rng.randint(2, 5)
+                        detalle.append((producto.id, cantidad, producto.precio * cantidad))
+                    fraccion = i / n
+                    pedidos.append(Pedido(
+                        cliente=cliente, nombre_cliente=cliente.username, correo=cliente.email,
+                        direccion=cliente.direccion, fecha=self._fecha(fraccion),
+                        # Los pedidos recientes todavía no se han cerrado.
+                        estado=rng.choices(estados, weights=pesos_estados)[0] if fraccion < 0.97 else 'pendiente',
+                        total=sum(subtotal for _, _, subtotal in detalle),
+                    ))
+                    lineas.append(detalle)
+
+                with transaction.atomic():
+                    pedidos = Pedido.objects.bulk_create(pedidos)
+                    detalles = DetallePedido.objects.bulk_create([
+                        DetallePedido(pedido_id=pedido.id, producto_id=pid, cantidad=cantidad, subtotal=subtotal)
+                        for pedido, detalle in zip(pedidos, lineas) for pid, cantidad, subtotal in detalle
+                    ], batch_size=self.lote)
+                filas += len(pedidos) + len(detalles)
+                if self.verbosity > 1:
+                    self.stdout.write(f'  ... {inicio + len(pedidos)} pedidos')
+        return None, filas
+
+    def _historial(self, n, clientes):
+        rng = self.rng
+        pesos = _pesos_zipf(len(clientes), 0.9)
+        acciones, pesos_acciones = zip(*ACCIONES)
+        filas = 0
+        for inicio in range(0, n, self.lote):
+            lote = []
+            for i in range(inicio, min(n, inicio + self.lote)):
+                cliente = rng.choices(clientes, cum_weights=pesos)[0]
+                lote.append(HistorialCliente(nombre=cliente.username, correo=cliente.email,
+                                             accion=rng.choices(acciones, weights=pesos_acciones)[0],
+                                             fecha=self._fecha(i / n)))
+            with transaction.atomic():
+                HistorialCliente.objects.bulk_create(lote)
+            filas += len(lote)
+        return None, filas
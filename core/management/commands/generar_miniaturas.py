@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import catalog_cache, images
+from core.models import Producto
+
+
+class Command(BaseCommand):
+    help = 'Genera las miniaturas y variantes WebP de las imágenes de producto existentes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todas', action='store_true',
+                            help='Regenera también los productos que ya tienen miniaturas.')
+        parser.add_argument('--lote', type=int, default=50, help='Productos procesados por lote.')
+
+    def handle(self, *args, **options):
+        self.forzar = options['todas']
+        productos = Producto.objects.exclude(imagen='').exclude(imagen__isnull=True).only('id', 'imagen', 'miniaturas')
+        if not options['todas']:
+            productos = productos.filter(miniaturas={})
+
+        procesados = fallidos = 0
+        lote = []
+        for producto in productos.order_by('id').iterator(chunk_size=options['lote']):
+            lote.append(producto)
+            if len(lote) >= options['lote']:
+                ok, ko = self._procesar(lote)
+                procesados, fallidos = procesados + ok, fallidos + ko
+                lote = []
+        if lote:
+            ok, ko = self._procesar(lote)
+            procesados, fallidos = procesados + ok, fallidos + ko
+
+        if procesados:
+            # bulk_update no dispara señales: se invalida a mano el catálogo cacheado
+            catalog_cache.incrementar(catalog_cache.VERSION_PRODUCTOS, *[
+                catalog_cache.version_categoria(cid)
+                for cid in Producto.objects.values_list('categoria_id', flat=True).distinct()
+            ])
+        self.stdout.write(self.style.SUCCESS(f'{procesados} productos procesados, {fallidos} con errores.'))
+
+    def _procesar(self, lote):
+        storage = Producto._meta.get_field('imagen').storage
+        resultados, errores = images.generar_lote({p.imagen.name for p in lote}, storage, forzar=self.forzar)
+        for nombre, error in errores.items():
+            self.stderr.write(f'{nombre}: {error}')
+
+        actualizados = []
+        ahora = timezone.now()
+        for producto in lote:
+            if producto.imagen.name in resultados:
+                producto.miniaturas = resultados[producto.imagen.name]
+                producto.actualizado = ahora
+                actualizados.append(producto)
+        Producto.objects.bulk_update(actualizados, ['miniaturas', 'actualizado'])
+        return len(actualizados), len(lote) - len(actualizados)
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import catalog_io
+
+
+class Command(BaseCommand):
+    help = ('Importa productos desde un CSV o JSON Lines en streaming: crea o actualiza por sku en lotes '
+            'y anota las filas con errores sin detener la importación.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('ruta', help='Archivo a importar.')
+        parser.add_argument('--formato', choices=sorted(catalog_io.FORMATOS),
+                            help='Por defecto se deduce de la extensión.')
+        parser.add_argument('--imagenes', metavar='DIR',
+                            help='Directorio donde buscar los archivos de la columna imagen.')
+        parser.add_argument('--lote', type=int, default=1000, help='Filas por transacción.')
+
+    def handle(self, *args, **options):
+        formato = catalog_io.formato_de(options['ruta'], options['formato'])
+        inicio = time.perf_counter()
+        try:
+            with open(options['ruta'], encoding='utf-8-sig', newline='') as archivo:
+                resultado = catalog_io.importar(catalog_io.leer(archivo, formato), lote=options['lote'],
+                                                imagenes=options['imagenes'])
+        except OSError as e:
+            raise CommandError(f'No se puede leer {options["ruta"]}: {e}')
+        segundos = time.perf_counter() - inicio
+
+        for linea, mensaje in resultado.errores:
+            self.stderr.write(f'línea {linea}: {mensaje}')
+        if resultado.fallidos > len(resultado.errores):
+            self.stderr.write(f'... y {resultado.fallidos - len(resultado.errores)} errores más.')
+        filas = resultado.creados + resultado.actualizados
+        self.stdout.write(self.style.SUCCESS(
+            f'{resultado} en {segundos:.1f} s ({filas / max(segundos, 1e-9):,.0f} filas/s).'
+        ))
@@ -0,0 +1,44 @@
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import HistorialCliente
+
+
+class Command(BaseCommand):
+    help = 'Borra (y opcionalmente archiva) las entradas del historial de clientes más antiguas que la retención.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=None,
+                            help='Antigüedad máxima en días (por defecto AUDITORIA_RETENCION_DIAS).')
+        parser.add_argument('--archivar', metavar='RUTA',
+                            help='Añade las entradas borradas a este fichero JSON Lines antes de borrarlas.')
+        parser.add_argument('--lote', type=int, default=1000, help='Entradas borradas por transacción.')
+
+    def handle(self, *args, **options):
+        dias = options['dias'] if options['dias'] is not None else settings.AUDITORIA_RETENCION_DIAS
+        limite = timezone.now() - timedelta(days=dias)
+        archivo = open(options['archivar'], 'a', encoding='utf-8') if options['archivar'] else None
+
+        total = 0
+        try:
+            while True:
+                filas = list(HistorialCliente.objects.filter(fecha__lt=limite).order_by('fecha', 'id')
+                             .values('id', 'nombre', 'correo', 'accion', 'fecha')[:options['lote']])
+                if not filas:
+                    break
+                if archivo:
+                    for fila in filas:
+                        archivo.write(json.dumps({**fila, 'fecha': fila['fecha'].isoformat()}, ensure_ascii=False) + '\n')
+                    archivo.flush()
+                with transaction.atomic():
+                    total += HistorialCliente.objects.filter(id__in=[f['id'] for f in filas]).delete()[0]
+        finally:
+            if archivo:
+                archivo.close()
+
+        self.stdout.write(self.style.SUCCESS(f'{total} entradas anteriores a {limite:%d/%m/%Y} eliminadas.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core import reservations
+
+
+class Command(BaseCommand):
+    help = 'Borra las reservas de stock caducadas (pensado para ejecutarse periódicamente, p. ej. desde cron).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Filas borradas por sentencia.')
+
+    def handle(self, *args, **options):
+        borradas = reservations.purgar_expiradas(options['lote'])
+        self.stdout.write(self.style.SUCCESS(f'{borradas} reservas caducadas eliminadas.'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from core import sales
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye las métricas de ventas del panel a partir del histórico de pedidos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=5000, help='Pedidos leídos por lote.')
+
+    def handle(self, *args, **options):
+        progreso = None
+        if options['verbosity'] > 1:
+            progreso = lambda ultimo_id: self.stdout.write(f'  ... pedidos hasta id {ultimo_id}')
+        dias, estados, productos = sales.recalcular(options['lote'], progreso)
+        self.stdout.write(self.style.SUCCESS(
+            f'Métricas recalculadas: {dias} días, {estados} estados, {productos} productos.'
+        ))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from core import search
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de búsqueda de texto completo del catálogo.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help='Alias de base de datos (por defecto "default").')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if not search.soportado(using):
+            raise CommandError('El índice FTS5 solo está disponible en SQLite >= 3.34.')
+        if not search.reconstruir_indice(using):
+            raise CommandError('No existe la tabla core_producto; ejecuta migrate primero.')
+        self.stdout.write(self.style.SUCCESS('Índice de búsqueda reconstruido.'))
@@ -0,0 +1,157 @@
+"""
+Métricas por vista (latencia, número de consultas y tiempo en BD).
+
+``core.middleware.MetricsMiddleware`` mide cada petición y la suma a un agregador en memoria
+del proceso, indexado por el nombre de la URL resuelta (``url_name``) para que
+el número de series no dependa de los parámetros de la ruta. ``exportar``
+las devuelve en el formato de texto de Prometheus para ``/panel/metrics/``.
+
+Las consultas se cuentan con un ``execute_wrapper`` instalado una vez en cada
+conexión (al crearse, ``connection_created``) que suma en el contador de la
+petición en curso, guardado en una ``ContextVar``. Así también se cuentan las
+consultas de las vistas async, que el ORM ejecuta en otro hilo con su propia
+conexión pero con el mismo contexto.
+
+El coste por petición es un par de ``perf_counter``, un envoltorio por
+consulta SQL y una actualización de contadores bajo un lock. Cada proceso del
+servidor lleva sus propios contadores: con varios workers, cada raspado ve
+solo el proceso que atiende la petición.
+"""
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.db.backends.signals import connection_created
+
+# Límites superiores (segundos) de los buckets del histograma de latencia.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+SIN_RUTA = '<sin_ruta>'
+
+
+class _Serie:
+    __slots__ = ('peticiones', 'buckets', 'segundos', 'consultas', 'segundos_bd', 'estados')
+
+    def __init__(self):
+        self.peticiones = 0
+        self.buckets = [0] * (len(BUCKETS) + 1)  # el último es +Inf
+        self.segundos = 0.0
+        self.consultas = 0
+        self.segundos_bd = 0.0
+        self.estados = {}
+
+
+class Agregador:
+    def __init__(self):
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, vista, estado, segundos, consultas, segundos_bd):
+        clase = f'{estado // 100}xx'
+        with self._lock:
+            serie = self._series.get(vista)
+            if serie is None:
+                serie = self._series[vista] = _Serie()
+            serie.peticiones += 1
+            serie.buckets[bisect_left(BUCKETS, segundos)] += 1
+            serie.segundos += segundos
+            serie.consultas += consultas
+            serie.segundos_bd += segundos_bd
+            serie.estados[clase] = serie.estados.get(clase, 0) + 1
+
+    def reiniciar(self):
+        with self._lock:
+            self._series.clear()
+
+    def instantanea(self):
+        with self._lock:
+            return {
+                vista: {
+                    'peticiones': s.peticiones, 'buckets': list(s.buckets), 'segundos': s.segundos,
+                    'consultas': s.consultas, 'segundos_bd': s.segundos_bd, 'estados': dict(s.estados),
+                }
+                for vista, s in self._series.items()
+            }
+
+
+agregador = Agregador()
+
+
+class ContadorConsultas:
+    __slots__ = ('consultas', 'segundos')
+
+    def __init__(self):
+        self.consultas = 0
+        self.segundos = 0.0
+
+
+contador_actual = ContextVar('metricas_contador', default=None)
+
+
+def _contar_consulta(execute, sql, params, many, context):
+    contador = contador_actual.get()
+    if contador is None:
+        return execute(sql, params, many, context)
+    inicio = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        contador.segundos += perf_counter() - inicio
+        contador.consultas += 1
+
+
+def instalar_contador(conexion):
+    if _contar_consulta not in conexion.execute_wrappers:
+        conexion.execute_wrappers.append(_contar_consulta)
+
+
+def _al_crear_conexion(sender, connection, **kwargs):
+    instalar_contador(connection)
+
+
+connection_created.connect(_al_crear_conexion, dispatch_uid='core.metrics.contador')
+
+
+def _escapar(valor):
+    return valor.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def exportar(datos=None):
+    """Texto en formato de exposición de Prometheus (versión 0.0.4)."""
+    datos = agregador.instantanea() if datos is None else datos
+    lineas = [
+        '# HELP caicai_view_requests_total Peticiones atendidas por vista y clase de estado.',
+        '# TYPE caicai_view_requests_total counter',
+    ]
+    for vista, s in sorted(datos.items()):
+        for clase, n in sorted(s['estados'].items()):
+            lineas.append(f'caicai_view_requests_total{{view="{_escapar(vista)}",status="{clase}"}} {n}')
+
+    lineas += [
+        '# HELP caicai_view_latency_seconds Latencia de la vista (middleware incluido).',
+        '# TYPE caicai_view_latency_seconds histogram',
+    ]
+    for vista, s in sorted(datos.items()):
+        etiqueta = f'view="{_escapar(vista)}"'
+        acumulado = 0
+        for limite, n in zip(BUCKETS + ('+Inf',), s['buckets']):
+            acumulado += n
+            lineas.append(f'caicai_view_latency_seconds_bucket{{{etiqueta},le="{limite}"}} {acumulado}')
+        lineas.append(f'caicai_view_latency_seconds_sum{{{etiqueta}}} {s["segundos"]:.6f}')
+        lineas.append(f'caicai_view_latency_seconds_count{{{etiqueta}}} {s["peticiones"]}')
+
+    lineas += [
+        '# HELP caicai_view_db_queries_total Consultas SQL ejecutadas por vista.',
+        '# TYPE caicai_view_db_queries_total counter',
+    ]
+    for vista, s in sorted(datos.items()):
+        lineas.append(f'caicai_view_db_queries_total{{view="{_escapar(vista)}"}} {s["consultas"]}')
+
+    lineas += [
+        '# HELP caicai_view_db_seconds_total Tiempo en la base de datos por vista.',
+        '# TYPE caicai_view_db_seconds_total counter',
+    ]
+    for vista, s in sorted(datos.items()):
+        lineas.append(f'caicai_view_db_seconds_total{{view="{_escapar(vista)}"}} {s["segundos_bd"]:.6f}')
+    return '\n'.join(lineas) + '\n'
@@ -1,31 +1,127 @@
-
 from django.shortcuts import redirect
 from django.contrib import messages
 from django.urls import resolve
+from django.db import connections
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from . import cart_storage
+from .metrics import ContadorConsultas, SIN_RUTA, agregador, contador_actual, instalar_contador
 
 ALLOWED_FOR_BLOCKED = {
-    'home', 'catalogo',
+    'home', 'catalogo', 'api_productos', 'api_producto', 'api_categorias',
     'login_unificado', 'logout_unificado', 'registro_cliente',
 }
 
-class BlockedUserRestrictionMiddleware:
+
+class _SyncAsyncMiddleware:
+    """
+    Base para middlewares que funcionan en ambos modos: bajo ASGI ``__call__``
+    devuelve la corrutina de ``__acall__`` y Django no pasa la petición a un hilo.
+    """
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.es_async = iscoroutinefunction(get_response)
+        if self.es_async:
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        if request.path.startswith('/static/') or request.path.startswith('/media/') or request.path.startswith('/admin/'):
-            return self.get_response(request)
+        if self.es_async:
+            return self.__acall__(request)
+        return self.llamar(request)
+
+
+def _ruta_exenta(request):
+    return request.path.startswith('/static/') or request.path.startswith('/media/') or request.path.startswith('/admin/')
+
+
+def _redirigir_si_bloqueado(request, user):
+    if user and user.is_authenticated and getattr(user, 'bloqueado', False):
+        try:
+            match = resolve(request.path)
+            url_name = match.url_name
+        except Exception:
+            url_name = None
+
+        if url_name not in ALLOWED_FOR_BLOCKED:
+            messages.error(request, 'Tu cuenta está bloqueada. Solo puedes ver el catálogo.')
+            return redirect('catalogo')
+    return None
+
 
+class BlockedUserRestrictionMiddleware(_SyncAsyncMiddleware):
+    # request.user y request.auser() cachean por separado (_cached_user y
+    # _acached_user); como aquí ya se carga el usuario, se deja también en la
+    # caché de auser() para que las vistas async no lo consulten otra vez.
+
+    def llamar(self, request):
+        if _ruta_exenta(request):
+            return self.get_response(request)
         user = getattr(request, 'user', None)
-        if user and user.is_authenticated and getattr(user, 'bloqueado', False):
-            try:
-                match = resolve(request.path)
-                url_name = match.url_name
-            except Exception:
-                url_name = None
-
-            if url_name not in ALLOWED_FOR_BLOCKED:
-                messages.error(request, 'Tu cuenta está bloqueada. Solo puedes ver el catálogo.')
-                return redirect('catalogo')
-
-        return self.get_response(request)
+        respuesta = _redirigir_si_bloqueado(request, user)
+        if user is not None:
+            request._acached_user = user
+        return respuesta or self.get_response(request)
+
+    async def __acall__(self, request):
+        if _ruta_exenta(request):
+            return await self.get_response(request)
+        user = await request.auser() if hasattr(request, 'auser') else None
+        if user is not None:
+            request.user = user
+        return _redirigir_si_bloqueado(request, user) or await self.get_response(request)
+
+
+class MetricsMiddleware(_SyncAsyncMiddleware):
+    """Mide latencia, consultas y tiempo en BD de cada petición (ver ``core.metrics``)."""
+
+    def llamar(self, request):
+        # Conexiones abiertas antes de cargar core.metrics (no pasaron por connection_created)
+        for alias in connections:
+            instalar_contador(connections[alias])
+        contador = ContadorConsultas()
+        token = contador_actual.set(contador)
+        inicio = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            segundos = perf_counter() - inicio
+            contador_actual.reset(token)
+        return self._observar(request, response, segundos, contador)
+
+    async def __acall__(self, request):
+        contador = ContadorConsultas()
+        token = contador_actual.set(contador)
+        inicio = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            segundos = perf_counter() - inicio
+            contador_actual.reset(token)
+        return self._observar(request, response, segundos, contador)
+
+    def _observar(self, request, response, segundos, contador):
+        match = getattr(request, 'resolver_match', None)
+        vista = (match.url_name or match.view_name) if match else SIN_RUTA
+        agregador.observar(vista, response.status_code, segundos, contador.consultas, contador.segundos)
+        return response
+
+
+class CarritoMiddleware(_SyncAsyncMiddleware):
+    """Pone el carrito en ``request.carrito`` y lo guarda si cambió (ver ``core.cart_storage``)."""
+
+    def llamar(self, request):
+        request.carrito = cart_storage.backend()(request)
+        response = self.get_response(request)
+        request.carrito.guardar_si_modificado(response)
+        return response
+
+    async def __acall__(self, request):
+        request.carrito = cart_storage.backend()(request)
+        response = await self.get_response(request)
+        await request.carrito.aguardar_si_modificado(response)
+        return response
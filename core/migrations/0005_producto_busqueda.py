@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:47
+
+import core.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def crear_indice(apps, schema_editor):
+    from core import search
+    search.asegurar_indice(schema_editor.connection.alias)
+
+
+def eliminar_indice(apps, schema_editor):
+    from core import search
+    search.eliminar_indice(schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_historialcliente_cliente_bloqueado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductoBusqueda',
+            fields=[
+                ('producto', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='busqueda', serialize=False, to='core.producto')),
+                ('contenido', core.models.FTSField(db_column='core_producto_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'core_producto_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(crear_indice, eliminar_indice),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_producto_busqueda'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservaStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('titular', models.CharField(max_length=64)),
+                ('cantidad', models.PositiveIntegerField()),
+                ('expira', models.DateTimeField(db_index=True)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='core.producto')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['producto', 'expira'], name='reserva_producto_expira_idx')],
+                'constraints': [models.UniqueConstraint(fields=('titular', 'producto'), name='reserva_unica_por_titular')],
+            },
+        ),
+    ]
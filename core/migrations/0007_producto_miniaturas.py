@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_reservastock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='miniaturas',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:54
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_producto_miniaturas'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='producto',
+            name='imagen',
+            field=models.ImageField(blank=True, db_index=True, null=True, storage=core.storage.producto_storage, upload_to='productos/'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def reconstruir_metricas(apps, schema_editor):
+    # Las tablas nacen vacías y a partir de aquí solo se actualizan de forma
+    # incremental: sin este paso el panel ignoraría los pedidos ya existentes.
+    # Es lo mismo que sales.recalcular, con los modelos históricos.
+    Pedido = apps.get_model('core', 'Pedido')
+    DetallePedido = apps.get_model('core', 'DetallePedido')
+    VentaDiaria = apps.get_model('core', 'VentaDiaria')
+    ConteoEstadoPedido = apps.get_model('core', 'ConteoEstadoPedido')
+    VentaProducto = apps.get_model('core', 'VentaProducto')
+    db = schema_editor.connection.alias
+
+    pedidos = Pedido.objects.using(db)
+    VentaDiaria.objects.using(db).bulk_create([
+        VentaDiaria(fecha=fila['dia'], pedidos=fila['n'], ingresos=fila['total'])
+        for fila in pedidos.annotate(dia=TruncDate('fecha')).values('dia')
+                           .annotate(n=Count('id'), total=Sum('total')).order_by()
+    ], batch_size=1000)
+    ConteoEstadoPedido.objects.using(db).bulk_create([
+        ConteoEstadoPedido(estado=fila['estado'], cantidad=fila['n'])
+        for fila in pedidos.values('estado').annotate(n=Count('id')).order_by()
+    ])
+    VentaProducto.objects.using(db).bulk_create([
+        VentaProducto(producto_id=fila['producto_id'], unidades=fila['u'], ingresos=fila['i'])
+        for fila in DetallePedido.objects.using(db).values('producto_id')
+                                 .annotate(u=Sum('cantidad'), i=Sum('subtotal')).order_by()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_producto_imagen_contenido'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConteoEstadoPedido',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_proceso', 'En Proceso'), ('finalizado', 'Finalizado')], max_length=20, unique=True)),
+                ('cantidad', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VentaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(unique=True)),
+                ('pedidos', models.PositiveIntegerField(default=0)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VentaProducto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unidades', models.PositiveIntegerField(default=0)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('producto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ventas', to='core.producto')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-unidades'], name='ventaproducto_unidades_idx')],
+            },
+        ),
+        migrations.RunPython(reconstruir_metricas, migrations.RunPython.noop),
+    ]
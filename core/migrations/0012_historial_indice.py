@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_pedido_cliente'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='historialcliente',
+            index=models.Index(fields=['nombre', 'fecha'], name='historial_nombre_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:58
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_historial_indice'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='historialcliente',
+            name='fecha',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='historialcliente',
+            index=models.Index(fields=['fecha'], name='historial_fecha_idx'),
+        ),
+    ]
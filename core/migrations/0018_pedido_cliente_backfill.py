@@ -0,0 +1,43 @@
+from django.db import migrations
+
+LOTE = 500
+
+
+def asignar_clientes(apps, schema_editor):
+    # Lo mismo que el comando asignar_clientes_pedidos, para que "Mis pedidos"
+    # no dependa de que alguien lo lance a mano. El comando sigue sirviendo
+    # para repetirlo en lotes con pausas sobre una base de datos en uso.
+    Pedido = apps.get_model('core', 'Pedido')
+    Cliente = apps.get_model('core', 'Cliente')
+    db = schema_editor.connection.alias
+    ultimo_id = 0
+    while True:
+        pedidos = list(Pedido.objects.using(db).filter(cliente__isnull=True, id__gt=ultimo_id)
+                       .order_by('id').only('id', 'nombre_cliente', 'correo')[:LOTE])
+        if not pedidos:
+            return
+        usernames = {p.nombre_cliente for p in pedidos}
+        correos = {p.correo for p in pedidos} - {''}
+        por_usuario = dict(Cliente.objects.using(db).filter(username__in=usernames).values_list('username', 'id'))
+        por_correo = dict(Cliente.objects.using(db).filter(email__in=correos).values_list('email', 'id'))
+        actualizar = []
+        for p in pedidos:
+            # Por username; un correo de otro cliente deja el pedido sin asignar.
+            p.cliente_id = por_usuario.get(p.nombre_cliente)
+            if por_correo.get(p.correo, p.cliente_id) != p.cliente_id:
+                p.cliente_id = None
+            if p.cliente_id:
+                actualizar.append(p)
+        Pedido.objects.using(db).bulk_update(actualizar, ['cliente'])
+        ultimo_id = pedidos[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_producto_facetas'),
+    ]
+
+    operations = [
+        migrations.RunPython(asignar_clientes, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.hashers import make_password, check_password
+from django.utils import timezone
+
+from .storage import producto_storage
 
 class AdminUser(models.Model):
     username = models.CharField(max_length=100, unique=True)
@@ -18,33 +21,127 @@ class AdminUser(models.Model):
 
 class Categoria(models.Model):
     nombre = models.CharField(max_length=100, unique=True)
+    actualizado = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.nombre
 
 class Producto(models.Model):
+    # Código estable del proveedor; clave de las importaciones masivas (ver core.catalog_io).
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     nombre = models.CharField(max_length=150)
     descripcion = models.TextField(blank=True)
     precio = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
-    imagen = models.ImageField(upload_to='productos/', blank=True, null=True)
-    categoria = models.ForeignKey(Categoria, on_delete=models.CASCADE)
+    imagen = models.ImageField(upload_to='productos/', storage=producto_storage, blank=True, null=True, db_index=True)
+    # {ancho: {'src': nombre, 'webp': nombre}} generado por core.images
+    miniaturas = models.JSONField(default=dict, blank=True)
+    # El índice (categoria, precio) de Meta cubre también las búsquedas solo por categoría.
+    categoria = models.ForeignKey(Categoria, on_delete=models.CASCADE, db_index=False)
+    # auto_now no se aplica en update()/bulk_update(): quien los use debe fijarlo (ver core.api).
+    actualizado = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Conteos por categoría, rangos de precio y orden por precio del catálogo (ver core.facets).
+            models.Index(fields=['categoria', 'precio'], name='producto_categoria_precio_idx'),
+            models.Index(fields=['stock'], name='producto_stock_idx'),
+        ]
 
     def __str__(self):
         return self.nombre
 
+    def _srcset(self, formato):
+        urls = [f'{self.imagen.storage.url(v[formato])} {ancho}w'
+                for ancho, v in sorted(self.miniaturas.items(), key=lambda kv: int(kv[0]))]
+        return ', '.join(urls)
+
+    @property
+    def srcset_src(self):
+        return self._srcset('src')
+
+    @property
+    def srcset_webp(self):
+        return self._srcset('webp')
+
+    @property
+    def miniatura_url(self):
+        """URL de la miniatura más pequeña, o de la imagen original si aún no hay."""
+        if self.miniaturas:
+            menor = min(self.miniaturas, key=int)
+            return self.imagen.storage.url(self.miniaturas[menor]['src'])
+        return self.imagen.url if self.imagen else ''
+
+
+class FTSField(models.TextField):
+    """Columna oculta de una tabla FTS5 que admite el lookup ``__match``."""
+
+
+@FTSField.register_lookup
+class Match(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', [*lhs_params, *rhs_params]
+
+
+class ProductoBusqueda(models.Model):
+    # Tabla virtual FTS5 creada y mantenida por core.search (no la gestiona Django).
+    producto = models.OneToOneField(Producto, on_delete=models.DO_NOTHING, primary_key=True,
+                                    db_column='rowid', related_name='busqueda')
+    contenido = FTSField(db_column='core_producto_fts')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'core_producto_fts'
+
+
+class ReservaStock(models.Model):
+    # Unidades apartadas por un carrito durante un tiempo limitado (ver core.reservations).
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='reservas')
+    titular = models.CharField(max_length=64)
+    cantidad = models.PositiveIntegerField()
+    expira = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['titular', 'producto'], name='reserva_unica_por_titular'),
+        ]
+        indexes = [
+            models.Index(fields=['producto', 'expira'], name='reserva_producto_expira_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.producto_id} x {self.cantidad} ({self.titular})'
+
 
 class Cliente(AbstractUser):
     direccion = models.CharField(max_length=255, blank=True, null=True)
     telefono = models.CharField(max_length=20, blank=True, null=True)
     bloqueado = models.BooleanField(default=False)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Unicidad del correo en registro_cliente y editar_perfil (ver auditar_consultas).
+            models.Index(fields=['email'], name='cliente_email_idx'),
+        ]
+
 class HistorialCliente(models.Model):
     nombre = models.CharField(max_length=150)
     correo = models.EmailField()
-    fecha = models.DateTimeField(auto_now_add=True)
+    # default en vez de auto_now_add: core.audit escribe en diferido y conserva la hora del evento
+    fecha = models.DateTimeField(default=timezone.now)
     accion = models.CharField(max_length=50)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['nombre', 'fecha'], name='historial_nombre_fecha_idx'),
+            models.Index(fields=['fecha'], name='historial_fecha_idx'),
+        ]
+
     def __str__(self):
         return f"{self.nombre} - {self.accion} ({self.fecha:%d/%m/%Y})"
 
@@ -57,6 +154,9 @@ class Pedido(models.Model):
         ('finalizado', 'Finalizado'),
     ]
 
+    # El índice (cliente, fecha) de Meta cubre también las búsquedas solo por cliente.
+    cliente = models.ForeignKey('Cliente', on_delete=models.SET_NULL, null=True, blank=True,
+                                related_name='pedidos', db_index=False)
     nombre_cliente = models.CharField(max_length=100)
     correo = models.EmailField()
     direccion = models.CharField(max_length=200)
@@ -64,6 +164,15 @@ class Pedido(models.Model):
     estado = models.CharField(max_length=20, choices=ESTADOS, default='pendiente')
     total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['fecha'], name='pedido_fecha_idx'),
+            models.Index(fields=['estado', 'fecha'], name='pedido_estado_fecha_idx'),
+            models.Index(fields=['nombre_cliente', 'fecha'], name='pedido_cliente_fecha_idx'),
+            models.Index(fields=['correo', 'fecha'], name='pedido_correo_fecha_idx'),
+            models.Index(fields=['cliente', 'fecha'], name='pedido_clienteid_fecha_idx'),
+        ]
+
     def __str__(self):
         return f'Pedido #{self.id} - {self.nombre_cliente}'
 
@@ -76,3 +185,37 @@ class DetallePedido(models.Model):
 
     def __str__(self):
         return f'{self.producto.nombre} x {self.cantidad}'
+
+
+# ------------------- MÉTRICAS DE VENTAS -------------------
+# Tablas de resumen mantenidas de forma incremental por core.sales.
+
+class VentaDiaria(models.Model):
+    fecha = models.DateField(unique=True)
+    pedidos = models.PositiveIntegerField(default=0)
+    ingresos = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f'{self.fecha}: {self.pedidos} pedidos, ${self.ingresos}'
+
+
+class ConteoEstadoPedido(models.Model):
+    estado = models.CharField(max_length=20, choices=Pedido.ESTADOS, unique=True)
+    cantidad = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.estado}: {self.cantidad}'
+
+
+class VentaProducto(models.Model):
+    producto = models.OneToOneField(Producto, on_delete=models.CASCADE, related_name='ventas')
+    unidades = models.PositiveIntegerField(default=0)
+    ingresos = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-unidades'], name='ventaproducto_unidades_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.producto_id}: {self.unidades} uds.'
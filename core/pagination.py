@@ -0,0 +1,111 @@
+"""
+Paginación por clave (keyset) para listados grandes.
+
+En lugar de ``OFFSET`` se filtra por la posición del último elemento de la
+página anterior (``WHERE (a, b) > (x, y)``), de modo que el coste de una
+página no depende de lo profunda que sea y las inserciones concurrentes no
+desplazan ni duplican filas entre páginas.
+"""
+import base64
+import datetime
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+
+class _CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder recorta los microsegundos y el cursor necesita el valor exacto.
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class PaginaKeyset:
+    def __init__(self, items, siguiente=None):
+        self.items = items
+        self.siguiente = siguiente
+
+    @property
+    def tiene_siguiente(self):
+        return self.siguiente is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _campos(orden):
+    return [(campo.lstrip('-'), campo.startswith('-')) for campo in orden]
+
+
+def codificar_cursor(valores):
+    data = json.dumps(valores, cls=_CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor, n):
+    """Devuelve la lista de valores del cursor, o ``None`` si no es válido."""
+    if not cursor:
+        return None
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        valores = json.loads(data)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(valores, list) or len(valores) != n:
+        return None
+    return valores
+
+
+def filtro_despues_de(orden, valores):
+    """
+    Construye ``(a > x) OR (a = x AND b > y) OR ...`` respetando la dirección
+    de cada campo de ``orden``.
+    """
+    condicion = Q()
+    previos = {}
+    for (campo, desc), valor in zip(_campos(orden), valores):
+        lookup = 'lt' if desc else 'gt'
+        condicion |= Q(**previos, **{f'{campo}__{lookup}': valor})
+        previos[campo] = valor
+    return condicion
+
+
+def _consulta(queryset, orden, cursor, tamano):
+    valores = decodificar_cursor(cursor, len(orden))
+    queryset = queryset.order_by(*orden)
+    if valores is not None:
+        try:
+            queryset = queryset.filter(filtro_despues_de(orden, valores))
+        except (ValidationError, ValueError, TypeError):
+            # Cursor manipulado: se vuelve a la primera página.
+            pass
+    return queryset[:tamano + 1]
+
+
+def _pagina(items, orden, tamano):
+    siguiente = None
+    if len(items) > tamano:
+        items = items[:tamano]
+        ultimo = items[-1]
+        siguiente = codificar_cursor([getattr(ultimo, campo) for campo, _ in _campos(orden)])
+    return PaginaKeyset(items, siguiente)
+
+
+def paginar_keyset(queryset, orden, cursor=None, tamano=50):
+    """
+    Devuelve una ``PaginaKeyset`` con a lo sumo ``tamano`` elementos de
+    ``queryset`` ordenado por ``orden``. El último campo de ``orden`` debe ser
+    único (normalmente ``id``) para que el orden sea total.
+    """
+    return _pagina(list(_consulta(queryset, orden, cursor, tamano)), orden, tamano)
+
+
+async def apaginar_keyset(queryset, orden, cursor=None, tamano=50):
+    """Versión async de ``paginar_keyset``."""
+    return _pagina([obj async for obj in _consulta(queryset, orden, cursor, tamano)], orden, tamano)
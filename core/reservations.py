@@ -0,0 +1,106 @@
+"""
+Reservas temporales de stock.
+
+Al añadir al carrito o abrir la página de confirmación se aparta la cantidad
+del carrito durante ``settings.RESERVA_STOCK_TTL`` segundos. El stock
+disponible para los demás es ``stock - reservas activas``; las reservas
+caducadas simplemente dejan de contar y se borran de forma perezosa (al
+reservar el mismo producto) o con el comando ``purgar_reservas``.
+
+Una reserva aparta como mucho ``settings.RESERVA_STOCK_MAX_UNIDADES`` de un
+producto, para que un carrito (anónimo incluso) no pueda bloquear todo el
+stock durante el TTL; el resto de la cantidad se comprueba igualmente al
+reservar y se garantiza en el checkout con el ``UPDATE`` condicional.
+
+El titular de una reserva es un token que se guarda junto al carrito (ver
+``core.cart_storage``), así que sobrevive al cambio de clave de sesión que
+hace ``login``.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import Producto, ReservaStock
+
+
+def titular(request):
+    return request.carrito.titular
+
+
+def _expiracion():
+    return timezone.now() + timedelta(seconds=settings.RESERVA_STOCK_TTL)
+
+
+def _reservado_por_otros(producto_ids, titular_id, ahora):
+    """``{id: unidades}`` con reserva activa de titulares distintos de ``titular_id``."""
+    return dict(
+        ReservaStock.objects.filter(producto_id__in=producto_ids, expira__gt=ahora)
+        .exclude(titular=titular_id)
+        .values('producto_id').annotate(total=Sum('cantidad'))
+        .values_list('producto_id', 'total')
+    )
+
+
+def reservar(titular_id, cantidades):
+    """
+    Fija las reservas de ``titular_id`` a ``cantidades`` (``{id: cantidad}``) y
+    renueva su caducidad. Es todo o nada: si algún producto no tiene unidades
+    suficientes no se toca ninguna reserva y se devuelve la lista de
+    ``(producto, disponible, solicitado)`` que faltan; si no, lista vacía.
+    """
+    if not cantidades:
+        return []
+    ahora = timezone.now()
+    ids = sorted(cantidades)
+    with transaction.atomic():
+        # Se escribe antes de leer: en SQLite el DELETE toma el bloqueo de
+        # escritura (esperando busy_timeout si hace falta) y las lecturas de
+        # abajo ya no pueden quedarse sin poder pasar a escritura, que falla
+        # con "database is locked" sin esperar. En otros motores bloquean las
+        # filas de los productos, en orden de id.
+        ReservaStock.objects.filter(producto_id__in=ids, expira__lte=ahora).delete()
+        productos = list(Producto.objects.select_for_update().filter(id__in=ids).order_by('id'))
+        reservado = _reservado_por_otros(ids, titular_id, ahora)
+        faltantes = []
+        for p in productos:
+            disponible = max(p.stock - reservado.get(p.id, 0), 0)
+            if cantidades[p.id] > disponible:
+                faltantes.append((p, disponible, cantidades[p.id]))
+        if faltantes:
+            return faltantes
+
+        ReservaStock.objects.filter(titular=titular_id, producto_id__in=ids).delete()
+        expira = _expiracion()
+        maximo = settings.RESERVA_STOCK_MAX_UNIDADES
+        ReservaStock.objects.bulk_create([
+            ReservaStock(producto=p, titular=titular_id, cantidad=min(cantidades[p.id], maximo), expira=expira)
+            for p in productos
+        ])
+    return []
+
+
+def reservadas(titular_id):
+    """``{id: cantidad}`` de las reservas activas de ``titular_id``."""
+    return dict(ReservaStock.objects.filter(titular=titular_id, expira__gt=timezone.now())
+                .values_list('producto_id', 'cantidad'))
+
+
+def liberar(titular_id, producto_ids=None):
+    reservas = ReservaStock.objects.filter(titular=titular_id)
+    if producto_ids is not None:
+        reservas = reservas.filter(producto_id__in=producto_ids)
+    return reservas.delete()[0]
+
+
+def purgar_expiradas(lote=1000):
+    """Borra las reservas caducadas en lotes de ``lote`` filas; devuelve cuántas borró."""
+    total = 0
+    while True:
+        ids = list(ReservaStock.objects.filter(expira__lte=timezone.now())
+                   .values_list('id', flat=True)[:lote])
+        if not ids:
+            return total
+        total += ReservaStock.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,147 @@
+"""
+Métricas de ventas para el panel de administración.
+
+``VentaDiaria``, ``ConteoEstadoPedido`` y ``VentaProducto`` son tablas de
+resumen que se actualizan de forma incremental, dentro de la misma
+transacción que el cambio que las origina:
+
+* ``registrar_pedido``: al confirmar un pedido (``core.checkout``).
+* ``registrar_cambio_estado``: al cambiar el estado en ``pedido_detalle``;
+  si el estado anterior no estaba contado, recuenta los dos desde ``Pedido``.
+
+Así el panel lee unas pocas filas sin recorrer ``Pedido``/``DetallePedido``.
+``recalcular`` las reconstruye desde el histórico por lotes (comando
+``recalcular_metricas``), por si se editaron pedidos por otras vías.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, DecimalField, F, IntegerField, Sum, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import ConteoEstadoPedido, DetallePedido, Pedido, VentaDiaria, VentaProducto
+
+
+def _incrementar(modelo, clave, **deltas):
+    """
+    ``UPDATE ... SET campo = campo + delta`` o, si la fila no existe, ``INSERT``.
+    Una fila nueva nunca empieza en negativo: lo que no estaba contado no se resta.
+    """
+    cambios = {campo: F(campo) + delta for campo, delta in deltas.items()}
+    if modelo.objects.filter(**clave).update(**cambios):
+        return
+    try:
+        with transaction.atomic():
+            modelo.objects.create(**clave, **{campo: max(delta, 0) for campo, delta in deltas.items()})
+    except IntegrityError:
+        # Otra transacción la creó entre medias.
+        modelo.objects.filter(**clave).update(**cambios)
+
+
+def _incrementar_productos(lineas):
+    """Suma unidades e ingresos de ``lineas`` ``[(producto_id, unidades, ingresos)]`` en lote."""
+    if not lineas:
+        return
+    ids = [pid for pid, _, _ in lineas]
+    existentes = set(VentaProducto.objects.filter(producto_id__in=ids).values_list('producto_id', flat=True))
+    if existentes:
+        VentaProducto.objects.filter(producto_id__in=existentes).update(
+            unidades=Case(*[When(producto_id=pid, then=F('unidades') + u) for pid, u, _ in lineas if pid in existentes],
+                          default=F('unidades'), output_field=IntegerField()),
+            ingresos=Case(*[When(producto_id=pid, then=F('ingresos') + i) for pid, _, i in lineas if pid in existentes],
+                          default=F('ingresos'), output_field=DecimalField(max_digits=14, decimal_places=2)),
+        )
+    nuevos = [VentaProducto(producto_id=pid, unidades=u, ingresos=i) for pid, u, i in lineas if pid not in existentes]
+    try:
+        with transaction.atomic():
+            VentaProducto.objects.bulk_create(nuevos)
+    except IntegrityError:
+        for v in nuevos:
+            _incrementar(VentaProducto, {'producto_id': v.producto_id}, unidades=v.unidades, ingresos=v.ingresos)
+
+
+def registrar_pedido(pedido, detalles):
+    """Suma un pedido recién creado (y sus ``DetallePedido``) a las métricas."""
+    _incrementar(VentaDiaria, {'fecha': timezone.localdate(pedido.fecha)}, pedidos=1, ingresos=pedido.total)
+    _incrementar(ConteoEstadoPedido, {'estado': pedido.estado}, cantidad=1)
+
+    por_producto = defaultdict(lambda: [0, Decimal('0')])
+    for d in detalles:
+        por_producto[d.producto_id][0] += d.cantidad
+        por_producto[d.producto_id][1] += d.subtotal
+    _incrementar_productos([(pid, u, i) for pid, (u, i) in sorted(por_producto.items())])
+
+
+def registrar_cambio_estado(anterior, nuevo):
+    """Pasa un pedido, ya guardado con el estado ``nuevo``, de un conteo al otro."""
+    if anterior == nuevo:
+        return
+    if not ConteoEstadoPedido.objects.filter(estado=anterior, cantidad__gt=0).update(cantidad=F('cantidad') - 1):
+        # El resumen no contaba este pedido (p. ej. nunca se recalculó): en vez de
+        # dejar un conteo negativo se recuentan los dos estados desde Pedido.
+        for estado in (anterior, nuevo):
+            ConteoEstadoPedido.objects.update_or_create(
+                estado=estado, defaults={'cantidad': Pedido.objects.filter(estado=estado).count()})
+        return
+    _incrementar(ConteoEstadoPedido, {'estado': nuevo}, cantidad=1)
+
+
+def resumen(dias=30, top=10):
+    """Datos para ``admin_dashboard``: unas pocas consultas sobre las tablas de resumen."""
+    hoy = timezone.localdate()
+    ventas = list(VentaDiaria.objects.filter(fecha__gt=hoy - timedelta(days=dias)).order_by('-fecha'))
+    estados = dict(ConteoEstadoPedido.objects.values_list('estado', 'cantidad'))
+    return {
+        'hoy': next((v for v in ventas if v.fecha == hoy), None),
+        'ventas_diarias': ventas,
+        'ingresos_periodo': sum((v.ingresos for v in ventas), Decimal('0')),
+        'pedidos_periodo': sum(v.pedidos for v in ventas),
+        'pedidos_por_estado': [(etiqueta, estados.get(valor, 0)) for valor, etiqueta in Pedido.ESTADOS],
+        'top_productos': VentaProducto.objects.select_related('producto').order_by('-unidades')[:top],
+        'dias': dias,
+    }
+
+
+def recalcular(lote=5000, progreso=None):
+    """
+    Reconstruye las tablas de resumen desde ``Pedido``/``DetallePedido``
+    recorriendo el histórico por rangos de ``id`` de ``lote`` pedidos.
+    """
+    diarias = defaultdict(lambda: [0, Decimal('0')])
+    estados = defaultdict(int)
+    productos = defaultdict(lambda: [0, Decimal('0')])
+
+    ultimo_id = 0
+    while True:
+        ids = list(Pedido.objects.filter(id__gt=ultimo_id).order_by('id').values_list('id', flat=True)[:lote])
+        if not ids:
+            break
+        pedidos = Pedido.objects.filter(id__gte=ids[0], id__lte=ids[-1])
+        for fila in (pedidos.annotate(dia=TruncDate('fecha'))
+                     .values('dia').annotate(n=Count('id'), total=Sum('total')).order_by()):
+            diarias[fila['dia']][0] += fila['n']
+            diarias[fila['dia']][1] += fila['total']
+        for fila in pedidos.values('estado').annotate(n=Count('id')).order_by():
+            estados[fila['estado']] += fila['n']
+        for fila in (DetallePedido.objects.filter(pedido_id__gte=ids[0], pedido_id__lte=ids[-1])
+                     .values('producto_id').annotate(u=Sum('cantidad'), i=Sum('subtotal')).order_by()):
+            productos[fila['producto_id']][0] += fila['u']
+            productos[fila['producto_id']][1] += fila['i']
+        ultimo_id = ids[-1]
+        if progreso:
+            progreso(ultimo_id)
+
+    with transaction.atomic():
+        VentaDiaria.objects.all().delete()
+        ConteoEstadoPedido.objects.all().delete()
+        VentaProducto.objects.all().delete()
+        VentaDiaria.objects.bulk_create(
+            [VentaDiaria(fecha=f, pedidos=n, ingresos=i) for f, (n, i) in diarias.items()], batch_size=1000)
+        ConteoEstadoPedido.objects.bulk_create(
+            [ConteoEstadoPedido(estado=e, cantidad=n) for e, n in estados.items()])
+        VentaProducto.objects.bulk_create(
+            [VentaProducto(producto_id=p, unidades=u, ingresos=i) for p, (u, i) in productos.items()], batch_size=1000)
+    return len(diarias), len(estados), len(productos)
@@ -0,0 +1,144 @@
+"""
+Índice de búsqueda de texto completo para el catálogo.
+
+En SQLite se usa una tabla virtual FTS5 de contenido externo sobre
+``core_producto`` (columnas ``nombre`` y ``descripcion``) con el tokenizador
+``trigram``: así ``MATCH`` encuentra subcadenas igual que el antiguo
+``icontains``, pero usando el índice invertido. La tabla se mantiene al día
+con triggers, por lo que cualquier alta, edición o borrado de productos
+(vistas, admin, cascadas, ``bulk_*``) queda reflejado sin código extra.
+
+En otros motores, o con consultas de menos de 3 caracteres (que el
+tokenizador trigram no puede indexar), se vuelve al filtro ``icontains``.
+"""
+from asgiref.sync import sync_to_async
+from django.db import connections
+from django.db.models import F, FloatField, Q, Value
+
+FTS_TABLE = 'core_producto_fts'
+# El tokenizador trigram existe desde SQLite 3.34.
+TRIGRAM_MIN_VERSION = (3, 34, 0)
+MIN_QUERY_LEN = 3
+
+_CREATE_TABLE = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+    nombre, descripcion,
+    content='core_producto', content_rowid='id',
+    tokenize='trigram'
+)
+"""
+
+_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON core_producto BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, nombre, descripcion)
+        VALUES (new.id, new.nombre, new.descripcion);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON core_producto BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, nombre, descripcion)
+        VALUES ('delete', old.id, old.nombre, old.descripcion);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF nombre, descripcion ON core_producto BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, nombre, descripcion)
+        VALUES ('delete', old.id, old.nombre, old.descripcion);
+        INSERT INTO {FTS_TABLE}(rowid, nombre, descripcion)
+        VALUES (new.id, new.nombre, new.descripcion);
+    END
+    """,
+]
+
+# Caché por alias de si el índice existe, para no consultar sqlite_master en cada búsqueda.
+_disponible = {}
+
+
+def soportado(using='default'):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    import sqlite3
+    return sqlite3.sqlite_version_info >= TRIGRAM_MIN_VERSION
+
+
+def _existe_tabla(cursor):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+    return cursor.fetchone() is not None
+
+
+def asegurar_indice(using='default'):
+    """
+    Crea la tabla FTS y sus triggers si faltan. Es idempotente; se llama tras
+    cada ``migrate`` porque SQLite borra los triggers cuando Django reconstruye
+    ``core_producto`` al alterar columnas.
+    """
+    if not soportado(using):
+        return False
+    with connections[using].cursor() as cursor:
+        if not _existe_tabla(cursor):
+            # ¿Todavía no se migró Producto? (p. ej. migrate parcial)
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'core_producto'")
+            if cursor.fetchone() is None:
+                return False
+            cursor.execute(_CREATE_TABLE)
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        for sql in _TRIGGERS:
+            cursor.execute(sql)
+    _disponible[using] = True
+    return True
+
+
+def eliminar_indice(using='default'):
+    if connections[using].vendor != 'sqlite':
+        return
+    with connections[using].cursor() as cursor:
+        for sufijo in ('ai', 'ad', 'au'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{sufijo}')
+        cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    _disponible.pop(using, None)
+
+
+def reconstruir_indice(using='default'):
+    """Regenera por completo el índice a partir de ``core_producto``."""
+    if not asegurar_indice(using):
+        return False
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+    return True
+
+
+def indice_disponible(using='default'):
+    if using not in _disponible:
+        if not soportado(using):
+            _disponible[using] = False
+        else:
+            with connections[using].cursor() as cursor:
+                _disponible[using] = _existe_tabla(cursor)
+    return _disponible[using]
+
+
+async def aindice_disponible(using='default'):
+    if using not in _disponible:
+        await sync_to_async(indice_disponible)(using)
+    return _disponible[using]
+
+
+def _expresion_fts(query):
+    # Una sola frase entre comillas: con trigram equivale a buscar la subcadena
+    # completa, como hacía icontains. Las comillas internas se duplican.
+    return '"' + query.replace('"', '""') + '"'
+
+
+def buscar_productos(productos, query):
+    """
+    Filtra ``productos`` por ``query`` y anota ``relevancia`` (bm25: menor es
+    más relevante). Devuelve el queryset sin ordenar; quien llama decide el orden.
+    """
+    if len(query) >= MIN_QUERY_LEN and indice_disponible(productos.db):
+        return productos.filter(busqueda__contenido__match=_expresion_fts(query)) \
+                        .annotate(relevancia=F('busqueda__rank'))
+    return productos.filter(Q(nombre__icontains=query) | Q(descripcion__icontains=query)) \
+                    .annotate(relevancia=Value(0.0, output_field=FloatField()))
@@ -0,0 +1,74 @@
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import cart, catalog_cache, reservations
+from .storage import liberar_si_huerfana
+from .models import Categoria, Producto
+
+
+@receiver(pre_save, sender=Producto)
+def _recordar_valores_anteriores(sender, instance, **kwargs):
+    # Si el producto cambia de categoría hay que invalidar también la anterior,
+    # y si cambia de imagen la antigua puede haber quedado huérfana.
+    instance._categoria_anterior_id = instance._imagen_anterior = None
+    if instance.pk:
+        anterior = Producto.objects.filter(pk=instance.pk).values_list('categoria_id', 'imagen').first()
+        if anterior:
+            instance._categoria_anterior_id, instance._imagen_anterior = anterior
+
+
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+def _invalidar_producto(sender, instance, **kwargs):
+    claves = {catalog_cache.VERSION_PRODUCTOS, catalog_cache.version_categoria(instance.categoria_id)}
+    anterior = getattr(instance, '_categoria_anterior_id', None)
+    if anterior:
+        claves.add(catalog_cache.version_categoria(anterior))
+    catalog_cache.incrementar(*claves)
+
+
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+def _invalidar_categoria(sender, instance, **kwargs):
+    # El nombre de la categoría aparece en el desplegable y en cada fila de producto.
+    catalog_cache.incrementar(
+        catalog_cache.VERSION_CATEGORIAS,
+        catalog_cache.VERSION_PRODUCTOS,
+        catalog_cache.version_categoria(instance.pk),
+    )
+
+
+@receiver(post_save, sender=Producto)
+def _liberar_imagen_reemplazada(sender, instance, **kwargs):
+    anterior = getattr(instance, '_imagen_anterior', None)
+    if anterior and anterior != instance.imagen.name:
+        transaction.on_commit(lambda: liberar_si_huerfana(anterior))
+
+
+@receiver(post_delete, sender=Producto)
+def _liberar_imagen_borrada(sender, instance, **kwargs):
+    nombre = instance.imagen.name
+    if nombre:
+        transaction.on_commit(lambda: liberar_si_huerfana(nombre))
+
+
+@receiver(user_logged_in)
+def _fusionar_carrito(sender, request, user, **kwargs):
+    carrito = getattr(request, 'carrito', None)
+    if carrito is None:
+        return
+    titular_anterior = carrito.fusionar(user)
+    if titular_anterior and titular_anterior != carrito.titular:
+        # Las reservas del carrito anónimo pasan al de la cuenta; si ya no hay
+        # stock para todo, se vuelve a comprobar al confirmar el pedido.
+        reservations.liberar(titular_anterior)
+        reservations.reservar(carrito.titular, cart.cantidades(carrito.lineas))
+
+
+@receiver(user_logged_out)
+def _cerrar_carrito(sender, request, user, **kwargs):
+    carrito = getattr(request, 'carrito', None)
+    if carrito is not None:
+        carrito.cerrar_sesion()
@@ -0,0 +1,92 @@
+"""
+Almacenamiento direccionado por contenido para las imágenes de producto.
+
+Cada subida se escribe en streaming a un temporal mientras se calcula su
+SHA-256, y se guarda una sola vez como ``productos/<h[:2]>/<sha256><ext>``. Si
+ese blob ya existe, la subida se descarta y el producto apunta al existente,
+así que volver a subir la misma foto no ocupa más disco.
+
+El recuento de referencias es el número de ``Producto`` cuyo campo ``imagen``
+apunta al blob (columna indexada); cuando llega a cero se borran el blob y sus
+miniaturas (ver ``liberar_si_huerfana`` y ``core.signals``).
+
+Como el nombre cambia si cambia el contenido, estas URLs pueden servirse con
+``Cache-Control: public, max-age=31536000, immutable``.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    algoritmo = 'sha256'
+
+    def get_available_name(self, name, max_length=None):
+        # El nombre definitivo lo decide _save a partir del contenido.
+        return name
+
+    def _save(self, name, content):
+        directorio, base = os.path.split(name)
+        ext = os.path.splitext(base)[1].lower()
+        tmp_dir = self.path(os.path.join(directorio, '.tmp'))
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        digest = hashlib.new(self.algoritmo)
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    tmp.write(chunk)
+
+            h = digest.hexdigest()
+            final = os.path.join(directorio, h[:2], h + ext).replace('\\', '/')
+            final_path = self.path(final)
+            if os.path.exists(final_path):
+                os.unlink(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(tmp_path, self.file_permissions_mode)
+                os.replace(tmp_path, final_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return final
+
+
+def es_nombre_por_contenido(nombre):
+    directorio, base = os.path.split(nombre)
+    h = os.path.splitext(base)[0]
+    return len(h) == 64 and os.path.basename(directorio) == h[:2] and all(c in '0123456789abcdef' for c in h)
+
+
+_producto_storage = ContentAddressedStorage()
+
+
+def producto_storage():
+    return _producto_storage
+
+
+def liberar_si_huerfana(nombre):
+    """Borra el blob ``nombre`` y sus miniaturas si ningún producto lo usa ya."""
+    from django.conf import settings
+
+    from .images import nombres_variantes
+    from .models import Producto
+
+    if not nombre or Producto.objects.filter(imagen=nombre).exists():
+        return False
+    storage = Producto._meta.get_field('imagen').storage
+    for ancho in settings.PRODUCTO_MINIATURAS_ANCHOS:
+        for variante in nombres_variantes(nombre, ancho):
+            storage.delete(variante)
+    storage.delete(nombre)
+    return True
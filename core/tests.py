@@ -1,3 +1,1162 @@
-from django.test import TestCase
+"""
+Presupuesto de consultas y latencia de las vistas de ``core``.
 
-# Create your tests here.
+Cada prueba siembra un conjunto de datos de tamaño realista, hace una petición
+en frío (caché vacía) contando las consultas SQL y falla si supera el
+presupuesto de ``PRESUPUESTOS``.
+
+La latencia depende de la máquina y de su carga, así que solo se mide si se
+pide: con ``BENCHMARK=1`` cada petición se repite ``REPETICIONES`` veces y la
+mediana se compara con ``benchmark_baseline.json``.
+
+Variables de entorno:
+
+* ``BENCHMARK=1``: mide y compara también la latencia.
+* ``BENCH_ACTUALIZAR=1``: mide la latencia y reescribe la línea base con las
+  medidas de esta ejecución en lugar de compararlas (tras un cambio de
+  rendimiento intencionado o en una máquina nueva).
+* ``BENCH_UMBRAL``: margen relativo admitido sobre la mediana de la línea base
+  (por defecto ``0.5``, es decir, un 50 % más lenta), más ``BENCH_HOLGURA_MS``
+  milisegundos absolutos (por defecto ``5``) para absorber el ruido de vistas
+  muy rápidas.
+
+Las clases del final del módulo no miden nada: prueban comportamientos
+concretos (concurrencia, invalidación de cachés, límites...).
+"""
+import csv
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import date, timedelta
+from importlib import import_module
+from decimal import Decimal
+from pathlib import Path
+from time import perf_counter
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.hashers import MD5PasswordHasher, make_password
+from django.contrib.auth.middleware import auser
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, OperationalError, connection, connections, transaction
+from django.db.models import Sum
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import audit, cart, catalog_io, facets, images, metrics, order_export, reservations, sales, search
+from .cart_storage import CookieCarrito
+from .pagination import codificar_cursor
+from .storage import es_nombre_por_contenido
+from .models import (
+    AdminUser, Categoria, Cliente, ConteoEstadoPedido, DetallePedido, HistorialCliente, Pedido, Producto,
+    ReservaStock,
+)
+
+BASELINE = Path(__file__).with_name('benchmark_baseline.json')
+REPETICIONES = 15
+
+N_CATEGORIAS = 20
+N_PRODUCTOS = 2000
+N_CLIENTES = 300
+N_PEDIDOS = 3000
+LINEAS_POR_PEDIDO = 3
+N_HISTORIAL = 6000
+
+# Consultas máximas de la primera petición (caché en frío). No deben depender
+# del tamaño de los datos: si una vista empieza a consultar por fila, se pasa.
+PRESUPUESTOS = {
+    'home': 0,
+    'catalogo': 3,
+    'catalogo_categoria': 3,
+    'catalogo_busqueda': 3,
+    'catalogo_cursor': 3,
+    'catalogo_facetas': 3,
+    'ver_carrito': 3,
+    'agregar_al_carrito': 9,
+    'eliminar_del_carrito': 3,
+    'confirmar_pedido_get': 9,
+    'confirmar_pedido_post': 16,
+    'mis_pedidos': 5,
+    'editar_perfil': 2,
+    'api_productos': 2,
+    'api_productos_304': 1,
+    'api_categorias': 2,
+    'login_unificado': 0,
+    'registro_cliente': 0,
+    'admin_dashboard': 4,
+    'metricas': 1,
+    'categorias_list': 2,
+    'categoria_edit': 2,
+    'productos_list': 2,
+    'producto_edit': 4,
+    'pedidos_list': 2,
+    'pedidos_list_filtrado': 3,
+    'pedido_detalle': 3,
+    'pedidos_exportar': 6,
+    'clientes_list': 2,
+    'cliente_historial': 3,
+}
+
+
+def _cargar_baseline():
+    try:
+        return json.loads(BASELINE.read_text())
+    except FileNotFoundError:
+        return {}
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, round(p / 100 * (len(ordenados) - 1)))]
+
+
+@override_settings(
+    AUDITORIA_FLUSH_SECONDS=3600,
+    CARRITO_BACKEND='core.cart_storage.CookieCarrito',
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    # El alias de lectura es un espejo de test sin la transacción del TestCase:
+    # no vería los datos de setUpTestData. Se mide todo sobre default.
+    BASE_DATOS_LECTURA=None,
+)
+@mock.patch('core.audit.registrar')
+class BenchmarkVistasTests(TestCase):
+    actualizar = os.environ.get('BENCH_ACTUALIZAR') == '1'
+    latencia = actualizar or os.environ.get('BENCHMARK') == '1'
+    umbral = float(os.environ.get('BENCH_UMBRAL', '0.5'))
+    holgura = float(os.environ.get('BENCH_HOLGURA_MS', '5')) / 1000
+    medidas = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = AdminUser.objects.create(username='admin', password=make_password('admin'))
+
+        categorias = Categoria.objects.bulk_create(
+            [Categoria(nombre=f'Categoría {i}') for i in range(N_CATEGORIAS)])
+        cls.productos = Producto.objects.bulk_create([
+            Producto(nombre=f'Producto {i} {("rojo", "azul", "verde")[i % 3]}',
+                     descripcion=f'Descripción del producto {i}',
+                     precio=Decimal(5 + i % 200), stock=10_000,
+                     categoria=categorias[i % N_CATEGORIAS])
+            for i in range(N_PRODUCTOS)
+        ], batch_size=500)
+        cls.categoria = categorias[0]
+
+        hash_ = make_password('clave-cliente')
+        clientes = Cliente.objects.bulk_create([
+            Cliente(username=f'cliente{i:04d}', email=f'cliente{i}@example.com', password=hash_,
+                    direccion=f'Calle {i}')
+            for i in range(N_CLIENTES)
+        ], batch_size=500)
+        cls.cliente = clientes[0]
+
+        ahora = timezone.now()
+        pedidos = Pedido.objects.bulk_create([
+            Pedido(cliente=clientes[i % N_CLIENTES], nombre_cliente=clientes[i % N_CLIENTES].username,
+                   correo=clientes[i % N_CLIENTES].email, direccion='Calle', total=Decimal('30.00'),
+                   estado=[e for e, _ in Pedido.ESTADOS][i % len(Pedido.ESTADOS)])
+            for i in range(N_PEDIDOS)
+        ], batch_size=500)
+        # auto_now_add ignora el valor dado: se reparten las fechas después.
+        for i, pedido in enumerate(pedidos):
+            pedido.fecha = ahora - timedelta(minutes=i * 7)
+        Pedido.objects.bulk_update(pedidos, ['fecha'], batch_size=500)
+        DetallePedido.objects.bulk_create([
+            DetallePedido(pedido=pedido, producto=cls.productos[(i * LINEAS_POR_PEDIDO + j) % N_PRODUCTOS],
+                          cantidad=1, subtotal=Decimal('10.00'))
+            for i, pedido in enumerate(pedidos) for j in range(LINEAS_POR_PEDIDO)
+        ], batch_size=1000)
+        cls.pedido = pedidos[0]
+
+        HistorialCliente.objects.bulk_create([
+            HistorialCliente(nombre=clientes[i % N_CLIENTES].username, correo=clientes[i % N_CLIENTES].email,
+                             accion='login', fecha=ahora - timedelta(minutes=i))
+            for i in range(N_HISTORIAL)
+        ], batch_size=1000)
+        sales.recalcular()
+
+        cls.baseline = _cargar_baseline()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if cls.actualizar and cls.medidas:
+            datos = {**_cargar_baseline(), **cls.medidas}
+            BASELINE.write_text(json.dumps(dict(sorted(datos.items())), indent=2) + '\n')
+
+    def setUp(self):
+        cache.clear()
+
+    # ----- utilidades -----
+
+    def como_admin(self):
+        session = self.client.session
+        session['admin_id'] = self.admin.id
+        session.save()
+
+    def como_cliente(self, carrito=None):
+        self.client.force_login(self.cliente)
+        if carrito is not None:
+            self.con_carrito(carrito)
+
+    def con_carrito(self, carrito):
+        self.client.cookies[settings.CARRITO_COOKIE_NAME] = CookieCarrito.codificar({
+            'titular': 'benchmark',
+            'lineas': {str(pid): cantidad for pid, cantidad in carrito.items()},
+        })
+
+    def medir(self, nombre, peticion, preparar=None):
+        """Comprueba el presupuesto de consultas de ``peticion`` y, con ``BENCHMARK=1``, su latencia."""
+        if preparar:
+            preparar()
+        with CaptureQueriesContext(connection) as capturadas:
+            response = peticion()
+        # Se copian ya: el registro de consultas de la conexión es circular.
+        consultas = [q['sql'] for q in capturadas.captured_queries]
+        self.assertLess(response.status_code, 400, f'{nombre}: respuesta {response.status_code}')
+        self.assertLessEqual(
+            len(consultas), PRESUPUESTOS[nombre],
+            f'{nombre}: {len(consultas)} consultas, presupuesto {PRESUPUESTOS[nombre]}:\n' + '\n'.join(consultas))
+        if not self.latencia:
+            return response
+
+        tiempos = []
+        for _ in range(REPETICIONES):
+            if preparar:
+                preparar()
+            inicio = perf_counter()
+            peticion()
+            tiempos.append(perf_counter() - inicio)
+
+        p50, p95 = _percentil(tiempos, 50), _percentil(tiempos, 95)
+        self.medidas[nombre] = {'consultas': len(consultas), 'p50_ms': round(p50 * 1000, 3),
+                                'p95_ms': round(p95 * 1000, 3)}
+        base = self.baseline.get(nombre)
+        if base and not self.actualizar:
+            limite = base['p50_ms'] / 1000 * (1 + self.umbral) + self.holgura
+            self.assertLessEqual(
+                p50, limite,
+                f'{nombre}: mediana {p50 * 1000:.1f} ms, línea base {base["p50_ms"]:.1f} ms '
+                f'(límite {limite * 1000:.1f} ms)')
+        return response
+
+    # ----- páginas públicas -----
+
+    def test_home(self, _):
+        self.medir('home', lambda: self.client.get(reverse('home')))
+
+    def test_catalogo(self, _):
+        self.medir('catalogo', lambda: self.client.get(reverse('catalogo')))
+
+    def test_catalogo_categoria(self, _):
+        self.medir('catalogo_categoria',
+                   lambda: self.client.get(reverse('catalogo'), {'categoria': self.categoria.id}))
+
+    def test_catalogo_busqueda(self, _):
+        self.medir('catalogo_busqueda', lambda: self.client.get(reverse('catalogo'), {'q': 'azul'}))
+
+    def test_catalogo_cursor(self, _):
+        cursor = codificar_cursor([self.productos[49].id])
+        self.medir('catalogo_cursor', lambda: self.client.get(reverse('catalogo'), {'cursor': cursor}))
+
+    def test_catalogo_facetas(self, _):
+        filtros = {'categoria': self.categoria.id, 'precio_min': '20', 'precio_max': '120',
+                   'en_stock': '1', 'orden': '-precio'}
+        response = self.medir('catalogo_facetas', lambda: self.client.get(reverse('catalogo'), filtros))
+        self.assertContains(response, f'Todas las categorías ({N_PRODUCTOS // 200 * 101})')
+
+    def test_api_productos(self, _):
+        response = self.medir('api_productos', lambda: self.client.get(reverse('api_productos')))
+        etag = response.headers['ETag']
+        response = self.medir('api_productos_304',
+                              lambda: self.client.get(reverse('api_productos'), HTTP_IF_NONE_MATCH=etag))
+        self.assertEqual(response.status_code, 304)
+        self.medir('api_categorias', lambda: self.client.get(reverse('api_categorias')))
+
+    def test_login_y_registro(self, _):
+        self.medir('login_unificado', lambda: self.client.get(reverse('login_unificado')))
+        self.medir('registro_cliente', lambda: self.client.get(reverse('registro_cliente')))
+
+    # ----- carrito y pedido -----
+
+    def _carrito(self, n=10):
+        return {p.id: 2 for p in self.productos[:n]}
+
+    def test_ver_carrito(self, _):
+        self.como_cliente(self._carrito())
+        response = self.medir('ver_carrito', lambda: self.client.get(reverse('ver_carrito')))
+        self.assertEqual(len(response.context['productos']), 10)
+
+    def test_agregar_al_carrito(self, _):
+        self.como_cliente(self._carrito())
+        producto = self.productos[100]
+        self.medir('agregar_al_carrito',
+                   lambda: self.client.post(reverse('agregar_al_carrito', args=[producto.id]),
+                                            HTTP_ACCEPT='application/json'))
+
+    def test_eliminar_del_carrito(self, _):
+        self.como_cliente()
+        producto = self.productos[100]
+        self.medir('eliminar_del_carrito',
+                   lambda: self.client.post(reverse('eliminar_del_carrito', args=[producto.id])),
+                   preparar=lambda: self.con_carrito({**self._carrito(), producto.id: 1}))
+
+    def test_confirmar_pedido(self, _):
+        self.como_cliente(self._carrito())
+        self.medir('confirmar_pedido_get', lambda: self.client.get(reverse('confirmar_pedido')))
+        antes = Pedido.objects.count()
+        self.medir('confirmar_pedido_post', lambda: self.client.post(reverse('confirmar_pedido')),
+                   preparar=lambda: self.con_carrito(self._carrito()))
+        self.assertEqual(Pedido.objects.count(), antes + 1 + (REPETICIONES if self.latencia else 0))
+
+    def test_mis_pedidos(self, _):
+        self.como_cliente()
+        response = self.medir('mis_pedidos', lambda: self.client.get(reverse('mis_pedidos')))
+        self.assertEqual(len(response.context['pedidos']), N_PEDIDOS // N_CLIENTES)
+
+    def test_editar_perfil(self, _):
+        self.como_cliente()
+        self.medir('editar_perfil', lambda: self.client.get(reverse('editar_perfil')))
+
+    # ----- panel de administración -----
+
+    def test_admin_dashboard(self, _):
+        self.como_admin()
+        self.medir('admin_dashboard', lambda: self.client.get(reverse('admin_dashboard')))
+
+    def test_metricas(self, _):
+        self.como_admin()
+        self.medir('metricas', lambda: self.client.get(reverse('metricas')))
+
+    def test_categorias(self, _):
+        self.como_admin()
+        self.medir('categorias_list', lambda: self.client.get(reverse('categorias_list')))
+        self.medir('categoria_edit', lambda: self.client.get(reverse('categoria_edit', args=[self.categoria.id])))
+
+    def test_productos(self, _):
+        self.como_admin()
+        self.medir('productos_list', lambda: self.client.get(reverse('productos_list')))
+        self.medir('producto_edit', lambda: self.client.get(reverse('producto_edit', args=[self.productos[0].id])))
+
+    def test_pedidos_list(self, _):
+        self.como_admin()
+        self.medir('pedidos_list', lambda: self.client.get(reverse('pedidos_list')))
+        self.medir('pedidos_list_filtrado', lambda: self.client.get(reverse('pedidos_list'), {
+            'estado': 'en_proceso', 'cliente': self.cliente.username,
+            'desde': (timezone.localdate() - timedelta(days=30)).isoformat(),
+        }))
+
+    def test_pedidos_exportar(self, _):
+        self.como_admin()
+        contenido = {}
+
+        def exportar():
+            response = self.client.get(reverse('pedidos_exportar'))
+            contenido['csv'] = b''.join(response.streaming_content)
+            return response
+
+        self.medir('pedidos_exportar', exportar)
+        self.assertEqual(contenido['csv'].count(b'\n'), 1 + N_PEDIDOS * LINEAS_POR_PEDIDO)
+
+    def test_pedido_detalle(self, _):
+        self.como_admin()
+        response = self.medir('pedido_detalle', lambda: self.client.get(reverse('pedido_detalle', args=[self.pedido.id])))
+        self.assertEqual(len(response.context['detalles']), LINEAS_POR_PEDIDO)
+
+    def test_clientes(self, _):
+        self.como_admin()
+        response = self.medir('clientes_list', lambda: self.client.get(reverse('clientes_list')))
+        self.assertEqual(response.context['clientes'][0].ultima_accion, 'login')
+        self.medir('cliente_historial', lambda: self.client.get(reverse('cliente_historial', args=[self.cliente.id])))
+
+
+# ------------------- COMPORTAMIENTO -------------------
+
+@override_settings(BASE_DATOS_LECTURA=None, CARRITO_BACKEND='core.cart_storage.CookieCarrito')
+class CacheCatalogoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.categoria = Categoria.objects.create(nombre='Iluminación')
+        self.producto = Producto.objects.create(nombre='Lámpara de pie', precio=Decimal('40.00'), stock=3,
+                                                categoria=self.categoria)
+
+    def catalogo(self, **filtros):
+        return self.client.get(reverse('catalogo'), filtros)
+
+    def test_el_fragmento_se_reutiliza(self):
+        self.catalogo()
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.catalogo()
+        self.assertContains(response, 'Lámpara de pie')
+        self.assertEqual([c['sql'] for c in consultas.captured_queries if 'core_producto' in c['sql']], [])
+
+    def test_editar_un_producto_invalida_sus_listados(self):
+        self.catalogo()
+        self.catalogo(categoria=self.categoria.id)
+        self.producto.nombre = 'Lámpara de mesa'
+        self.producto.save()
+        for filtros in ({}, {'categoria': self.categoria.id}):
+            with self.subTest(filtros=filtros):
+                response = self.catalogo(**filtros)
+                self.assertContains(response, 'Lámpara de mesa')
+                self.assertNotContains(response, 'Lámpara de pie')
+
+    def test_cambio_de_categoria_invalida_la_anterior(self):
+        otra = Categoria.objects.create(nombre='Jardín')
+        self.assertContains(self.catalogo(categoria=self.categoria.id), 'Lámpara de pie')
+        self.producto.categoria = otra
+        self.producto.save()
+        self.assertNotContains(self.catalogo(categoria=self.categoria.id), 'Lámpara de pie')
+        self.assertContains(self.catalogo(categoria=otra.id), 'Lámpara de pie')
+
+    def test_cambio_de_stock_invalida_el_filtro_en_stock(self):
+        self.assertContains(self.catalogo(en_stock='1'), 'Lámpara de pie')
+        self.producto.stock = 0
+        self.producto.save()
+        self.assertNotContains(self.catalogo(en_stock='1'), 'Lámpara de pie')
+
+
+class CotizarCarritoTests(TestCase):
+    def setUp(self):
+        categoria = Categoria.objects.create(nombre='Papelería')
+        self.productos = [Producto.objects.create(nombre=f'Cuaderno {i}', precio=Decimal('2.50') * (i + 1),
+                                                  stock=10, categoria=categoria)
+                          for i in range(5)]
+
+    def test_una_consulta_para_todo_el_carrito(self):
+        carrito = {str(p.id): 2 for p in self.productos}
+        with CaptureQueriesContext(connection) as consultas:
+            cotizado = cart.cotizar(carrito)
+        self.assertEqual(len(consultas.captured_queries), 1)
+        self.assertEqual(cotizado.total, sum(p.precio * 2 for p in self.productos))
+        self.assertEqual(cotizado.cantidad_total, 10)
+        self.assertEqual(cotizado.obsoletas, [])
+
+    def test_lineas_obsoletas_e_invalidas(self):
+        borrado = self.productos.pop()
+        borrado_id = borrado.id
+        borrado.delete()
+        carrito = {str(self.productos[0].id): 1, str(borrado_id): 3, 'x': 1, str(self.productos[1].id): 0}
+        cotizado = cart.cotizar(carrito)
+        self.assertEqual([l['id'] for l in cotizado.lineas], [self.productos[0].id])
+        self.assertEqual(cotizado.obsoletas, [borrado_id])
+        self.assertEqual(cotizado.total, self.productos[0].precio)
+        self.assertEqual(async_to_sync(cart.acotizar)(carrito).obsoletas, [borrado_id])
+        self.assertFalse(cart.cotizar({}))
+
+
+def _png(tamano=(800, 600), color='red'):
+    salida = io.BytesIO()
+    Image.new('RGB', tamano, color).save(salida, 'PNG')
+    return salida.getvalue()
+
+
+class ImagenesTestMixin:
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media))
+        self.categoria = Categoria.objects.create(nombre='Fotos')
+
+    def producto(self, nombre_archivo, contenido):
+        return Producto.objects.create(nombre=nombre_archivo, precio=Decimal('1.00'), stock=1,
+                                       categoria=self.categoria,
+                                       imagen=SimpleUploadedFile(nombre_archivo, contenido))
+
+
+@override_settings(PRODUCTO_MINIATURAS_ANCHOS=(100, 200))
+class MiniaturasTests(ImagenesTestMixin, TestCase):
+    def test_variantes_por_ancho_en_formato_original_y_webp(self):
+        producto = self.producto('foto.png', _png())
+        images.actualizar_miniaturas(producto)
+        producto.refresh_from_db()
+
+        self.assertEqual(set(producto.miniaturas), {'100', '200'})
+        storage = producto.imagen.storage
+        for ancho, variante in producto.miniaturas.items():
+            for clave, formato in (('src', 'PNG'), ('webp', 'WEBP')):
+                with Image.open(storage.path(variante[clave])) as img:
+                    self.assertEqual((img.format, img.width, img.height), (formato, int(ancho), int(ancho) * 3 // 4))
+        self.assertIn(f"{storage.url(producto.miniaturas['200']['webp'])} 200w", producto.srcset_webp)
+        self.assertEqual(producto.miniatura_url, storage.url(producto.miniaturas['100']['src']))
+
+
+@override_settings(PRODUCTO_MINIATURAS_ANCHOS=(100,))
+class AlmacenamientoPorContenidoTests(ImagenesTestMixin, TestCase):
+    def archivos(self):
+        return sorted(os.path.relpath(os.path.join(raiz, f), self.media).replace(os.sep, '/')
+                      for raiz, _, nombres in os.walk(self.media) for f in nombres)
+
+    def test_misma_imagen_se_guarda_una_vez(self):
+        contenido = _png()
+        h = hashlib.sha256(contenido).hexdigest()
+        a = self.producto('foto.PNG', contenido)
+        b = self.producto('otra-foto.png', contenido)
+        c = self.producto('distinta.png', _png(color='blue'))
+
+        self.assertEqual(a.imagen.name, f'productos/{h[:2]}/{h}.png')
+        self.assertEqual(b.imagen.name, a.imagen.name)
+        self.assertNotEqual(c.imagen.name, a.imagen.name)
+        self.assertTrue(es_nombre_por_contenido(a.imagen.name))
+        self.assertEqual(self.archivos(), sorted([a.imagen.name, c.imagen.name]))
+
+    def test_el_blob_se_borra_con_el_ultimo_producto_que_lo_usa(self):
+        contenido = _png()
+        a = self.producto('foto.png', contenido)
+        b = self.producto('foto.png', contenido)
+        variantes = images.nombres_variantes(a.imagen.name, 100)
+        for variante in variantes:
+            # Directamente en disco: storage.save() le daría un nombre por contenido.
+            Path(a.imagen.storage.path(variante)).write_bytes(b'variante')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            a.delete()
+        self.assertEqual(self.archivos(), sorted([b.imagen.name, *variantes]))
+        with self.captureOnCommitCallbacks(execute=True):
+            b.delete()
+        self.assertEqual(self.archivos(), [])
+
+    def test_reemplazar_la_imagen_libera_la_anterior(self):
+        producto = self.producto('foto.png', _png())
+        anterior = producto.imagen.name
+        producto.imagen = SimpleUploadedFile('nueva.png', _png(color='green'))
+        with self.captureOnCommitCallbacks(execute=True):
+            producto.save()
+        self.assertEqual(self.archivos(), [producto.imagen.name])
+        self.assertNotEqual(producto.imagen.name, anterior)
+
+
+@override_settings(BASE_DATOS_LECTURA=None, PEDIDOS_PAGE_SIZE=3)
+class ListadoPedidosTests(TestCase):
+    def setUp(self):
+        admin = AdminUser.objects.create(username='admin', password=make_password('admin'))
+        session = self.client.session
+        session['admin_id'] = admin.id
+        session.save()
+        self.ana = Cliente.objects.create(username='ana', email='ana@example.com')
+        self.hoy = timezone.localdate()
+        self.pedidos = []
+        for i in range(8):
+            pedido = Pedido.objects.create(cliente=self.ana if i % 2 else None,
+                                           nombre_cliente='ana' if i % 2 else 'borrado', correo='x@example.com',
+                                           direccion='Calle', total=Decimal('5.00'),
+                                           estado='finalizado' if i % 3 == 0 else 'pendiente')
+            # auto_now_add ignora el valor dado; un pedido por día hacia atrás, dos el día de hoy.
+            Pedido.objects.filter(id=pedido.id).update(fecha=timezone.now() - timedelta(days=max(i - 1, 0)))
+            self.pedidos.append(pedido)
+
+    def ids(self, **filtros):
+        ids, cursor = [], None
+        while True:
+            response = self.client.get(reverse('pedidos_list'), {**filtros, **({'cursor': cursor} if cursor else {})})
+            pagina = response.context['pagina']
+            self.assertLessEqual(len(pagina), 3)
+            ids += [p.id for p in pagina]
+            if not pagina.tiene_siguiente:
+                return ids
+            cursor = pagina.siguiente
+
+    def test_paginacion_por_clave_sin_huecos_ni_repetidos(self):
+        esperados = list(Pedido.objects.order_by('-fecha', '-id').values_list('id', flat=True))
+        self.assertEqual(self.ids(), esperados)
+
+    def test_filtros(self):
+        def ids(qs):
+            return list(qs.order_by('-fecha', '-id').values_list('id', flat=True))
+
+        self.assertEqual(self.ids(estado='finalizado'), ids(Pedido.objects.filter(estado='finalizado')))
+        self.assertEqual(self.ids(cliente='ana@example.com'), ids(Pedido.objects.filter(cliente=self.ana)))
+        self.assertEqual(self.ids(cliente='borrado'), ids(Pedido.objects.filter(cliente__isnull=True)))
+        ayer = (self.hoy - timedelta(days=1)).isoformat()
+        self.assertEqual(len(self.ids(desde=ayer)), 3)
+        self.assertEqual(len(self.ids(hasta=ayer)), 6)
+        self.assertEqual(len(self.ids(desde=ayer, hasta=ayer)), 1)
+        self.assertEqual(len(self.ids(desde='no-es-fecha')), 8)
+
+
+@override_settings(AUDITORIA_BUFFER_SIZE=3, AUDITORIA_FLUSH_SECONDS=3600)
+class AuditoriaDiferidaTests(TestCase):
+    def setUp(self):
+        audit.flush()
+        self.addCleanup(audit.flush)
+
+    def test_se_escribe_en_un_lote_al_llenarse_el_buffer(self):
+        audit.registrar('ana', 'ana@example.com', 'login')
+        audit.registrar('ana', None, 'perfil_editado')
+        self.assertEqual((HistorialCliente.objects.count(), audit.pendientes()), (0, 2))
+
+        # TestCase abre una transacción: la escritura llega con el on_commit.
+        with CaptureQueriesContext(connection) as consultas, self.captureOnCommitCallbacks(execute=True):
+            audit.registrar('ana', 'ana@example.com', 'logout')
+        self.assertEqual(len(consultas.captured_queries), 1)
+        self.assertEqual(audit.pendientes(), 0)
+        self.assertEqual(list(HistorialCliente.objects.order_by('id').values_list('accion', 'correo')),
+                         [('login', 'ana@example.com'), ('perfil_editado', ''), ('logout', 'ana@example.com')])
+
+    def test_inmediato_dentro_de_una_transaccion_espera_al_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                audit.registrar('ana', 'ana@example.com', 'bloqueado', inmediato=True)
+                self.assertEqual(HistorialCliente.objects.count(), 0)
+        self.assertEqual(HistorialCliente.objects.count(), 1)
+
+    def test_un_fallo_al_escribir_devuelve_los_eventos_al_buffer(self):
+        audit.registrar('ana', 'ana@example.com', 'login')
+        with mock.patch.object(HistorialCliente.objects, 'bulk_create', side_effect=DatabaseError), \
+                self.assertLogs('core.audit', 'ERROR'):
+            self.assertEqual(audit.flush(), 0)
+        self.assertEqual(audit.pendientes(), 1)
+        self.assertEqual(audit.flush(), 1)
+        self.assertEqual(HistorialCliente.objects.count(), 1)
+
+    def test_purgar_historial_respeta_la_retencion(self):
+        ahora = timezone.now()
+        HistorialCliente.objects.bulk_create([
+            HistorialCliente(nombre='ana', accion='login', fecha=ahora - timedelta(days=dias))
+            for dias in (1, 29, 31, 400)
+        ])
+        call_command('purgar_historial', dias=30, lote=1, stdout=io.StringIO())
+        self.assertEqual(HistorialCliente.objects.count(), 2)
+        self.assertFalse(HistorialCliente.objects.filter(fecha__lt=ahora - timedelta(days=30)).exists())
+
+
+@override_settings(BASE_DATOS_LECTURA=None)
+class MetricasTests(TestCase):
+    def setUp(self):
+        metrics.agregador.reiniciar()
+        self.addCleanup(metrics.agregador.reiniciar)
+        Categoria.objects.create(nombre='Métricas')
+
+    def test_agrega_por_nombre_de_ruta(self):
+        etag = self.client.get(reverse('api_categorias'))['ETag']
+        consultas = metrics.agregador.instantanea()['api_categorias']['consultas']
+        self.assertGreater(consultas, 1)
+        # El 304 solo hace la consulta de agregación.
+        self.client.get(reverse('api_categorias'), headers={'if_none_match': etag})
+        self.client.get(reverse('api_producto', args=[0]))
+        self.client.get(reverse('api_producto', args=[12345]))
+        self.client.get('/no-existe/')
+
+        series = metrics.agregador.instantanea()
+        self.assertEqual(series['api_categorias']['peticiones'], 2)
+        self.assertEqual(series['api_categorias']['consultas'], consultas + 1)
+        self.assertEqual(series['api_categorias']['estados'], {'2xx': 1, '3xx': 1})
+        self.assertEqual(series['api_producto']['estados'], {'4xx': 2})
+        self.assertEqual(series[metrics.SIN_RUTA]['estados'], {'4xx': 1})
+
+    def test_exportacion_prometheus(self):
+        self.client.get(reverse('api_categorias'))
+        texto = metrics.exportar()
+        self.assertIn('caicai_view_requests_total{view="api_categorias",status="2xx"} 1', texto)
+        self.assertIn('caicai_view_latency_seconds_bucket{view="api_categorias",le="+Inf"} 1', texto)
+        self.assertIn('caicai_view_latency_seconds_count{view="api_categorias"} 1', texto)
+
+    def test_solo_para_el_admin(self):
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, 302)
+        admin = AdminUser.objects.create(username='admin', password=make_password('admin'))
+        session = self.client.session
+        session['admin_id'] = admin.id
+        session.save()
+        response = self.client.get(reverse('metricas'))
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        self.assertContains(response, '# TYPE caicai_view_latency_seconds histogram')
+
+
+@override_settings(BASE_DATOS_LECTURA=None, PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+@mock.patch('core.audit.registrar')
+class AlmacenamientoCarritoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        categoria = Categoria.objects.create(nombre='Carrito')
+        self.producto = Producto.objects.create(nombre='Tetera', precio=Decimal('15.00'), stock=10,
+                                                categoria=categoria)
+        Cliente.objects.create(username='ana', email='ana@example.com', password=make_password('clave'))
+
+    def agregar(self, client=None, cantidad=1):
+        return (client or self.client).post(reverse('agregar_al_carrito', args=[self.producto.id]),
+                                            {'cantidad': cantidad}, HTTP_ACCEPT='application/json')
+
+    def en_carrito(self):
+        response = self.client.get(reverse('ver_carrito'))
+        return {linea['id']: linea['cantidad'] for linea in response.context['productos']}
+
+    @override_settings(CARRITO_BACKEND='core.cart_storage.CookieCarrito')
+    def test_cookie_sin_escrituras_en_la_sesion(self, _):
+        self.agregar(cantidad=2)
+        self.agregar()
+        self.assertEqual(self.en_carrito(), {self.producto.id: 3})
+        self.assertFalse(Session.objects.exists())
+
+        # Una cookie manipulada se descarta.
+        cookie = self.client.cookies[settings.CARRITO_COOKIE_NAME]
+        cookie.set(cookie.key, cookie.value + 'x', cookie.coded_value + 'x')
+        self.assertEqual(self.en_carrito(), {})
+
+    @override_settings(CARRITO_BACKEND='core.cart_storage.CacheCarrito')
+    def test_cache_fusiona_al_iniciar_sesion_y_se_comparte_entre_dispositivos(self, _):
+        self.agregar(cantidad=2)
+        self.assertFalse(Session.objects.exists())
+        self.client.post(reverse('login_unificado'), {'username': 'ana', 'password': 'clave'})
+        self.assertEqual(self.en_carrito(), {self.producto.id: 2})
+
+        otro = Client()
+        otro.post(reverse('login_unificado'), {'username': 'ana', 'password': 'clave'})
+        self.agregar(otro)
+        self.assertEqual(self.en_carrito(), {self.producto.id: 3})
+        # Las reservas siguieron al carrito de la cuenta.
+        self.assertEqual(ReservaStock.objects.aggregate(total=Sum('cantidad'))['total'], 3)
+
+
+@override_settings(BASE_DATOS_LECTURA=None, CARRITO_BACKEND='core.cart_storage.CookieCarrito')
+@mock.patch('core.audit.registrar')
+class VistasAsgiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        categoria = Categoria.objects.create(nombre='Asíncrona')
+        cls.producto = Producto.objects.create(nombre='Taza azul', precio=Decimal('7.00'), stock=5,
+                                               categoria=categoria)
+        cls.cliente = Cliente.objects.create(username='ana', email='ana@example.com')
+        pedido = Pedido.objects.create(cliente=cls.cliente, nombre_cliente='ana', correo='ana@example.com',
+                                       direccion='Calle', total=Decimal('7.00'))
+        DetallePedido.objects.create(pedido=pedido, producto=cls.producto, cantidad=1, subtotal=Decimal('7.00'))
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_catalogo_y_carrito(self, _):
+        response = await self.async_client.get(reverse('catalogo'), {'q': 'azul'})
+        self.assertContains(response, 'Taza azul')
+
+        response = await self.async_client.post(reverse('agregar_al_carrito', args=[self.producto.id]),
+                                                {'cantidad': 2}, headers={'accept': 'application/json'})
+        self.assertEqual(response.status_code, 200)
+        self.async_client.cookies.update(response.cookies)
+
+        response = await self.async_client.get(reverse('ver_carrito'))
+        self.assertEqual([(l['id'], l['cantidad']) for l in response.context['productos']], [(self.producto.id, 2)])
+
+    async def test_mis_pedidos(self, _):
+        await self.async_client.aforce_login(self.cliente)
+        response = await self.async_client.get(reverse('mis_pedidos'))
+        self.assertEqual(response.status_code, 200)
+        pedidos = response.context['pedidos']
+        self.assertEqual(len(pedidos), 1)
+        self.assertEqual([d.producto.nombre for d in pedidos[0].detalles.all()], ['Taza azul'])
+
+    def test_bajo_wsgi_se_reutiliza_el_usuario_sin_tocar_auser(self, _):
+        self.client.force_login(self.cliente)
+        response = self.client.get(reverse('mis_pedidos'))
+        self.assertEqual(len(response.context['pedidos']), 1)
+        request = response.wsgi_request
+        self.assertEqual(request._acached_user, self.cliente)
+        self.assertIs(request.auser.func, auser)
+
+
+class ApiCondicionalTests(TestCase):
+    def setUp(self):
+        self.categoria = Categoria.objects.create(nombre='Cocina')
+        self.productos = [
+            Producto.objects.create(nombre=f'Sartén {i}', precio=Decimal('20.00'), stock=i, categoria=self.categoria)
+            for i in range(3)
+        ]
+
+    def get(self, nombre='api_productos', args=None, **cabeceras):
+        return self.client.get(reverse(nombre, args=args), headers=cabeceras)
+
+    def test_304_sin_leer_los_productos(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        etag = response['ETag']
+
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.get(if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(len(consultas.captured_queries), 1)
+
+        response = self.get(if_modified_since=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_el_etag_cambia_con_los_datos(self):
+        etag = self.get()['ETag']
+        cambios = [
+            lambda: Producto.objects.filter(id=self.productos[0].id).update(precio=Decimal('25.00'),
+                                                                             actualizado=timezone.now()),
+            lambda: self.categoria.save(),
+            lambda: self.productos[2].delete(),
+        ]
+        for cambio in cambios:
+            cambio()
+            response = self.get(if_none_match=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+            etag = response['ETag']
+
+    def test_el_etag_depende_de_los_filtros(self):
+        todos = self.get()['ETag']
+        response = self.client.get(reverse('api_productos'), {'en_stock': '1'}, headers={'if_none_match': todos})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p['stock'] for p in response.json()['resultados']], [1, 2])
+
+    def test_producto_y_categorias(self):
+        for nombre, args in (('api_producto', [self.productos[0].id]), ('api_categorias', None)):
+            with self.subTest(nombre):
+                etag = self.get(nombre, args)['ETag']
+                self.assertEqual(self.get(nombre, args, if_none_match=etag).status_code, 304)
+        self.assertEqual(self.get('api_producto', [0]).status_code, 404)
+
+
+@override_settings(BASE_DATOS_LECTURA='lectura')
+class LecturaEscrituraTests(TransactionTestCase):
+    databases = {'default', 'lectura'}
+
+    def setUp(self):
+        admin = AdminUser.objects.create(username='admin', password=make_password('admin'))
+        session = self.client.session
+        session['admin_id'] = admin.id
+        session.save()
+        Categoria.objects.create(nombre='Réplica')
+
+    def test_vista_de_consulta_lee_de_la_replica(self):
+        with CaptureQueriesContext(connections['lectura']) as consultas:
+            response = self.client.get(reverse('categorias_list'))
+        self.assertContains(response, 'Réplica')
+        self.assertTrue(any('core_categoria' in c['sql'] for c in consultas.captured_queries))
+
+    def test_la_replica_no_admite_escrituras(self):
+        with self.assertRaises(OperationalError):
+            Categoria.objects.using('lectura').create(nombre='Prohibida')
+        self.assertFalse(Categoria.objects.filter(nombre='Prohibida').exists())
+
+
+@override_settings(
+    LOGIN_INTENTOS_POR_USUARIO=3,
+    LOGIN_INTENTOS_POR_IP=5,
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+@mock.patch('core.audit.registrar')
+class LimiteLoginTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.cliente = Cliente.objects.create(username='ana', email='ana@example.com',
+                                              password=make_password('correcta'))
+
+    def login(self, username='ana', password='incorrecta'):
+        return self.client.post(reverse('login_unificado'), {'username': username, 'password': password})
+
+    def test_bloqueado_antes_de_calcular_ningun_hash(self, _):
+        for _ in range(3):
+            self.assertEqual(self.login().status_code, 200)
+        with mock.patch.object(MD5PasswordHasher, 'encode', autospec=True) as encode:
+            response = self.login(password='correcta')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(int(response['Retry-After']), settings.LOGIN_BLOQUEO_SEGUNDOS)
+        encode.assert_not_called()
+
+    def test_limite_por_ip_con_usuarios_distintos(self, _):
+        for i in range(5):
+            self.login(username=f'usuario{i}')
+        self.assertEqual(self.login(username='otro').status_code, 429)
+        # Desde otra IP el usuario sigue pudiendo entrar.
+        response = self.client.post(reverse('login_unificado'), {'username': 'ana', 'password': 'correcta'},
+                                    REMOTE_ADDR='10.0.0.2')
+        self.assertRedirects(response, reverse('catalogo'), fetch_redirect_response=False)
+
+    def test_un_login_correcto_olvida_los_fallos_del_usuario(self, _):
+        self.login()
+        self.login()
+        self.assertEqual(self.login(password='correcta').status_code, 302)
+        self.login()
+        self.login()
+        self.assertEqual(self.login(password='correcta').status_code, 302)
+
+
+@override_settings(BASE_DATOS_LECTURA=None, CARRITO_BACKEND='core.cart_storage.CookieCarrito')
+class FacetasCatalogoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.categorias = [Categoria.objects.create(nombre=nombre) for nombre in ('Tazas', 'Platos', 'Vasos')]
+        Producto.objects.bulk_create([
+            Producto(nombre=f'{("Taza", "Plato", "Vaso")[i % 3]} {("azul", "rojo")[i % 2]} {i}',
+                     precio=Decimal(5 + i * 3), stock=i % 4, categoria=self.categorias[i % 3])
+            for i in range(24)
+        ])
+
+    def catalogo(self, **filtros):
+        return self.client.get(reverse('catalogo'), filtros)
+
+    def test_conteos_iguales_que_el_queryset_filtrado(self):
+        async def conteos(filtros):
+            await search.aindice_disponible(Producto.objects.db)
+            return await facets.aconteos(filtros)
+
+        for datos in ({}, {'precio_min': '20'}, {'precio_max': '50', 'en_stock': '1'},
+                      {'q': 'azul', 'en_stock': '1'}, {'categoria': str(self.categorias[0].id), 'precio_min': '1'}):
+            with self.subTest(datos=datos):
+                filtros = facets.Filtros(datos)
+                productos, _ = filtros.aplicar(Producto.objects.all(), categoria=False)
+                esperado = {c.id: productos.filter(categoria=c).count() for c in self.categorias}
+                self.assertEqual({id: n for id, _, n in async_to_sync(conteos)(filtros)}, esperado)
+                self.assertContains(self.catalogo(**datos), f'Todas las categorías ({sum(esperado.values())})')
+
+    @override_settings(CATALOGO_PAGE_SIZE=30)
+    def test_la_api_devuelve_lo_mismo_que_el_catalogo(self):
+        for datos in ({'en_stock': 'on', 'orden': '-precio'}, {'en_stock': 'true', 'precio_max': '40'},
+                      {'q': 'azul', 'orden': 'precio'}, {'categoria': str(self.categorias[1].id), 'en_stock': '1'}):
+            with self.subTest(datos=datos):
+                response = self.client.get(reverse('api_productos'), {**datos, 'campos': 'nombre'})
+                nombres = [p['nombre'] for p in response.json()['resultados']]
+                self.assertTrue(nombres)
+                html = self.catalogo(**datos).content.decode()
+                posiciones = [html.find(f'<td>{nombre}</td>') for nombre in nombres]
+                self.assertNotIn(-1, posiciones)
+                self.assertEqual(posiciones, sorted(posiciones))
+                self.assertEqual(html.count('class="add-to-cart"'), len(nombres))
+
+    def test_la_api_rechaza_filtros_no_validos(self):
+        for datos in ({'categoria': 'tazas'}, {'precio_min': '-1'}, {'en_stock': 'quizá'}, {'orden': 'nombre'}):
+            with self.subTest(datos=datos):
+                self.assertEqual(self.client.get(reverse('api_productos'), datos).status_code, 400)
+
+    @mock.patch('core.audit.registrar')
+    def test_confirmar_un_pedido_invalida_los_resultados_en_stock(self, _):
+        producto = Producto.objects.create(nombre='Jarra única', precio=Decimal('9.00'), stock=1,
+                                           categoria=self.categorias[0])
+        cliente = Cliente.objects.create(username='ana', email='ana@example.com', direccion='Calle 1')
+        self.client.force_login(cliente)
+        self.client.cookies[settings.CARRITO_COOKIE_NAME] = CookieCarrito.codificar({
+            'titular': 'ana', 'lineas': {str(producto.id): 1},
+        })
+        en_stock = Producto.objects.filter(stock__gt=0).count()
+        response = self.catalogo(en_stock='1')
+        self.assertContains(response, 'Jarra única')
+        self.assertContains(response, f'Todas las categorías ({en_stock})')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('confirmar_pedido'))
+        self.assertTemplateUsed(response, 'core/pedido_confirmado.html')
+        producto.refresh_from_db()
+        self.assertEqual(producto.stock, 0)
+
+        response = self.catalogo(en_stock='1')
+        self.assertNotContains(response, 'Jarra única')
+        self.assertContains(response, f'Todas las categorías ({en_stock - 1})')
+
+
+class ReservasConcurrentesTests(TransactionTestCase):
+    HILOS = 8
+    INTENTOS = 30
+
+    def setUp(self):
+        categoria = Categoria.objects.create(nombre='Reservas')
+        self.producto = Producto.objects.create(nombre='Concurrido', precio=Decimal('1.00'), stock=100,
+                                                categoria=categoria)
+
+    def test_reservas_concurrentes_sin_errores_ni_sobreventa(self):
+        errores, apartadas = [], []
+
+        def reservar(hilo):
+            try:
+                for i in range(self.INTENTOS):
+                    if not reservations.reservar(f'hilo{hilo}-{i}', {self.producto.id: 1}):
+                        apartadas.append(1)
+            except Exception as e:
+                errores.append(e)
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=reservar, args=(n,)) for n in range(self.HILOS)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(errores, [])
+        self.assertEqual(len(apartadas), self.producto.stock)
+        total = ReservaStock.objects.filter(producto=self.producto).aggregate(total=Sum('cantidad'))['total']
+        self.assertEqual(total, self.producto.stock)
+
+    @override_settings(RESERVA_STOCK_MAX_UNIDADES=10)
+    def test_una_reserva_no_aparta_todo_el_stock(self):
+        self.assertEqual(reservations.reservar('acaparador', {self.producto.id: 100}), [])
+        self.assertEqual(reservations.reservadas('acaparador'), {self.producto.id: 10})
+        # Los demás siguen pudiendo reservar lo que queda sin apartar.
+        self.assertEqual(reservations.reservar('otro', {self.producto.id: 90}), [])
+
+
+class EstadoPedidoTests(TestCase):
+    def setUp(self):
+        admin = AdminUser.objects.create(username='admin', password=make_password('admin'))
+        session = self.client.session
+        session['admin_id'] = admin.id
+        session.save()
+        self.pedido = Pedido.objects.create(nombre_cliente='ana', correo='ana@example.com', direccion='Calle',
+                                            total=Decimal('10.00'))
+
+    def conteos(self):
+        return dict(ConteoEstadoPedido.objects.values_list('estado', 'cantidad'))
+
+    def test_estado_desconocido_no_se_guarda(self):
+        sales.recalcular()
+        for datos in ({'estado': 'enviado'}, {}):
+            response = self.client.post(reverse('pedido_detalle', args=[self.pedido.id]), datos)
+            self.assertRedirects(response, reverse('pedido_detalle', args=[self.pedido.id]),
+                                 fetch_redirect_response=False)
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.estado, 'pendiente')
+        self.assertEqual(self.conteos(), {'pendiente': 1})
+
+    def test_cambio_de_estado_mueve_el_conteo(self):
+        sales.recalcular()
+        self.client.post(reverse('pedido_detalle', args=[self.pedido.id]), {'estado': 'finalizado'})
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.estado, 'finalizado')
+        self.assertEqual(self.conteos(), {'pendiente': 0, 'finalizado': 1})
+
+    def test_cambio_de_estado_sin_resumen_previo(self):
+        # Pedidos que el resumen no llegó a contar: no debe quedar ningún conteo negativo.
+        Pedido.objects.create(nombre_cliente='bea', correo='bea@example.com', direccion='Calle',
+                              total=Decimal('5.00'))
+        self.client.post(reverse('pedido_detalle', args=[self.pedido.id]), {'estado': 'finalizado'})
+        self.assertEqual(self.conteos(), {'pendiente': 1, 'finalizado': 1})
+        self.client.post(reverse('pedido_detalle', args=[self.pedido.id]), {'estado': 'en_proceso'})
+        self.assertEqual(self.conteos(), {'pendiente': 1, 'finalizado': 0, 'en_proceso': 1})
+
+
+@override_settings(PRODUCTO_MINIATURAS_ANCHOS=(100,))
+class ImportacionProductosTests(ImagenesTestMixin, TestCase):
+    def test_un_lote_rechazado_se_reintenta_fila_a_fila(self):
+        existente = Producto.objects.create(sku='A', nombre='Existente', precio=Decimal('1.00'), stock=1,
+                                            categoria=self.categoria)
+        imagenes = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, imagenes)
+        rechazada = _png(color='blue')
+        Path(imagenes, 'buena.png').write_bytes(_png(color='green'))
+        Path(imagenes, 'mala.png').write_bytes(rechazada)
+
+        generar_lote = images.generar_lote
+
+        def generar_lote_con_carrera(*args, **kwargs):
+            # Otra importación crea el sku C mientras se generan las miniaturas.
+            Producto.objects.create(sku='C', nombre='Concurrente', precio=Decimal('1.00'), stock=1,
+                                    categoria=self.categoria)
+            return generar_lote(*args, **kwargs)
+
+        with mock.patch('core.catalog_io.images.generar_lote', generar_lote_con_carrera):
+            resultado = catalog_io.importar([
+                (2, {'sku': 'B', 'nombre': 'Nuevo', 'precio': '3', 'categoria': 'Fotos', 'imagen': 'buena.png'}),
+                (3, {'sku': 'C', 'nombre': 'Rechazado', 'precio': '4', 'categoria': 'Fotos', 'imagen': 'mala.png'}),
+                (4, {'sku': 'A', 'precio': '2'}),
+            ], imagenes=imagenes)
+
+        self.assertEqual((resultado.creados, resultado.actualizados), (1, 1))
+        self.assertEqual([linea for linea, _ in resultado.errores], [3])
+        existente.refresh_from_db()
+        self.assertEqual(existente.precio, Decimal('2.00'))
+        self.assertEqual(Producto.objects.get(sku='C').nombre, 'Concurrente')
+        nuevo = Producto.objects.get(sku='B')
+        self.assertTrue(nuevo.imagen.storage.exists(nuevo.imagen.name))
+        # La imagen de la fila rechazada no se queda huérfana en el almacenamiento.
+        archivos = [f for _, _, nombres in os.walk(self.media) for f in nombres]
+        self.assertFalse([f for f in archivos if hashlib.sha256(rechazada).hexdigest() in f])
+
+
+@override_settings(BASE_DATOS_LECTURA=None)
+class ExportacionProductosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        categoria = Categoria.objects.create(nombre='Exportación')
+        # Más de un grupo de líneas (catalog_io.GRUPO) y algún sku vacío.
+        Producto.objects.bulk_create([
+            Producto(sku=f'SKU-{i}' if i % 7 else None, nombre=f'Producto {i}', precio=Decimal(i), stock=i,
+                     categoria=categoria)
+            for i in range(catalog_io.GRUPO + 50)
+        ])
+        cls.admin = AdminUser.objects.create(username='admin', password=make_password('admin'))
+
+    def test_exportacion_async_igual_que_la_sincrona(self):
+        async def recoger(formato):
+            return ''.join([trozo async for trozo in catalog_io.aexportar(formato, chunk_size=100)])
+
+        for formato in catalog_io.FORMATOS:
+            with self.subTest(formato=formato):
+                self.assertEqual(async_to_sync(recoger)(formato), ''.join(catalog_io.exportar(formato, chunk_size=100)))
+
+    async def test_vista_bajo_asgi_usa_el_iterador_async(self):
+        session = SessionStore()
+        session['admin_id'] = self.admin.id
+        await session.asave()
+        self.async_client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+        response = await self.async_client.get(reverse('productos_exportar'), {'formato': 'jsonl'})
+        self.assertTrue(response.is_async)
+        contenido = b''.join([trozo async for trozo in response.streaming_content])
+        self.assertEqual(contenido.count(b'\n'), catalog_io.GRUPO + 50)
+
+
+class ExportacionPedidosTests(TestCase):
+    def test_rango_fechas_acepta_date_y_texto(self):
+        inicio, fin = order_export.rango_fechas('2024-03-01', date(2024, 3, 31))
+        self.assertEqual(timezone.localtime(inicio).date(), date(2024, 3, 1))
+        self.assertEqual(timezone.localtime(fin).date(), date(2024, 4, 1))
+        self.assertEqual(order_export.rango_fechas('2024-02-30', ''), (None, None))
+
+    def test_textos_que_parecen_formulas(self):
+        categoria = Categoria.objects.create(nombre='Exportación')
+        producto = Producto.objects.create(nombre='@SUM(A1:A9)', precio=Decimal('1.00'), stock=1,
+                                           categoria=categoria)
+        pedido = Pedido.objects.create(nombre_cliente='=HYPERLINK("http://x","y")', correo='+34@example.com',
+                                       direccion='-1 Calle', total=Decimal('1.00'))
+        DetallePedido.objects.create(pedido=pedido, producto=producto, cantidad=1, subtotal=Decimal('1.00'))
+        tabulado = Producto.objects.create(nombre='\t=1+1', precio=Decimal('1.00'), stock=1, categoria=categoria)
+        DetallePedido.objects.create(pedido=pedido, producto=tabulado, cantidad=1, subtotal=Decimal('1.00'))
+
+        filas = list(csv.reader(''.join(order_export.filas_csv(order_export.pedidos())).splitlines()))
+        fila = dict(zip(filas[0], filas[1]))
+        self.assertEqual(fila['nombre_cliente'], '\'=HYPERLINK("http://x","y")')
+        self.assertEqual(fila['correo'], "'+34@example.com")
+        self.assertEqual(fila['direccion'], "'-1 Calle")
+        self.assertEqual(fila['producto'], "'@SUM(A1:A9)")
+        self.assertEqual(dict(zip(filas[0], filas[2]))['producto'], "'\t=1+1")
+        self.assertEqual(fila['total_pedido'], '1.00')
+
+
+class AsignarClientesPedidosTests(TestCase):
+    def setUp(self):
+        self.ana = Cliente.objects.create(username='ana', email='ana@example.com')
+        Cliente.objects.create(username='bea', email='bea@example.com')
+        datos = {'direccion': 'Calle', 'total': Decimal('1.00')}
+        self.pedidos = {
+            'coincide': Pedido.objects.create(nombre_cliente='ana', correo='ana@example.com', **datos),
+            'correo_sin_cliente': Pedido.objects.create(nombre_cliente='ana', correo='ana@otro.com', **datos),
+            'correo_de_otro': Pedido.objects.create(nombre_cliente='ana', correo='bea@example.com', **datos),
+            'solo_correo': Pedido.objects.create(nombre_cliente='borrado', correo='ana@example.com', **datos),
+        }
+
+    def test_el_correo_solo_confirma_el_username(self):
+        migracion = import_module('core.migrations.0018_pedido_cliente_backfill')
+        rellenos = {
+            'comando': lambda: call_command('asignar_clientes_pedidos', lote=2, stdout=io.StringIO()),
+            'migración': lambda: migracion.asignar_clientes(django_apps, connection.schema_editor()),
+        }
+        for nombre, rellenar in rellenos.items():
+            with self.subTest(nombre):
+                Pedido.objects.update(cliente=None)
+                rellenar()
+                self.assertEqual({k: Pedido.objects.get(id=p.id).cliente_id for k, p in self.pedidos.items()},
+                                 {'coincide': self.ana.id, 'correo_sin_cliente': self.ana.id,
+                                  'correo_de_otro': None, 'solo_correo': None})
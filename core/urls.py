@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     # Pagina principal
@@ -13,6 +13,11 @@ urlpatterns = [
     path('pedido/confirmar/', views.confirmar_pedido, name='confirmar_pedido'),
     path('mis-pedidos/', views.mis_pedidos, name='mis_pedidos'),
 
+    # API de solo lectura del catálogo
+    path('api/productos/', api.productos, name='api_productos'),
+    path('api/productos/<int:id>/', api.producto, name='api_producto'),
+    path('api/categorias/', api.categorias, name='api_categorias'),
+
     # Registro y login unificados
     path('registro/', views.registro_cliente, name='registro_cliente'),
     path('login/', views.login_unificado, name='login_unificado'),
@@ -20,6 +25,7 @@ urlpatterns = [
 
     # Panel del administrador
     path('panel/dashboard/', views.admin_dashboard, name='admin_dashboard'),
+    path('panel/metrics/', views.metricas, name='metricas'),
     path('panel/categorias/', views.categorias_list, name='categorias_list'),
     path('panel/categorias/nueva/', views.categoria_create, name='categoria_create'),
     path('panel/categorias/editar/<int:id>/', views.categoria_edit, name='categoria_edit'),
@@ -28,7 +34,10 @@ urlpatterns = [
     path('panel/productos/nuevo/', views.producto_create, name='producto_create'),
     path('panel/productos/editar/<int:id>/', views.producto_edit, name='producto_edit'),
     path('panel/productos/eliminar/<int:id>/', views.producto_delete, name='producto_delete'),
+    path('panel/productos/importar/', views.productos_importar, name='productos_importar'),
+    path('panel/productos/exportar/', views.productos_exportar, name='productos_exportar'),
     path('panel/pedidos/', views.pedidos_list, name='pedidos_list'),
+    path('panel/pedidos/exportar/', views.pedidos_exportar, name='pedidos_exportar'),
     path('panel/pedidos/<int:id>/', views.pedido_detalle, name='pedido_detalle'),
 
     # CLIENTE
@@ -36,6 +45,7 @@ urlpatterns = [
     
     # ADMIN CLIENTES
     path('panel/clientes/', views.clientes_list, name='clientes_list'),
+    path('panel/clientes/<int:id>/historial/', views.cliente_historial, name='cliente_historial'),
     path('panel/clientes/bloquear/<int:id>/', views.cliente_bloquear, name='cliente_bloquear'),
     path('panel/clientes/desbloquear/<int:id>/', views.cliente_desbloquear, name='cliente_desbloquear'),
 
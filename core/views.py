@@ -1,24 +1,46 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.db.models import Q
+from django.db.models import OuterRef, Q, Subquery
 from django.views.decorators.cache import never_cache
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import authenticate, login, logout, get_user_model
-from .models import AdminUser, Categoria, Producto, Pedido, DetallePedido, Cliente, HistorialCliente
+from .models import AdminUser, Categoria, Producto, Pedido, Cliente, HistorialCliente
 from .decorators import admin_required
+from .pagination import apaginar_keyset, paginar_keyset
+from . import search
+from . import catalog_cache
+from . import facets
+from . import cart
+from . import checkout
+from . import reservations
+from . import images
+from . import sales
+from . import audit
+from . import metrics
+from . import catalog_io
+from . import order_export
+from . import login_throttle
+from .db_router import solo_lectura
 
 from django.db import transaction
+import io
+import math
+from asgiref.sync import sync_to_async
 from django.views.decorators.csrf import csrf_protect
-from decimal import Decimal, InvalidOperation
 
 from django.views.decorators.http import require_POST
 
-from django.http import JsonResponse  
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 
-from collections import defaultdict
 
-from django.utils.functional import cached_property
+from django.utils.safestring import mark_safe
+
+from django.conf import settings
+from django.utils import timezone
+from django.template.loader import render_to_string
+from django.core.handlers.asgi import ASGIRequest
+from django.middleware.csrf import get_token
 
 
 User = get_user_model()
@@ -29,28 +51,81 @@ def home(request):
     return render(request, 'core/home.html')
 
 def _cart_count(request):
-    carrito = request.session.get('carrito', {})
-    return sum(int(q) for q in carrito.values())
+    return cart.contar(request.carrito.lineas)
+
+
+async def _tabla_productos(filtros, cursor, bloqueado):
+    if filtros.query:
+        await search.aindice_disponible(Producto.objects.db)
+    productos, orden = filtros.aplicar(Producto.objects.select_related('categoria'))
+    pagina = await apaginar_keyset(productos, orden, cursor, settings.CATALOGO_PAGE_SIZE)
+
+    return render_to_string('core/_catalogo_productos.html', {
+        'productos': pagina.items,
+        'pagina': pagina,
+        # Solo los filtros conocidos, para que los enlaces cacheados no arrastren otros parámetros
+        'filtros': filtros.querydict(),
+        'cursor': cursor,
+        'bloqueado': bloqueado,
+        'csrf_token': catalog_cache.CSRF_SENTINEL,
+    })
 
 
-def catalogo(request):
-    query = request.GET.get('q')
-    categoria_id = request.GET.get('categoria')
+async def _facetas(filtros):
+    if filtros.query:
+        await search.aindice_disponible(Producto.objects.db)
+    return await facets.aconteos(filtros)
 
-    productos = Producto.objects.all()
-    categorias = Categoria.objects.all()
 
-    if categoria_id:
-        productos = productos.filter(categoria_id=categoria_id)
-    if query:
-        productos = productos.filter(Q(nombre__icontains=query) | Q(descripcion__icontains=query))
+async def _opciones_categorias(filtros):
+    # Los conteos no dependen de la categoría elegida: se comparten entre sus fragmentos.
+    categorias = await catalog_cache.aobtener_fragmento(
+        'facetas', filtros.params_facetas(), filtros.versiones_facetas(), lambda: _facetas(filtros),
+        timeout=settings.CATALOGO_FACETAS_TIMEOUT,
+    )
+    return render_to_string('core/_catalogo_categorias.html', {
+        'categorias': categorias,
+        'total': sum(n for _, _, n in categorias),
+        'categoria_id': filtros.categoria_id,
+    })
+
 
+# Las vistas async (catálogo, carrito, mis pedidos) usan request.auser() y pasan
+# 'user' a la plantilla: el 'user' perezoso del context processor consultaría
+# la base de datos de forma síncrona.
+
+@solo_lectura
+async def catalogo(request):
+    filtros = facets.Filtros(request.GET)
+    cursor = request.GET.get('cursor')
+    user = await request.auser()
+    bloqueado = user.is_authenticated and getattr(user, 'bloqueado', False)
+
+    tabla = await catalog_cache.aobtener_fragmento(
+        'productos',
+        [*filtros.params(), cursor, bloqueado, settings.CATALOGO_PAGE_SIZE],
+        filtros.versiones(),
+        lambda: _tabla_productos(filtros, cursor, bloqueado),
+    )
+    opciones = await catalog_cache.aobtener_fragmento(
+        'categorias',
+        [*filtros.params_facetas(), filtros.categoria_id],
+        filtros.versiones_facetas(),
+        lambda: _opciones_categorias(filtros),
+        timeout=settings.CATALOGO_FACETAS_TIMEOUT,
+    )
+    if not bloqueado:
+        tabla = tabla.replace(catalog_cache.CSRF_SENTINEL, get_token(request))
+
+    await request.carrito.acargar()
     return render(request, 'core/catalogo.html', {
-        'productos': productos,
-        'categorias': categorias,
-        'categoria_id': categoria_id,
-        'query': query,
+        'tabla_productos': mark_safe(tabla),
+        'opciones_categorias': mark_safe(opciones),
+        'filtros': filtros,
+        'ordenes': [('', 'Relevancia' if filtros.query else 'Predeterminado'),
+                    ('precio', 'Precio: menor a mayor'), ('-precio', 'Precio: mayor a menor')],
         'cart_count': _cart_count(request),
+        'user': user,
     })
 
 
@@ -63,20 +138,35 @@ def login_unificado(request):
         username = (request.POST.get('username') or '').strip()
         password = (request.POST.get('password') or '').strip()
 
+        # Antes de calcular ningún hash (ver core.login_throttle)
+        espera = login_throttle.espera(request, username)
+        if espera:
+            messages.error(request, f'Demasiados intentos fallidos. Vuelve a intentarlo en {math.ceil(espera)} segundos.')
+            response = render(request, 'core/login.html', status=429)
+            response['Retry-After'] = str(math.ceil(espera))
+            return response
+
         user = authenticate(request, username=username, password=password)
         if user:
+            login_throttle.registrar_exito(request, username)
             if getattr(user, 'bloqueado', False):
                 messages.error(request, 'Tu cuenta está bloqueada. Contacta con el administrador.')
                 return redirect('login_unificado')
             login(request, user)
             request.session['cliente_id'] = user.id
+            audit.registrar(user.username, user.email, 'login')
             return redirect('catalogo')
 
-        admin = AdminUser.objects.filter(username=username).first()
-        if admin and admin.check_password(password):
-            request.session['admin_id'] = admin.id
-            return redirect('admin_dashboard')
+        # Si el usuario es un Cliente, su contraseña ya se comprobó: no se
+        # calcula un segundo hash contra AdminUser.
+        if not User.objects.filter(username=username).exists():
+            admin = AdminUser.objects.filter(username=username).first()
+            if admin and admin.check_password(password):
+                login_throttle.registrar_exito(request, username)
+                request.session['admin_id'] = admin.id
+                return redirect('admin_dashboard')
 
+        login_throttle.registrar_fallo(request, username)
         messages.error(request, 'Usuario o contraseña incorrectos.')
 
     return render(request, 'core/login.html')
@@ -138,6 +228,7 @@ def editar_perfil(request):
             user.direccion = direccion
             user.telefono = telefono
             user.save()
+            audit.registrar(user.username, user.email, 'perfil_editado')
             messages.success(request, 'Perfil actualizado correctamente.')
             return redirect('editar_perfil')
 
@@ -149,12 +240,19 @@ def editar_perfil(request):
 @admin_required
 @never_cache
 def admin_dashboard(request):
-    return render(request, 'core/admin_dashboard.html')
+    return render(request, 'core/admin_dashboard.html', sales.resumen())
+
+
+@admin_required
+@never_cache
+def metricas(request):
+    return HttpResponse(metrics.exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 
 # ----- CRUD Categorías -----
 
 @admin_required
+@solo_lectura
 def categorias_list(request):
     categorias = Categoria.objects.all()
     return render(request, 'core/categorias_list.html', {'categorias': categorias})
@@ -206,29 +304,35 @@ def categoria_delete(request, id):
 # ----- CLIENTES ADMIN -----
 
 @admin_required
+@solo_lectura
 def clientes_list(request):
-    clientes = Cliente.objects.all().order_by('username')
-    nombres = list(clientes.values_list('username', flat=True))
-    historial_qs = HistorialCliente.objects.filter(nombre__in=nombres).order_by('-fecha')
-    historial_por_cliente = defaultdict(list)
-    for h in historial_qs:
-        historial_por_cliente[h.nombre].append(h)
-    resumen = []
-    for c in clientes:
-        lst = historial_por_cliente.get(c.username, [])
-        last = lst[0] if lst else None
-        resumen.append({
-            'username': c.username,
-            'correo': c.email,
-            'accion': last.accion if last else '—',
-            'fecha': last.fecha if last else None,
-            'tiene_historial': bool(lst),
-        })
+    # Última acción de cada cliente resuelta en la base de datos (índice nombre, fecha)
+    ultima = HistorialCliente.objects.filter(nombre=OuterRef('username')).order_by('-fecha', '-id')
+    clientes = Cliente.objects.annotate(
+        ultima_accion=Subquery(ultima.values('accion')[:1]),
+        ultima_fecha=Subquery(ultima.values('fecha')[:1]),
+    )
+    pagina = paginar_keyset(clientes, ('username',), request.GET.get('cursor'), settings.CLIENTES_PAGE_SIZE)
 
     return render(request, 'core/clientes_list.html', {
-        'clientes': clientes,
-        'resumen': resumen,
-        'historial_por_cliente': historial_por_cliente,
+        'clientes': pagina.items,
+        'pagina': pagina,
+    })
+
+
+@admin_required
+@solo_lectura
+def cliente_historial(request, id):
+    cliente = get_object_or_404(Cliente, id=id)
+    historial = HistorialCliente.objects.filter(nombre=cliente.username)
+    pagina = paginar_keyset(historial, ('-fecha', '-id'), request.GET.get('cursor'), settings.HISTORIAL_PAGE_SIZE)
+    return JsonResponse({
+        'items': [
+            {'nombre': h.nombre, 'correo': h.correo, 'accion': h.accion,
+             'fecha': timezone.localtime(h.fecha).strftime('%d/%m/%Y %H:%M')}
+            for h in pagina
+        ],
+        'siguiente': pagina.siguiente,
     })
 
 
@@ -239,7 +343,7 @@ def cliente_bloquear(request, id):
     cliente = get_object_or_404(Cliente, id=id)
     cliente.bloqueado = True
     cliente.save()
-    HistorialCliente.objects.create(nombre=cliente.username, correo=cliente.email, accion='bloqueado')
+    audit.registrar(cliente.username, cliente.email, 'bloqueado', inmediato=True)
     messages.error(request, f'Cliente {cliente.username} bloqueado.')
     return redirect('clientes_list')
 
@@ -251,7 +355,7 @@ def cliente_desbloquear(request, id):
     cliente = get_object_or_404(Cliente, id=id)
     cliente.bloqueado = False
     cliente.save()
-    HistorialCliente.objects.create(nombre=cliente.username, correo=cliente.email, accion='desbloqueado')
+    audit.registrar(cliente.username, cliente.email, 'desbloqueado', inmediato=True)
     messages.success(request, f'Cliente {cliente.username} desbloqueado.')
     return redirect('clientes_list')
 
@@ -259,9 +363,17 @@ def cliente_desbloquear(request, id):
 
 # ------------------- PRODUCTOS -------------------
 
+def _generar_miniaturas(request, producto):
+    try:
+        images.actualizar_miniaturas(producto)
+    except (OSError, ValueError):
+        messages.warning(request, 'La imagen se guardó, pero no se pudieron generar sus miniaturas.')
+
+
 @admin_required
+@solo_lectura
 def productos_list(request):
-    productos = Producto.objects.all()
+    productos = Producto.objects.select_related('categoria')
     return render(request, 'core/productos_list.html', {'productos': productos})
 
 
@@ -290,7 +402,7 @@ def producto_create(request):
                 return render(request, 'core/producto_form.html', {'categorias': categorias})
 
             categoria = get_object_or_404(Categoria, id=categoria_id)
-            Producto.objects.create(
+            producto = Producto.objects.create(
                 nombre=nombre,
                 descripcion=descripcion,
                 precio=precio,
@@ -298,6 +410,8 @@ def producto_create(request):
                 categoria=categoria,
                 imagen=imagen
             )
+            if imagen:
+                _generar_miniaturas(request, producto)
             messages.success(request, 'Producto creado correctamente.')
             return redirect('productos_list')
     return render(request, 'core/producto_form.html', {'categorias': categorias})
@@ -324,6 +438,8 @@ def producto_edit(request, id):
         if request.FILES.get('imagen'):
             producto.imagen = request.FILES.get('imagen')
         producto.save()
+        if request.FILES.get('imagen'):
+            _generar_miniaturas(request, producto)
         messages.success(request, 'Producto actualizado correctamente.')
         return redirect('productos_list')
     return render(request, 'core/producto_form.html', {'producto': producto, 'categorias': categorias})
@@ -340,43 +456,111 @@ def producto_delete(request, id):
     return redirect('productos_list')
 
 
-# ------------------- PEDIDOS -------------------
+@admin_required
+@csrf_protect
+def productos_importar(request):
+    resultado = None
+    if request.method == 'POST':
+        archivo = request.FILES.get('archivo')
+        if not archivo:
+            messages.error(request, 'Selecciona un archivo CSV o JSON Lines.')
+        else:
+            # Las subidas grandes ya están en un temporal; se leen fila a fila.
+            formato = catalog_io.formato_de(archivo.name, request.POST.get('formato'))
+            texto = io.TextIOWrapper(archivo.file, encoding='utf-8-sig', newline='')
+            resultado = catalog_io.importar(catalog_io.leer(texto, formato))
+            if resultado.fallidos:
+                messages.error(request, f'Importación terminada con errores: {resultado}.')
+            else:
+                messages.success(request, f'Importación terminada: {resultado}.')
+    return render(request, 'core/productos_importar.html', {'resultado': resultado})
+
 
 @admin_required
-def pedidos_list(request):
-    pedidos = list(Pedido.objects.all().order_by('-fecha'))
+def productos_exportar(request):
+    formato = catalog_io.formato_de('', request.GET.get('formato'))
+    # Bajo ASGI hace falta un iterador async para no cargar la exportación entera en memoria.
+    trozos = catalog_io.aexportar(formato) if isinstance(request, ASGIRequest) else catalog_io.exportar(formato)
+    response = StreamingHttpResponse(trozos, content_type=catalog_io.FORMATOS[formato])
+    response['Content-Disposition'] = f'attachment; filename="productos.{formato}"'
+    return response
 
-    # Colecta identificadores presentes en la tabla de pedidos
-    usernames = {p.nombre_cliente for p in pedidos if p.nombre_cliente}
-    correos = {p.correo for p in pedidos if p.correo}
 
-    # Trae clientes que coincidan por username o email
-    clientes = Cliente.objects.filter(Q(username__in=usernames) | Q(email__in=correos)) \
-                              .values('username', 'email', 'bloqueado')
+# ------------------- PEDIDOS -------------------
 
-    # Índices para lookup rápido
-    block_by_user = {c['username']: c['bloqueado'] for c in clientes}
-    block_by_mail = {c['email']: c['bloqueado'] for c in clientes}
+@admin_required
+@solo_lectura
+def pedidos_list(request):
+    estado = request.GET.get('estado') or ''
+    cliente = (request.GET.get('cliente') or '').strip()
+    desde = request.GET.get('desde') or ''
+    hasta = request.GET.get('hasta') or ''
+
+    # Filtros sobre columnas indexadas: (estado, fecha), (nombre_cliente, fecha), (correo, fecha)
+    pedidos = Pedido.objects.select_related('cliente')
+    if estado:
+        pedidos = pedidos.filter(estado=estado)
+    if cliente:
+        cliente_id = Cliente.objects.filter(Q(username=cliente) | Q(email=cliente)).values_list('id', flat=True).first()
+        if cliente_id:
+            pedidos = pedidos.filter(cliente_id=cliente_id)
+        else:
+            # Pedidos de clientes ya borrados o aún sin asignar
+            pedidos = pedidos.filter(Q(nombre_cliente=cliente) | Q(correo=cliente))
+    inicio, fin = order_export.rango_fechas(desde, hasta)
+    if inicio:
+        pedidos = pedidos.filter(fecha__gte=inicio)
+    if fin:
+        pedidos = pedidos.filter(fecha__lt=fin)
+
+    pagina = paginar_keyset(pedidos, ('-fecha', '-id'), request.GET.get('cursor'), settings.PEDIDOS_PAGE_SIZE)
+
+    return render(request, 'core/pedidos_list.html', {
+        'pedidos': pagina.items,
+        'pagina': pagina,
+        'estados': Pedido.ESTADOS,
+        'estado': estado,
+        'cliente': cliente,
+        'desde': desde,
+        'hasta': hasta,
+    })
 
-    # Anexa flag al objeto pedido
-    for p in pedidos:
-        p.bloqueado = bool(block_by_user.get(p.nombre_cliente) or block_by_mail.get(p.correo))
+@admin_required
+def pedidos_exportar(request):
+    estado = request.GET.get('estado') or ''
+    desde = request.GET.get('desde') or ''
+    hasta = request.GET.get('hasta') or ''
+    pedidos = order_export.pedidos(
+        estado if estado in dict(Pedido.ESTADOS) else None,
+        *order_export.rango_fechas(desde, hasta),
+    )
+    # Bajo ASGI hace falta un iterador async para no cargar la exportación entera en memoria.
+    filas = order_export.afilas_csv(pedidos) if isinstance(request, ASGIRequest) else order_export.filas_csv(pedidos)
+    response = StreamingHttpResponse(filas, content_type='text/csv; charset=utf-8')
+    nombre = '_'.join(filter(None, ['pedidos', estado, desde, hasta]))
+    response['Content-Disposition'] = f'attachment; filename="{nombre}.csv"'
+    return response
 
-    return render(request, 'core/pedidos_list.html', {'pedidos': pedidos})
 
 @admin_required
 def pedido_detalle(request, id):
-    pedido = get_object_or_404(Pedido, id=id)
-    detalles = pedido.detalles.all()
+    pedido = get_object_or_404(Pedido.objects.select_related('cliente'), id=id)
+    detalles = pedido.detalles.select_related('producto')
 
     # Determina si el cliente está bloqueado
-    bloqueado = Cliente.objects.filter(
-        username=pedido.nombre_cliente
-    ).values_list('bloqueado', flat=True).first() or False
+    bloqueado = bool(pedido.cliente and pedido.cliente.bloqueado)
 
     if request.method == 'POST':
-        pedido.estado = request.POST.get('estado')
-        pedido.save()
+        estado = request.POST.get('estado')
+        # Un valor fuera de ESTADOS se guardaría tal cual y descuadraría ConteoEstadoPedido.
+        if estado not in dict(Pedido.ESTADOS):
+            messages.error(request, 'Estado no válido.')
+            return redirect('pedido_detalle', id=pedido.id)
+        with transaction.atomic():
+            anterior = pedido.estado
+            pedido.estado = estado
+            pedido.save()
+            sales.registrar_cambio_estado(anterior, pedido.estado)
         messages.success(request, 'Estado actualizado.')
         return redirect('pedidos_list')
 
@@ -390,11 +574,13 @@ def pedido_detalle(request, id):
 
 @require_POST
 @csrf_protect
-def agregar_al_carrito(request, id):
-    if request.user.is_authenticated and getattr(request.user, 'bloqueado', False):
+async def agregar_al_carrito(request, id):
+    user = await request.auser()
+    if user.is_authenticated and getattr(user, 'bloqueado', False):
         return JsonResponse({'ok': False, 'error': 'bloqueado'}, status=403)
-    
-    carrito = request.session.get('carrito', {})
+
+    await request.carrito.acargar()
+
     try:
         cantidad = int(request.POST.get('cantidad', 1))
         if cantidad < 1:
@@ -402,12 +588,23 @@ def agregar_al_carrito(request, id):
     except ValueError:
         cantidad = 1
 
-    key = str(id)
-    carrito[key] = carrito.get(key, 0) + cantidad
-    request.session['carrito'] = carrito
+    nueva = request.carrito.cantidad(id) + cantidad
+    es_ajax = request.headers.get('x-requested-with') == 'XMLHttpRequest' or request.headers.get('accept', '').find('application/json') != -1
+
+    # Aparta las unidades ahora para no descubrir la falta de stock al confirmar.
+    # Usa transacción y select_for_update, que el ORM async todavía no ofrece.
+    faltantes = await sync_to_async(reservations.reservar)(reservations.titular(request), {id: nueva})
+    if faltantes:
+        disponible = faltantes[0][1]
+        if es_ajax:
+            return JsonResponse({'ok': False, 'error': 'sin_stock', 'disponible': disponible}, status=409)
+        messages.error(request, f'Sin stock suficiente (disp: {disponible}, solicitado: {nueva}).')
+        return redirect('ver_carrito')
+
+    request.carrito.fijar(id, nueva)
     count = _cart_count(request)
 
-    if request.headers.get('x-requested-with') == 'XMLHttpRequest' or request.headers.get('accept', '').find('application/json') != -1:
+    if es_ajax:
         return JsonResponse({'ok': True, 'count': count})
 
     return redirect('ver_carrito')
@@ -416,25 +613,25 @@ def agregar_al_carrito(request, id):
 @require_POST
 @csrf_protect
 def eliminar_del_carrito(request, id):
-    carrito = request.session.get('carrito', {})
-    if str(id) in carrito:
-        del carrito[str(id)]
-        request.session['carrito'] = carrito
+    request.carrito.quitar(id)
+    reservations.liberar(reservations.titular(request), [id])
     return redirect('ver_carrito')
 
 
-def ver_carrito(request):
-    carrito = request.session.get('carrito', {})
-    productos = []
-    total = Decimal(0)
-
-    for id, cantidad in carrito.items():
-        producto = Producto.objects.get(id=id)
-        subtotal = producto.precio * cantidad
-        total += subtotal
-        productos.append({'id': producto.id, 'nombre': producto.nombre, 'precio': producto.precio, 'cantidad': cantidad, 'subtotal': subtotal})
+@solo_lectura
+async def ver_carrito(request):
+    user = await request.auser()
+    await request.carrito.acargar()
+    cotizado = await cart.acotizar(request.carrito.lineas)
+    if cart.limpiar_obsoletas(request.carrito, cotizado.obsoletas):
+        messages.error(request, 'Algunos productos ya no están disponibles y se quitaron del carrito.')
 
-    return render(request, 'core/carrito.html', {'productos': productos, 'total': total, 'cart_count': _cart_count(request)})
+    return render(request, 'core/carrito.html', {
+        'productos': cotizado.lineas,
+        'total': cotizado.total,
+        'cart_count': cotizado.cantidad_total,
+        'user': user,
+    })
 
 
 @login_required
@@ -444,57 +641,54 @@ def confirmar_pedido(request):
         messages.error(request, 'Tu cuenta está bloqueada. No puedes realizar pedidos.')
         return redirect('catalogo')
 
-    carrito = request.session.get('carrito', {})
+    carrito = request.carrito.lineas
     if not carrito:
         messages.error(request, 'Tu carrito está vacío.')
         return redirect('catalogo')
 
     if request.method == 'POST':
-        with transaction.atomic():
-            # Verificación previa de stock con bloqueo de fila
-            faltantes = []
-            productos_seleccionados = {}
-            for pid, cantidad in carrito.items():
-                prod = Producto.objects.select_for_update().get(id=pid)
-                if prod.stock < cantidad:
-                    faltantes.append((prod.nombre, prod.stock, cantidad))
-                productos_seleccionados[pid] = prod
-
-            if faltantes:
-                msg = 'Sin stock suficiente: ' + ', '.join([f'{n} (disp: {d}, solicitado: {c})' for n, d, c in faltantes])
-                messages.error(request, msg)
-                return redirect('ver_carrito')
-
-            cliente = request.user
-            pedido = Pedido.objects.create(
-                nombre_cliente=cliente.username,
-                correo=cliente.email,
-                direccion=cliente.direccion or 'Sin dirección',
-                total=Decimal('0')
-            )
-
-            total = Decimal('0')
-            for pid, cantidad in carrito.items():
-                prod = productos_seleccionados[pid]
-                subtotal = prod.precio * cantidad
-                total += subtotal
-                DetallePedido.objects.create(pedido=pedido, producto=prod, cantidad=cantidad, subtotal=subtotal)
-                prod.stock -= cantidad
-                prod.save()
-
-            pedido.total = total
-            pedido.save()
+        try:
+            pedido = checkout.procesar_pedido(request.user, carrito, reservations.titular(request))
+        except checkout.ProductosObsoletos as e:
+            cart.limpiar_obsoletas(request.carrito, e.ids)
+            messages.error(request, 'Algunos productos ya no están disponibles y se quitaron del carrito.')
+            return redirect('ver_carrito')
+        except checkout.CarritoVacio:
+            messages.error(request, 'Tu carrito está vacío.')
+            return redirect('catalogo')
+        except checkout.StockInsuficiente as e:
+            msg = 'Sin stock suficiente: ' + ', '.join([f'{n} (disp: {d}, solicitado: {c})' for n, d, c in e.faltantes])
+            messages.error(request, msg)
+            return redirect('ver_carrito')
 
-        request.session['carrito'] = {}
+        request.carrito.vaciar()
+        audit.registrar(request.user.username, request.user.email, f'pedido_confirmado #{pedido.id}')
         messages.success(request, 'Pedido confirmado correctamente.')
         return render(request, 'core/pedido_confirmado.html', {'pedido': pedido})
 
+    # Renueva las reservas mientras el cliente revisa la confirmación
+    faltantes = reservations.reservar(reservations.titular(request), cart.cantidades(carrito))
+    if faltantes:
+        msg = 'Sin stock suficiente: ' + ', '.join([f'{p.nombre} (disp: {d}, solicitado: {c})' for p, d, c in faltantes])
+        messages.error(request, msg)
+        return redirect('ver_carrito')
+
     return render(request, 'core/confirmar_pedido.html')
 
 
 @login_required
-def mis_pedidos(request):
-    pedidos = Pedido.objects.filter(nombre_cliente=request.user.username).order_by('-fecha')
-    return render(request, 'core/mis_pedidos.html', {'pedidos': pedidos, 'cart_count': _cart_count(request)})
+@solo_lectura
+async def mis_pedidos(request):
+    user = await request.auser()
+    pedidos = Pedido.objects.filter(cliente=user).prefetch_related('detalles__producto')
+    pagina = await apaginar_keyset(pedidos, ('-fecha', '-id'), request.GET.get('cursor'),
+                                   settings.MIS_PEDIDOS_PAGE_SIZE)
+    await request.carrito.acargar()
+    return render(request, 'core/mis_pedidos.html', {
+        'pedidos': pagina.items,
+        'pagina': pagina,
+        'cart_count': _cart_count(request),
+        'user': user,
+    })
 
 